@@ -0,0 +1,88 @@
+"""
+Benchmark of the classic MovieGenreKeywords steps with the default JSON protocol and with interned word ids.
+
+Each step is run in the current process through the job's own mapper/combiner/reducer entry points, so the bytes
+written between the tasks are exactly those a runner would shuffle; the lines are sorted by key between tasks,
+like the inline runner does.
+
+Usage: python bench_keywords.py movies.csv --vocab vocab.txt [--token-cache movies.csv.tokens.gz] [--repeat 3]
+"""
+import argparse
+import time
+from io import BytesIO
+
+from task1 import MovieGenreKeywords
+
+
+def sort_lines(data):
+	"""
+	Function that sorts the lines written by a task by key, keeping the order of the lines with the same key.
+	:param data: bytes written by the task
+	:return: the sorted bytes
+	"""
+	lines = data.splitlines(True)
+	lines.sort(key=lambda line: line.split(b'\t', 1)[0])
+	return b''.join(lines)
+
+
+def run_task(job_args, step_num, task_type, data):
+	"""
+	Function that runs one task of the job on some input.
+	:param job_args: command-line arguments of the job
+	:param step_num: the step of the task
+	:param task_type: 'mapper', 'combiner' or 'reducer'
+	:param data: the input of the task
+	:return: the bytes written by the task
+	"""
+	job = MovieGenreKeywords(args=list(job_args) + ['--step-num=%d' % step_num, '--%s' % task_type])
+	output = BytesIO()
+	job.sandbox(stdin=BytesIO(data), stdout=output)
+	job.execute()
+	return output.getvalue()
+
+
+def run_pipeline(input_path, job_args):
+	"""
+	Function that runs all the steps of the job and measures the data written between the tasks.
+	:param input_path: path of the movies file
+	:param job_args: command-line arguments of the job
+	:return: (output, mapper_bytes, shuffled_bytes, seconds); shuffled_bytes counts what leaves the combiners
+	"""
+	start = time.perf_counter()
+	with open(input_path, 'rb') as f:
+		data = f.read()
+
+	mapper_bytes = 0
+	shuffled_bytes = 0
+	steps = MovieGenreKeywords(args=list(job_args))._steps_desc()
+	for step_num, step in enumerate(steps):
+		data = run_task(job_args, step_num, 'mapper', data)
+		mapper_bytes += len(data)
+		if step.get('combiner'):
+			data = run_task(job_args, step_num, 'combiner', sort_lines(data))
+		shuffled_bytes += len(data)
+		data = run_task(job_args, step_num, 'reducer', sort_lines(data))
+
+	return data, mapper_bytes, shuffled_bytes, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Compare the JSON and interned protocols of MovieGenreKeywords.')
+	parser.add_argument('input', help='movies file')
+	parser.add_argument('--vocab', required=True, help='vocabulary built by vocabulary.py')
+	parser.add_argument('--token-cache', help='token cache built by token_cache.py, to leave NLTK out of the timing')
+	parser.add_argument('--repeat', type=int, default=3, help='number of runs of each variant; the best is kept')
+	args = parser.parse_args()
+
+	base_args = ['--token-cache', args.token_cache] if args.token_cache else []
+	variants = [('json', base_args), ('interned', base_args + ['--vocab', args.vocab])]
+
+	outputs = []
+	print('%-10s %15s %15s %10s' % ('protocol', 'mapper bytes', 'shuffled bytes', 'seconds'))
+	for name, job_args in variants:
+		runs = [run_pipeline(args.input, job_args) for _ in range(args.repeat)]
+		output, mapper_bytes, shuffled_bytes, _ = runs[0]
+		outputs.append(output)
+		print('%-10s %15d %15d %10.3f' % (name, mapper_bytes, shuffled_bytes, min(run[3] for run in runs)))
+
+	print('same output: %s' % (outputs[0] == outputs[1]))
@@ -0,0 +1,70 @@
+"""
+Benchmark of the two KNN backends of KNNMapReduce's mapper_2: the brute-force NumPy scan of knn_distance and the
+KD-tree of kdtree, on random feature sets with as many features as Iris_normalized.csv.
+
+For each number of labeled rows, both backends answer the same queries; the tree is rebuilt in every run, like it is
+in every call of mapper_2, so its build time is part of the measure. The smallest size from which the KD-tree is
+faster is reported as the crossover.
+
+Usage: python bench_knn.py [--sizes 1000 10000 100000 1000000] [--queries 1000] [--k 15] [--leaf-size 32]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from kdtree import KDTree, kdtree_neighbours
+from knn_distance import nearest_neighbours
+
+
+def run_backend(neighbours, queries, labeled, k):
+	"""
+	Function that answers all the queries with one backend.
+	:param neighbours: nearest_neighbours or a function with the same interface
+	:param queries: float array of shape (q, n)
+	:param labeled: float array of shape (l, n)
+	:param k: number of neighbours
+	:return: (list of the distance arrays, seconds)
+	"""
+	start = time.perf_counter()
+	distances = [d for _, d, _ in neighbours(queries, labeled, k)]
+	return distances, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Compare the brute-force and KD-tree backends of KNNMapReduce.')
+	parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000],
+						help='numbers of labeled rows')
+	parser.add_argument('--queries', type=int, default=1000, help='number of unlabeled rows')
+	parser.add_argument('--features', type=int, default=4, help='number of features per row')
+	parser.add_argument('--k', type=int, default=15, help='number of neighbours')
+	parser.add_argument('--leaf-size', type=int, default=32, help='maximum number of rows in a leaf of the KD-tree')
+	parser.add_argument('--seed', type=int, default=0, help='seed of the random rows')
+	args = parser.parse_args()
+
+	rng = np.random.default_rng(args.seed)
+	queries = rng.random((args.queries, args.features))
+
+	def kdtree_backend(q, labeled, k):
+		return kdtree_neighbours(q, labeled, k, args.leaf_size)
+
+	crossover = None
+	print('%10s %12s %12s %12s %8s' % ('labeled', 'brute s', 'build s', 'kdtree s', 'same'))
+	for size in args.sizes:
+		labeled = rng.random((size, args.features))
+		brute, brute_seconds = run_backend(nearest_neighbours, queries, labeled, args.k)
+		tree, tree_seconds = run_backend(kdtree_backend, queries, labeled, args.k)
+
+		start = time.perf_counter()
+		KDTree(labeled, args.leaf_size)
+		build_seconds = time.perf_counter() - start
+
+		same = all(np.allclose(a, b) for a, b in zip(brute, tree))
+		print('%10d %12.3f %12.3f %12.3f %8s' % (size, brute_seconds, build_seconds, tree_seconds, same))
+		if crossover is None and tree_seconds < brute_seconds:
+			crossover = size
+
+	if crossover is None:
+		print('the KD-tree was never faster')
+	else:
+		print('the KD-tree is faster from %d labeled rows' % crossover)
@@ -0,0 +1,174 @@
+"""
+Fast reader of the edge lists of task2.py (web-Google.txt and its .gz form), which parses whole chunks of bytes with
+NumPy instead of one line at a time with a regular expression.
+
+An edge list has one 'from_id<tab>to_id' edge per line, and comment lines starting with '#'. The file is split into
+byte ranges; a line belongs to the range where it starts, so every line is read by exactly one range whatever the
+ranges are. A range file lists one range per line, as 'path start stop', and is the input of InvertWebLink --edges, so
+each mapper gets some of the ranges. A gzip file cannot be read from the middle, so it is decompressed once, next to
+the range file, before being split.
+
+The paths of the range file are absolute, so the ranges can be read by the tasks of the local runners.
+
+Usage: python edge_list.py web-Google.txt.gz web-Google.ranges [--split-bytes 8388608]
+"""
+import argparse
+import gzip
+import os
+import shutil
+import tempfile
+import warnings
+
+import numpy as np
+
+from job_rerun import rerun_with_args
+
+SPLIT_BYTES = 8 * 1024 * 1024
+CHUNK_BYTES = 4 * 1024 * 1024
+# the bytes numpy.fromstring splits the numbers on
+WHITESPACE = np.zeros(256, dtype=bool)
+WHITESPACE[list(b' \t\n\r\v\f')] = True
+
+
+def count_tokens(chunk):
+	"""
+	Function that counts the whitespace-separated tokens of some bytes.
+	:param chunk: bytes
+	:return: the number of tokens
+	"""
+	space = WHITESPACE[np.frombuffer(chunk, dtype=np.uint8)]
+	# a token starts at every non-space byte that follows a space, or at the first byte
+	return int(np.count_nonzero(~space[1:] & space[:-1])) + int(not space[0]) if len(space) else 0
+
+
+def parse_edges(chunk):
+	"""
+	Function that parses complete lines of an edge list.
+	:param chunk: bytes with whole lines of the file
+	:return: (sources, targets), int64 arrays with the IDs of the pages linking and linked to
+	"""
+	if chunk.startswith(b'#') or b'\n#' in chunk:
+		chunk = b'\n'.join(line for line in chunk.split(b'\n') if not line.startswith(b'#'))
+	num_tokens = count_tokens(chunk)
+	ids = np.empty(0, dtype=np.int64)
+	if num_tokens:
+		# in text mode, fromstring splits the numbers on any whitespace, so tabs and '\r\n' are fine; depending on the
+		# version of NumPy, it stops at the first token that is not a number, with or without a warning or an error,
+		# so the number of values is checked against the number of tokens
+		with warnings.catch_warnings():
+			warnings.simplefilter('ignore', DeprecationWarning)
+			try:
+				ids = np.fromstring(chunk, dtype=np.int64, sep=' ')
+			except ValueError:
+				pass
+	if len(ids) != num_tokens:
+		raise ValueError('an edge list line has a token that is not a page ID')
+	if len(ids) % 2:
+		raise ValueError('an edge list line does not have two IDs')
+	return ids[0::2], ids[1::2]
+
+
+def read_range(path, start, stop, chunk_bytes=CHUNK_BYTES):
+	"""
+	Function that reads the lines of a file that start in a byte range, in chunks of whole lines.
+	:param path: path of the (uncompressed) file
+	:param start: position of the first byte of the range
+	:param stop: position after the last byte of the range
+	:param chunk_bytes: number of bytes read at once
+	:return: generator of bytes with whole lines
+	"""
+	with open(path, 'rb') as f:
+		if start:
+			# the line going over start belongs to the previous range
+			f.seek(start - 1)
+			f.readline()
+		# the last line of the previous chunk, which may go on in the next one, and its position in the file
+		pending, pending_start = b'', f.tell()
+		while pending_start < stop:
+			data = f.read(chunk_bytes)
+			if not data:
+				if pending:
+					yield pending
+				return
+			buffer = pending + data
+			end = buffer.rfind(b'\n')
+			if end < 0:
+				pending = buffer
+				continue
+			limit = stop - pending_start
+			if limit <= end:
+				# the range ends with the line going over its last byte
+				yield buffer[:buffer.index(b'\n', limit - 1) + 1]
+				return
+			yield buffer[:end + 1]
+			pending, pending_start = buffer[end + 1:], pending_start + end + 1
+
+
+def byte_ranges(path, split_bytes=SPLIT_BYTES):
+	"""
+	Function that splits a file into byte ranges.
+	:param path: path of the (uncompressed) file
+	:param split_bytes: number of bytes per range
+	:return: list of (start, stop)
+	"""
+	size = os.path.getsize(path)
+	split_bytes = max(1, split_bytes)
+	return [(start, min(start + split_bytes, size)) for start in range(0, size, split_bytes)]
+
+
+def write_range_file(paths, range_path, split_bytes=SPLIT_BYTES):
+	"""
+	Function that writes the range file of some edge lists; the .gz files are decompressed next to the range file.
+	:param paths: paths of the edge lists
+	:param range_path: path of the range file
+	:param split_bytes: number of bytes per range
+	:return: the number of ranges
+	"""
+	num_ranges = 0
+	with open(range_path, 'w') as out:
+		for i, path in enumerate(paths):
+			if path.endswith('.gz'):
+				decompressed = os.path.join(os.path.dirname(os.path.abspath(range_path)),
+											'%d_%s' % (i, os.path.basename(path)[:-len('.gz')]))
+				with gzip.open(path, 'rb') as f, open(decompressed, 'wb') as copy:
+					shutil.copyfileobj(f, copy, CHUNK_BYTES)
+				path = decompressed
+			path = os.path.abspath(path)
+			for start, stop in byte_ranges(path, split_bytes):
+				out.write('%s %d %d\n' % (path, start, stop))
+				num_ranges += 1
+	return num_ranges
+
+
+def parse_range_line(line):
+	"""
+	Function that reads a line of a range file; the path may contain spaces.
+	:param line: 'path start stop'
+	:return: (path, start, stop)
+	"""
+	path, start, stop = line.rstrip('\r\n').rsplit(' ', 2)
+	return path, int(start), int(stop)
+
+
+def run_with_range_file(job):
+	"""
+	Function that runs a job reading edge lists, which was started without a range file: the range file of its
+	--edges is written into a temporary directory, with --split-bytes bytes per range, and the job is run again with it.
+	:param job: the job, in the driver process
+	"""
+	tmp_dir = tempfile.mkdtemp()
+	try:
+		range_path = os.path.join(tmp_dir, 'ranges.txt')
+		write_range_file(job.options.edges, range_path, job.options.split_bytes)
+		rerun_with_args(job, [range_path])
+	finally:
+		shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Write the range file of some edge lists.')
+	parser.add_argument('edges', nargs='+', help='edge lists (.txt or .gz)')
+	parser.add_argument('ranges', help='range file')
+	parser.add_argument('--split-bytes', type=int, default=SPLIT_BYTES, help='number of bytes per range')
+	args = parser.parse_args()
+	print(write_range_file(args.edges, args.ranges, args.split_bytes))
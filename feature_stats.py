@@ -0,0 +1,194 @@
+"""
+Per-column statistics of the feature values of a KNN input, and the scaling the KNN jobs apply with them.
+
+The statistics are computed in a single streaming pass, in constant memory, so the input does not need to fit in
+RAM: the maximum absolute value, the minimum and maximum, and the mean and standard deviation (with Welford's
+algorithm) of every feature column. They are stored as JSON next to the input, together with the SHA-256 of the
+input they were computed from, so a later run over the same input skips the pass.
+
+The KNN mappers scale the feature values on the fly, instead of reading a rewritten, normalized copy of the input:
+- max-abs: x / max(|x|), which is what the pandas preprocessing of Iris_normalized.csv did
+- min-max: (x - min) / (max - min)
+- z-score: (x - mean) / std, with the sample standard deviation like pandas
+
+Usage: python feature_stats.py Iris.csv [stats_path]
+"""
+import hashlib
+import json
+import math
+import sys
+
+import numpy as np
+
+SCALINGS = ['none', 'max-abs', 'min-max', 'z-score']
+
+
+def default_stats_path(input_path):
+	"""
+	Function that returns the path the statistics of an input file are stored at by default.
+	:param input_path: path of the CSV file
+	:return: path of the statistics file
+	"""
+	return input_path + '.stats.json'
+
+
+class ColumnStats:
+	"""
+	Running statistics of a set of feature columns, updated one row at a time.
+	"""
+
+	def __init__(self, columns):
+		"""
+		:param columns: names of the feature columns
+		"""
+		self.columns = columns
+		self.count = 0
+		self.max_abs = [0.0] * len(columns)
+		self.min = [math.inf] * len(columns)
+		self.max = [-math.inf] * len(columns)
+		self.mean = [0.0] * len(columns)
+		# sum of the squared differences from the current mean, as in Welford's algorithm
+		self.m2 = [0.0] * len(columns)
+
+	def update(self, values):
+		"""
+		Function that adds the feature values of one row.
+		:param values: list of floats, one per column
+		"""
+		self.count += 1
+		for i, value in enumerate(values):
+			self.max_abs[i] = max(self.max_abs[i], abs(value))
+			self.min[i] = min(self.min[i], value)
+			self.max[i] = max(self.max[i], value)
+			delta = value - self.mean[i]
+			self.mean[i] += delta / self.count
+			self.m2[i] += delta * (value - self.mean[i])
+
+	def to_dict(self):
+		"""
+		Function that returns the statistics in the form they are stored in.
+		:return: dictionary of lists, one value per column
+		"""
+		std = [math.sqrt(m2 / (self.count - 1)) if self.count > 1 else 0.0 for m2 in self.m2]
+		return {'columns': self.columns, 'count': self.count, 'max_abs': self.max_abs, 'min': self.min,
+				'max': self.max, 'mean': self.mean, 'std': std}
+
+
+def compute_stats(input_paths):
+	"""
+	Function that reads one or more KNN input files once and computes the statistics of their feature columns; the
+	header line gives the names of the columns, and every row with a numeric id counts, labeled or not.
+	:param input_paths: list of paths of the CSV files
+	:return: the statistics, as returned by ColumnStats.to_dict, with the SHA-256 of the inputs under 'sha256'
+	"""
+	digest = hashlib.sha256()
+	stats = None
+	for path in input_paths:
+		with open(path, 'rb') as f:
+			for raw_line in f:
+				digest.update(raw_line)
+				fields = raw_line.decode('utf-8').rstrip('\r\n').split(',')
+				if not fields[0].isnumeric():
+					if stats is None and len(fields) > 2:
+						stats = ColumnStats(fields[1:-1])
+					continue
+				if stats is None:
+					stats = ColumnStats(['feature_%d' % i for i in range(1, len(fields) - 1)])
+				stats.update([float(value) for value in fields[1:-1]])
+
+	result = (stats or ColumnStats([])).to_dict()
+	result['sha256'] = digest.hexdigest()
+	return result
+
+
+def write_stats(stats, stats_path):
+	"""
+	Function that writes statistics to a file.
+	:param stats: the statistics, as returned by compute_stats
+	:param stats_path: path of the statistics file
+	"""
+	with open(stats_path, 'w') as out:
+		json.dump(stats, out, indent=1)
+
+
+def load_stats(stats_path):
+	"""
+	Function that reads a statistics file.
+	:param stats_path: path of the statistics file
+	:return: the statistics, as returned by compute_stats
+	"""
+	with open(stats_path) as f:
+		return json.load(f)
+
+
+def cached_stats(input_paths, stats_path=None):
+	"""
+	Function that returns the path of up-to-date statistics for some inputs, computing them only if the cached ones
+	are missing or were computed from different contents.
+	:param input_paths: list of paths of the CSV files
+	:param stats_path: path of the statistics file; by default, the first input path followed by '.stats.json'
+	:return: the path of the statistics file
+	"""
+	# the hash is only needed to check the cache, so it is imported here and the jobs do not depend on token_cache
+	from token_cache import file_hash
+
+	stats_path = stats_path or default_stats_path(input_paths[0])
+	try:
+		if load_stats(stats_path).get('sha256') == file_hash(input_paths):
+			return stats_path
+	except (OSError, ValueError):
+		pass
+
+	write_stats(compute_stats(input_paths), stats_path)
+	return stats_path
+
+
+def scaling_arrays(stats, scaling):
+	"""
+	Function that turns statistics into the (offset, scale) arrays of a scaling, so that the scaled value of x is
+	(x - offset) / scale; the columns whose scale would be 0 are only shifted.
+	:param stats: the statistics, as returned by compute_stats
+	:param scaling: one of SCALINGS
+	:return: (offset, scale), float arrays with one value per column
+	"""
+	if scaling == 'max-abs':
+		offset, scale = np.zeros(len(stats['columns'])), np.array(stats['max_abs'], dtype=np.float64)
+	elif scaling == 'min-max':
+		offset = np.array(stats['min'], dtype=np.float64)
+		scale = np.array(stats['max'], dtype=np.float64) - offset
+	elif scaling == 'z-score':
+		offset, scale = np.array(stats['mean'], dtype=np.float64), np.array(stats['std'], dtype=np.float64)
+	else:
+		raise ValueError('unknown scaling %r' % scaling)
+	scale[scale == 0] = 1.0
+	return offset, scale
+
+
+class Scaler:
+	"""
+	Scaling of the feature arrays of the KNN jobs, read from a statistics file.
+	"""
+
+	def __init__(self, stats_path=None, scaling='none'):
+		"""
+		:param stats_path: path of the statistics file; not needed when scaling is 'none'
+		:param scaling: one of SCALINGS
+		"""
+		self.scaling = scaling
+		if scaling != 'none':
+			self.offset, self.scale = scaling_arrays(load_stats(stats_path), scaling)
+
+	def transform(self, features):
+		"""
+		Function that scales an array of feature values.
+		:param features: float array of shape (rows, columns)
+		:return: the scaled array; the same array when scaling is 'none'
+		"""
+		if self.scaling == 'none' or not features.size:
+			return features
+		return (features - self.offset) / self.scale
+
+
+if __name__ == '__main__':
+	path = cached_stats(sys.argv[1:2], sys.argv[2] if len(sys.argv) > 2 else None)
+	print(json.dumps(load_stats(path), indent=1))
@@ -0,0 +1,243 @@
+"""
+Binary store of the labeled rows of a KNN input, so that the KNN jobs read the labeled feature values from a
+memory-mapped matrix instead of passing them between the steps as JSON lists of strings and parsing them again.
+
+A store is a single file, so it can be uploaded with the jobs like any other file:
+- the magic bytes KNNSTORE, then the length of the header as a little-endian 64-bit integer;
+- the header, a JSON object with the dtype of the features ('float32' or 'float64'), the number of rows, the names
+  of the feature columns, the labels, the label offsets and the path, size, modification time and SHA-256 of the
+  CSV file it was built from; it is padded with spaces so the arrays start on a 64-byte boundary;
+- the feature values, a contiguous (rows, columns) matrix in the dtype of the header;
+- the label codes, int32, an index in the list of labels for every row (the labels are sorted, so the codes sort
+  like the labels they stand for);
+- the ids of the rows, int64.
+Every array starts on a 64-byte boundary. The arrays are read with numpy.memmap, so the mappers that read the same
+store on a machine share its pages.
+
+The rows are grouped by label, in the order of the input within a label: the rows of the i-th label are at positions
+label_offsets[i]:label_offsets[i + 1]. The store is written in two passes over the CSV file, the first one only
+counting the rows of each label, so it does not need to fit in memory.
+
+The jobs refuse a store that was built from another CSV file than their input, or whose CSV file has changed since
+it was built (see check_store), since its rows would no longer be those of the input. The CSV file is only hashed
+again when its size or modification time changed, so an unchanged input is not read twice.
+
+Usage: python feature_store.py Iris_normalized.csv Iris_normalized.knn [--dtype float32]
+"""
+import argparse
+import json
+import os
+import struct
+
+import numpy as np
+
+from knn_queries import is_query_row
+
+MAGIC = b'KNNSTORE'
+ALIGNMENT = 64
+
+
+def aligned(size):
+	"""
+	Function that rounds a size in bytes up to the alignment of the arrays.
+	:param size: number of bytes
+	:return: the smallest multiple of ALIGNMENT that is at least size
+	"""
+	return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def labeled_rows(input_path):
+	"""
+	Function that reads the labeled rows of a KNN input.
+	:param input_path: path of the CSV file
+	:return: generator of the split labeled lines
+	"""
+	with open(input_path) as f:
+		for line in f:
+			aux = line.rstrip('\r\n').split(',')
+			if aux[0].isnumeric() and not is_query_row(aux):
+				yield aux
+
+
+def array_layout(header, data_start):
+	"""
+	Function that computes where each array of a store starts.
+	:param header: the header of the store
+	:param data_start: position of the first array, right after the header
+	:return: list of (name, dtype, shape, offset)
+	"""
+	rows, num_columns = header['rows'], len(header['columns'])
+	layout = []
+	offset = data_start
+	for name, dtype, shape in [('features', np.dtype(header['dtype']), (rows, num_columns)),
+							   ('codes', np.dtype('<i4'), (rows,)), ('ids', np.dtype('<i8'), (rows,))]:
+		layout.append((name, dtype, shape, offset))
+		offset += aligned(int(np.prod(shape)) * dtype.itemsize)
+	return layout
+
+
+def build_store(input_path, store_path, dtype='float64', chunk_size=65536):
+	"""
+	Function that writes the store of the labeled rows of a KNN input.
+	:param input_path: path of the CSV file
+	:param store_path: path of the store
+	:param dtype: 'float32' or 'float64'
+	:param chunk_size: number of rows converted at once in the second pass
+	:return: the number of labeled rows
+	"""
+	with open(input_path) as f:
+		columns = f.readline().rstrip('\r\n').split(',')[1:-1]
+	counts = {}
+	for aux in labeled_rows(input_path):
+		counts[aux[-1]] = counts.get(aux[-1], 0) + 1
+	labels = sorted(counts)
+	codes = {label: code for code, label in enumerate(labels)}
+	label_offsets = [0]
+	for label in labels:
+		label_offsets.append(label_offsets[-1] + counts[label])
+	rows = label_offsets[-1]
+
+	# the hash is only needed to check the store, so it is imported here and the jobs do not depend on token_cache
+	from token_cache import file_hash
+
+	# the size and modification time are read before the hash, so a change made while hashing is seen by check_store
+	stat = os.stat(input_path)
+	header = {'dtype': np.dtype(dtype).name, 'rows': rows, 'columns': columns, 'labels': labels,
+			  'label_offsets': label_offsets,
+			  'source': {'path': os.path.abspath(input_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+						 'sha256': file_hash([input_path])}}
+	encoded = json.dumps(header).encode('utf-8')
+	data_start = aligned(len(MAGIC) + 8 + len(encoded))
+	encoded = encoded.ljust(data_start - len(MAGIC) - 8)
+	layout = array_layout(header, data_start)
+
+	with open(store_path, 'wb') as out:
+		out.write(MAGIC + struct.pack('<Q', len(encoded)) + encoded)
+		out.truncate(layout[-1][3] + aligned(rows * 8))
+
+	if rows:
+		arrays = {name: np.memmap(store_path, dtype, 'r+', offset, shape) for name, dtype, shape, offset in layout}
+		# the next free position of each label
+		positions = label_offsets[:-1]
+		chunk = []
+		for aux in labeled_rows(input_path):
+			chunk.append(aux)
+			if len(chunk) == chunk_size:
+				write_chunk(arrays, positions, chunk, codes)
+				chunk = []
+		write_chunk(arrays, positions, chunk, codes)
+		for array in arrays.values():
+			array.flush()
+	return rows
+
+
+def write_chunk(arrays, positions, chunk, codes):
+	"""
+	Function that writes labeled rows to the arrays of a store, each one at the next free position of its label.
+	:param arrays: the memory-mapped arrays, by name
+	:param positions: list with the next free position of each label, updated in place
+	:param chunk: list of split labeled lines
+	:param codes: dictionary of {label: code}
+	"""
+	if not chunk:
+		return
+	chunk_codes = [codes[aux[-1]] for aux in chunk]
+	targets = []
+	for code in chunk_codes:
+		targets.append(positions[code])
+		positions[code] += 1
+	arrays['features'][targets] = np.array([aux[1:-1] for aux in chunk], dtype=np.float64)
+	arrays['codes'][targets] = chunk_codes
+	arrays['ids'][targets] = [int(aux[0]) for aux in chunk]
+
+
+def is_source(input_path, source_path):
+	"""
+	Function that checks whether an input of a job is the CSV file a store was built from.
+	:param input_path: path of the input, '-' for stdin
+	:param source_path: absolute path of the CSV file of the store
+	:return: True if it is the same file
+	"""
+	if input_path == '-':
+		return False
+	try:
+		return os.path.samefile(input_path, source_path)
+	except OSError:
+		return os.path.abspath(input_path) == source_path
+
+
+def check_store(store_path, input_paths):
+	"""
+	Function that checks whether a store holds the labeled rows of the input of a job: the input has to be the CSV
+	file the store was built from, unchanged since then. The file is only hashed when its size or modification time
+	differ from those recorded in the store.
+	:param store_path: path of the store
+	:param input_paths: list of the input paths of the job
+	:return: None if it does, otherwise the reason why it does not
+	"""
+	from token_cache import file_hash
+
+	source = FeatureStore(store_path).header.get('source')
+	if source is None:
+		return '%s does not record the CSV file it was built from' % store_path
+	if len(input_paths) != 1 or not is_source(input_paths[0], source['path']):
+		return '%s was built from %s, not from the input of the job (%s)' % (
+			store_path, source['path'], ', '.join(input_paths) or '-')
+	if not os.path.exists(source['path']):
+		return '%s was built from %s, which does not exist anymore' % (store_path, source['path'])
+	stat = os.stat(source['path'])
+	if (stat.st_size, stat.st_mtime_ns) == (source.get('size'), source.get('mtime_ns')):
+		return None
+	if file_hash([source['path']]) != source['sha256']:
+		return '%s was built from an older version of %s' % (store_path, source['path'])
+	return None
+
+
+class FeatureStore:
+	"""
+	Read-only view of a store, with its arrays memory-mapped.
+	"""
+
+	def __init__(self, store_path):
+		"""
+		:param store_path: path of the store
+		"""
+		with open(store_path, 'rb') as f:
+			if f.read(len(MAGIC)) != MAGIC:
+				raise ValueError('%s is not a KNN feature store' % store_path)
+			header_size, = struct.unpack('<Q', f.read(8))
+			self.header = json.loads(f.read(header_size))
+
+		self.labels = self.header['labels']
+		for name, dtype, shape, offset in array_layout(self.header, len(MAGIC) + 8 + header_size):
+			# a memory map cannot be empty
+			if shape[0]:
+				setattr(self, name, np.memmap(store_path, dtype, 'r', offset, shape))
+			else:
+				setattr(self, name, np.empty(shape, dtype))
+
+	def __len__(self):
+		return self.header['rows']
+
+	def chunks(self, chunk_size):
+		"""
+		Function that splits the rows into chunks of consecutive rows with the same label.
+		:param chunk_size: maximum number of rows per chunk
+		:return: list of (start, stop, label)
+		"""
+		offsets = self.header['label_offsets']
+		chunk_size = max(1, chunk_size)
+		return [(start, min(start + chunk_size, offsets[code + 1]), label)
+				for code, label in enumerate(self.labels)
+				for start in range(offsets[code], offsets[code + 1], chunk_size)]
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Write the store of the labeled rows of a KNN input.')
+	parser.add_argument('input', help='CSV file')
+	parser.add_argument('store', help='path of the store')
+	parser.add_argument('--dtype', choices=['float32', 'float64'], default='float64',
+						help='type of the feature values; float32 halves the size, but the distances are then '
+							 'computed from rounded values')
+	args = parser.parse_args()
+	print(build_store(args.input, args.store, args.dtype))
@@ -0,0 +1,78 @@
+import math
+from mrjob.job import MRJob
+from mrjob.step import MRStep
+
+from matrix_store import open_matrix, run_with_block_file, sum_of_squares
+
+
+class FrobeniusNormBlocks(MRJob):
+	"""
+	In this class, I show how the Frobenius norm of task4.py can be calculated from the binary form of the matrix (see
+	matrix_store.py) instead of the text file: the input of the job is a block file, and each mapper squares whole
+	blocks of rows of the memory-mapped matrix with NumPy, so only one number per block goes through the shuffle.
+	
+	Usage: python frobenius_blocks.py --matrix A.npy [--block-rows 256] [block_file]
+	"""
+	FILES = ['job_rerun.py', 'matrix_store.py']
+	
+	def configure_args(self):
+		super(FrobeniusNormBlocks, self).configure_args()
+		self.add_file_arg('--matrix', help='the matrix, as a .npy file written by matrix_store.py')
+		self.add_passthru_arg('--block-rows', type=int, default=256,
+							  help='number of rows per block when the block file is written by the job')
+	
+	def run_job(self):
+		if self.options.matrix is None:
+			self.arg_parser.error('--matrix is required')
+		# the input is the block file; if none was given, we write one for the matrix into a temporary directory and
+		# run the job with it
+		if self.options.args:
+			super(FrobeniusNormBlocks, self).run_job()
+		else:
+			run_with_block_file(self)
+	
+	def mapper_init_1(self):
+		"""
+		Opens the memory-mapped matrix once for all the blocks of the mapper.
+		"""
+		self.matrix = open_matrix(self.options.matrix)
+	
+	def mapper_1(self, _, line):
+		"""
+		Mapper that reads a line of the block file and returns the sum of the squared absolute values of the block.
+		:param _: None
+		:param line: 'start stop', the rows of the block
+		:return: (None, block_sum)
+		"""
+		start, stop = map(int, line.split())
+		yield None, sum_of_squares(self.matrix[start:stop])
+	
+	def combiner_1(self, _, block_sum):
+		"""
+		Combiner that adds the block sums of a mapper.
+		:param _: None
+		:param block_sum: the sums of the blocks
+		:return: (None, sum of the block sums)
+		"""
+		yield None, sum(block_sum)
+	
+	def reducer_1(self, _, block_sum):
+		"""
+		Reducer that takes all the block sums and returns the Frobenius norm.
+		:param _: None
+		:param block_sum: the sums of the blocks
+		:return: (None, Frobenius_norm = sqrt(sum(block_sum)) )
+		"""
+		yield None, math.sqrt(sum(block_sum))
+	
+	def steps(self):
+		return [
+			MRStep(mapper_init=self.mapper_init_1,
+				   mapper=self.mapper_1,
+				   combiner=self.combiner_1,
+				   reducer=self.reducer_1)
+		]
+
+
+if __name__ == '__main__':
+	FrobeniusNormBlocks.run()
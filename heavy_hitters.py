@@ -0,0 +1,132 @@
+import heapq
+
+
+class SpaceSaving:
+	"""
+	Space-Saving summary (Metwally et al.) of the most frequent items of a stream. It never keeps more than
+	capacity counters, whatever the length of the stream, and two summaries can be merged (Agarwal et al.,
+	"Mergeable Summaries"), so each mapper can summarise its own part of the input.
+
+	Each counter holds an estimated count and the maximum overestimation of that count, so the true number of
+	occurrences of an item is always between count - error and count. An item missing from the summary occurred
+	at most min_count() times.
+	"""
+
+	def __init__(self, capacity):
+		"""
+		:param capacity: maximum number of counters kept by the summary
+		"""
+		self.capacity = capacity
+		# total number of occurrences seen by the summary
+		self.total = 0
+		# dictionary of {item: [count, error]}
+		self.counters = {}
+		# min-heap of (count, item) used to find the counter to replace; it may contain outdated entries, which are
+		# skipped when popped and removed when the heap grows too large
+		self.heap = []
+
+	def update(self, item, count=1):
+		"""
+		Function that records count more occurrences of an item.
+		:param item: the item
+		:param count: the number of occurrences
+		"""
+		self.total += count
+		counter = self.counters.get(item)
+
+		if counter is not None:
+			counter[0] += count
+		elif len(self.counters) < self.capacity:
+			counter = self.counters[item] = [count, 0]
+		else:
+			# the item takes over the counter with the smallest count, whose count becomes its error
+			smallest, evicted = self.pop_min()
+			del self.counters[evicted]
+			counter = self.counters[item] = [smallest + count, smallest]
+
+		heapq.heappush(self.heap, (counter[0], item))
+		if len(self.heap) > 2 * self.capacity:
+			self.rebuild_heap()
+
+	def pop_min(self):
+		"""
+		Function that removes the counter with the smallest count from the heap.
+		:return: (count, item)
+		"""
+		while True:
+			count, item = heapq.heappop(self.heap)
+			counter = self.counters.get(item)
+			if counter is not None and counter[0] == count:
+				return count, item
+
+	def rebuild_heap(self):
+		"""
+		Function that rebuilds the heap from the counters, dropping the outdated entries.
+		"""
+		self.heap = [(counter[0], item) for item, counter in self.counters.items()]
+		heapq.heapify(self.heap)
+
+	def min_count(self):
+		"""
+		Function that returns the largest possible number of occurrences of an item missing from the summary.
+		:return: the smallest count if the summary is full, 0 otherwise
+		"""
+		if len(self.counters) < self.capacity:
+			return 0
+		return min(counter[0] for counter in self.counters.values())
+
+	def merge(self, other):
+		"""
+		Function that merges another summary of the same capacity into this one.
+		:param other: SpaceSaving summary
+		:return: this summary
+		"""
+		own_min = self.min_count()
+		other_min = other.min_count()
+
+		merged = {}
+		for item in set(self.counters) | set(other.counters):
+			# an item missing from one of the summaries may have occurred up to min_count() times in its stream
+			count, error = self.counters.get(item, (own_min, own_min))
+			other_count, other_error = other.counters.get(item, (other_min, other_min))
+			merged[item] = [count + other_count, error + other_error]
+
+		# only the largest capacity counters are kept
+		kept = heapq.nsmallest(self.capacity, merged.items(), key=lambda el: (-el[1][0], el[0]))
+		self.counters = dict(kept)
+		self.total += other.total
+		self.rebuild_heap()
+		return self
+
+	def top(self, k):
+		"""
+		Function that returns the k items with the largest estimated counts.
+		:param k: number of items to return
+		:return: list of [item, count, error], in decreasing order of count; ties are broken by item
+		"""
+		return [[item, counter[0], counter[1]]
+				for item, counter in heapq.nsmallest(k, self.counters.items(), key=lambda el: (-el[1][0], el[0]))]
+
+	def to_dict(self):
+		"""
+		Function that converts the summary to a JSON-serialisable dictionary.
+		:return: {'capacity': capacity, 'total': total, 'counters': [[item, count, error]]}
+		"""
+		return {
+			'capacity': self.capacity,
+			'total': self.total,
+			'counters': [[item, counter[0], counter[1]] for item, counter in self.counters.items()],
+		}
+
+	@classmethod
+	def from_dict(cls, data):
+		"""
+		Function that rebuilds a summary converted with to_dict.
+		:param data: {'capacity': capacity, 'total': total, 'counters': [[item, count, error]]}
+		:return: SpaceSaving summary
+		"""
+		summary = cls(data['capacity'])
+		summary.total = data['total']
+		summary.counters = {item: [count, error] for item, count, error in data['counters']}
+		summary.rebuild_heap()
+		return summary
@@ -0,0 +1,253 @@
+"""
+Skew handling for InvertWebLink: the pages with the most in-links (the hot keys) are found by a sampling pre-pass, and
+their in-links are split into sub-partitions by ranges of IDs of the pages linking to them, which are sorted by
+different reducers.
+
+The pre-pass reads the first --sample-bytes bytes of every --split-bytes bytes of the edge lists, counts the pages
+linked to in them with a Space-Saving summary (see heavy_hitters.py), and scales the counts by the sampled fraction
+of the input. A page whose estimated in-degree reaches --hot-threshold gets ceil(in-degree / --hot-threshold)
+sub-partitions, so each one has about --hot-threshold in-links: a second read of the sampled bytes collects the
+in-links of the hot pages, and the boundaries of the sub-partitions are their quantiles. An edge goes to the
+sub-partition of the range of its from_id.
+
+Since the ranges do not overlap, the sorted sub-partitions of a page only have to be put one after the other, by their
+smallest ID: no reducer reads all the in-links of a hot page, so the time of the job depends on --hot-threshold, not on
+the largest in-degree. The sub-partitions are written as they are, so a hot page has several lines in the output, which
+may be in different output files; link_graph.py puts them back together. A reducer keeps at most about --spill-values
+in-links in memory (see SortedSpill), and writes them in lists of at most --spill-values IDs.
+
+The hot keys are written to a JSON file, {to_id: [boundaries]}, which is sent to the mappers.
+"""
+import bisect
+import heapq
+import itertools
+import json
+import math
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from edge_list import SPLIT_BYTES, byte_ranges, parse_edges, parse_range_line, read_range
+from heavy_hitters import SpaceSaving
+from job_rerun import rerun_with_args
+
+SAMPLE_BYTES = 64 * 1024
+SUMMARY_CAPACITY = 10000
+SPILL_VALUES = 1000000
+
+
+def sampled_ranges(job):
+	"""
+	Function that returns the byte ranges of the input of an InvertWebLink job.
+	:param job: the job, in the driver process
+	:return: list of (path, start, stop) of uncompressed edge lists
+	"""
+	if job.options.edges:
+		ranges = []
+		for range_path in job.options.args:
+			with open(range_path) as f:
+				ranges.extend(parse_range_line(line) for line in f if line.strip())
+		return ranges
+	if any(path == '-' or path.endswith('.gz') for path in job.options.args):
+		job.arg_parser.error('--hot-threshold cannot sample stdin or .gz files line by line; use --edges')
+	return [(path, start, stop) for path in job.options.args
+			for start, stop in byte_ranges(path, job.options.split_bytes)]
+
+
+def sampled_edges(ranges, sample_bytes=SAMPLE_BYTES, split_bytes=SPLIT_BYTES):
+	"""
+	Function that reads a sample of the edge lists: the first sample_bytes bytes of every split_bytes bytes.
+	:param ranges: list of (path, start, stop) of uncompressed edge lists
+	:param sample_bytes: number of bytes read at the start of every window
+	:param split_bytes: size of the windows
+	:return: generator of (number of bytes read, sources, targets), see edge_list.parse_edges
+	"""
+	for path, start, stop in ranges:
+		for window in range(start, stop, max(1, split_bytes)):
+			for chunk in read_range(path, window, min(stop, window + sample_bytes)):
+				yield (len(chunk),) + parse_edges(chunk)
+
+
+def sample_hot_keys(ranges, hot_threshold, sample_bytes=SAMPLE_BYTES, split_bytes=SPLIT_BYTES,
+					capacity=SUMMARY_CAPACITY):
+	"""
+	Function that estimates the in-degrees of the pages from a sample of the edge lists, picks the hot keys and the
+	ranges of their sub-partitions.
+	:param ranges: list of (path, start, stop) of uncompressed edge lists
+	:param hot_threshold: in-degree from which a page is split into sub-partitions
+	:param sample_bytes: number of bytes read at the start of every window
+	:param split_bytes: size of the windows
+	:param capacity: number of counters of the Space-Saving summary
+	:return: {to_id: sorted list of the boundaries of the sub-partitions}
+	"""
+	summary = SpaceSaving(capacity)
+	sampled = 0
+	for size, _, to_ids in sampled_edges(ranges, sample_bytes, split_bytes):
+		sampled += size
+		to_ids, counts = np.unique(to_ids, return_counts=True)
+		for to_id, count in zip(to_ids.tolist(), counts.tolist()):
+			summary.update(to_id, count)
+	if not sampled:
+		return {}
+	scale = sum(stop - start for _, start, stop in ranges) / sampled
+	salts = {to_id: math.ceil(count * scale / hot_threshold) for to_id, count, _ in summary.top(capacity)
+			 if count * scale >= hot_threshold}
+
+	# the boundaries are the quantiles of the sampled in-links of each hot page
+	hot_ids = np.array(sorted(salts), dtype=np.int64)
+	in_links = {to_id: [] for to_id in salts}
+	for _, from_ids, to_ids in sampled_edges(ranges, sample_bytes, split_bytes):
+		hot = np.isin(to_ids, hot_ids)
+		for to_id, from_id in zip(to_ids[hot].tolist(), from_ids[hot].tolist()):
+			in_links[to_id].append(from_id)
+	hot_keys = {}
+	for to_id, from_ids in in_links.items():
+		from_ids.sort()
+		hot_keys[to_id] = sorted({from_ids[len(from_ids) * i // salts[to_id]] for i in range(1, salts[to_id])})
+	return hot_keys
+
+
+def sub_partition(boundaries, from_id):
+	"""
+	Function that picks the sub-partition of an in-link of a hot page.
+	:param boundaries: sorted list of the boundaries of the sub-partitions of the page
+	:param from_id: ID of the page linking to it
+	:return: the index of the sub-partition, from 0 to len(boundaries)
+	"""
+	return bisect.bisect_right(boundaries, from_id)
+
+
+def write_hot_keys(hot_keys, hot_keys_path):
+	"""
+	Function that writes the hot keys to a JSON file.
+	:param hot_keys: {to_id: [boundaries]}
+	:param hot_keys_path: path of the file
+	"""
+	with open(hot_keys_path, 'w') as out:
+		json.dump({str(to_id): boundaries for to_id, boundaries in sorted(hot_keys.items())}, out)
+
+
+def load_hot_keys(hot_keys_path):
+	"""
+	Function that reads the hot keys written by write_hot_keys.
+	:param hot_keys_path: path of the file
+	:return: {to_id: [boundaries]}, with the IDs as integers
+	"""
+	with open(hot_keys_path) as f:
+		return {int(to_id): boundaries for to_id, boundaries in json.load(f).items()}
+
+
+def run_with_hot_keys(job):
+	"""
+	Function that runs an InvertWebLink job, which was started with --hot-threshold and without --hot-keys: the hot
+	keys are sampled and written into a temporary directory, and the job is run again with them.
+	:param job: the job, in the driver process
+	"""
+	hot_keys = sample_hot_keys(sampled_ranges(job), job.options.hot_threshold, job.options.sample_bytes,
+							   job.options.split_bytes)
+	tmp_dir = tempfile.mkdtemp()
+	try:
+		hot_keys_path = os.path.join(tmp_dir, 'hot_keys.json')
+		write_hot_keys(hot_keys, hot_keys_path)
+		rerun_with_args(job, ['--hot-keys', hot_keys_path])
+	finally:
+		shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def chunks(values, size):
+	"""
+	Function that cuts some values into lists.
+	:param values: iterable
+	:param size: largest number of values of a list
+	:return: generator of the lists, with the values in order
+	"""
+	values = iter(values)
+	while True:
+		chunk = list(itertools.islice(values, max(1, size)))
+		if not chunk:
+			return
+		yield chunk
+
+
+class SortedSpill:
+	"""
+	Sorted list of integers built from unsorted parts, which is kept on disk in sorted runs of spill_values values
+	once it grows too large, and read back with a merge of the runs, a block of each run at a time.
+
+	Usage:
+		with SortedSpill(spill_values) as values:
+			for part in parts:
+				values.extend(part)
+			for chunk in chunks(values, spill_values):
+				...
+	"""
+
+	def __init__(self, spill_values=SPILL_VALUES):
+		"""
+		:param spill_values: number of values kept in memory before they are written to disk
+		"""
+		self.spill_values = max(1, spill_values)
+		self.buffer = []
+		self.runs = []
+		self.tmp_dir = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def extend(self, values):
+		"""
+		Function that adds some values.
+		:param values: iterable of integers
+		"""
+		self.buffer.extend(values)
+		if len(self.buffer) >= self.spill_values:
+			self.spill()
+
+	def spill(self):
+		"""
+		Function that writes the values in memory to disk, as a sorted run.
+		"""
+		if self.tmp_dir is None:
+			self.tmp_dir = tempfile.mkdtemp()
+		run_path = os.path.join(self.tmp_dir, '%d.bin' % len(self.runs))
+		np.sort(np.array(self.buffer, dtype=np.int64)).tofile(run_path)
+		self.runs.append(run_path)
+		self.buffer = []
+
+	def read_run(self, run_path, block_values):
+		"""
+		Function that reads a run back, a block of values at a time.
+		:param run_path: path of the run
+		:param block_values: number of values read at once
+		:return: generator of the values of the run
+		"""
+		with open(run_path, 'rb') as f:
+			while True:
+				block = np.fromfile(f, dtype=np.int64, count=block_values)
+				if not len(block):
+					return
+				yield from block.tolist()
+
+	def __iter__(self):
+		"""
+		:return: generator of all the values, sorted
+		"""
+		if not self.runs:
+			return iter(sorted(self.buffer))
+		# the merge keeps a block of every run in memory
+		block_values = max(1024, min(65536, self.spill_values // len(self.runs)))
+		return heapq.merge(sorted(self.buffer), *[self.read_run(run_path, block_values) for run_path in self.runs])
+
+	def close(self):
+		"""
+		Function that removes the runs written to disk.
+		"""
+		if self.tmp_dir is not None:
+			shutil.rmtree(self.tmp_dir, ignore_errors=True)
+			self.tmp_dir = None
+		self.runs = []
@@ -0,0 +1,173 @@
+"""
+Incremental version of MovieGenreKeywords for a catalog that only grows.
+
+The per-genre word counts are saved in a JSON state file, with the size and the SHA-256 of every input file as it was
+when it was processed. Each run checks that the files still start with the bytes that were processed: if so, only
+the bytes appended since then are tagged and counted, and their counts are added to the state; otherwise (a row was
+edited or deleted, or the list of files changed) the counts are recomputed from scratch. Either way, the top keywords
+of every genre are the same as those of a full single-pass run over the whole input.
+
+Usage: python incremental_keywords.py movies.csv --state keywords_state.json [--top-k 10] [--index DIR] [job options]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from keyword_counts import merge_counts, top_keywords
+from keyword_index import build_index
+from task1 import MovieGenreKeywords
+
+
+def load_state(path):
+	"""
+	Function that loads a saved state.
+	:param path: path of the state file
+	:return: {'files': [{'path': path, 'size': processed_bytes, 'sha256': digest_of_the_processed_bytes}],
+	'genres': {genre: {word: number_of_occurrences}}}; an empty state if the file does not exist yet
+	"""
+	if not os.path.exists(path):
+		return {'files': [], 'genres': {}}
+	with open(path, encoding='utf-8') as f:
+		return json.load(f)
+
+
+def save_state(state, path):
+	"""
+	Function that saves a state; the file is replaced at once, so an interrupted run leaves the old state intact.
+	:param state: the state dictionary
+	:param path: path of the state file
+	"""
+	tmp_path = path + '.tmp'
+	with open(tmp_path, 'w', encoding='utf-8') as f:
+		json.dump(state, f)
+	os.replace(tmp_path, path)
+
+
+def scan_file(path, prefix_size):
+	"""
+	Function that hashes a file and its first bytes in a single pass.
+	:param path: path of the file
+	:param prefix_size: number of bytes of the prefix
+	:return: ({'path', 'size', 'sha256'} of the whole file, SHA-256 of the prefix, or None if the file is shorter)
+	"""
+	digest = hashlib.sha256()
+	with open(path, 'rb') as f:
+		last_chunk = b''
+		while f.tell() < prefix_size:
+			chunk = f.read(min(1 << 20, prefix_size - f.tell()))
+			if not chunk:
+				break
+			digest.update(chunk)
+			last_chunk = chunk
+		prefix_digest = digest.hexdigest() if f.tell() == prefix_size else None
+		size = f.tell()
+		for chunk in iter(lambda: f.read(1 << 20), b''):
+			digest.update(chunk)
+			size += len(chunk)
+	# if the last processed line had no newline and the file grew, that line was extended
+	if prefix_size and size > prefix_size and not last_chunk.endswith(b'\n'):
+		prefix_digest = None
+	return {'path': os.path.abspath(path), 'size': size, 'sha256': digest.hexdigest()}, prefix_digest
+
+
+def appended_files(input_paths, processed):
+	"""
+	Function that checks whether some files only grew since they were processed.
+	:param input_paths: list of paths of the movies files
+	:param processed: the 'files' of the state
+	:return: (list of the current {'path', 'size', 'sha256'} of the files, list of (path, offset) of the files that
+	grew, from the first byte that was not processed), or (files, None) if the files must be processed from scratch
+	"""
+	files = []
+	grown = []
+	unchanged_prefix = len(input_paths) == len(processed)
+	for i, path in enumerate(input_paths):
+		old = processed[i] if unchanged_prefix else {'path': None, 'size': 0, 'sha256': None}
+		current, prefix_digest = scan_file(path, old['size'])
+		files.append(current)
+		if old['path'] != current['path'] or prefix_digest != old['sha256']:
+			unchanged_prefix = False
+		elif current['size'] > old['size']:
+			grown.append((path, old['size']))
+	return files, grown if unchanged_prefix else None
+
+
+def copy_tail(path, offset, tail_path):
+	"""
+	Function that copies the end of a file to another file.
+	:param path: path of the file
+	:param offset: position of the first byte copied
+	:param tail_path: path of the copy
+	"""
+	with open(path, 'rb') as f, open(tail_path, 'wb') as out:
+		f.seek(offset)
+		shutil.copyfileobj(f, out, 1 << 20)
+
+
+def count_movies(input_paths, job_args=()):
+	"""
+	Function that runs MovieGenreKeywords in counts mode over some movies files.
+	:param input_paths: list of paths of the movies files
+	:param job_args: extra command-line arguments for the job (e.g. --token-cache)
+	:return: dictionary of {genre: {word: number_of_occurrences}}
+	"""
+	job = MovieGenreKeywords(args=list(input_paths) + ['--mode', 'counts'] + list(job_args))
+	counts = {}
+	with job.make_runner() as runner:
+		runner.run()
+		for genre, genre_counts in job.parse_output(runner.cat_output()):
+			counts[genre] = genre_counts
+	return counts
+
+
+def update(input_paths, state_path, job_args=()):
+	"""
+	Function that adds the movies appended since the last run to the saved state, or recomputes the state if the
+	files changed in any other way.
+	:param input_paths: list of paths of the movies files
+	:param state_path: path of the state file
+	:param job_args: extra command-line arguments for the job
+	:return: the updated state
+	"""
+	state = load_state(state_path)
+	files, grown = appended_files(input_paths, state.get('files', []))
+
+	if grown is None:
+		state = {'files': files, 'genres': count_movies(input_paths, job_args)}
+		save_state(state, state_path)
+	elif grown:
+		# the appended bytes start with a new line, so they are read like a movies file without a header
+		tmp_dir = tempfile.mkdtemp()
+		try:
+			tail_paths = []
+			for i, (path, offset) in enumerate(grown):
+				tail_paths.append(os.path.join(tmp_dir, '%d_%s' % (i, os.path.basename(path))))
+				copy_tail(path, offset, tail_paths[-1])
+			new_counts = count_movies(tail_paths, job_args)
+		finally:
+			shutil.rmtree(tmp_dir, ignore_errors=True)
+		for genre, genre_counts in new_counts.items():
+			merge_counts(state['genres'].setdefault(genre, {}), genre_counts)
+		state['files'] = files
+		save_state(state, state_path)
+
+	return state
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+	parser.add_argument('input', nargs='+', help='movies file(s)')
+	parser.add_argument('--state', required=True, help='path of the JSON state file')
+	parser.add_argument('--top-k', type=int, default=10, help='number of keywords returned for each genre')
+	parser.add_argument('--index', help='directory of a keyword index (see keyword_index.py) to rebuild from the state')
+	args, job_args = parser.parse_known_args()
+
+	state = update(args.input, args.state, job_args)
+	if args.index:
+		build_index(state['genres'], args.index)
+	for genre in sorted(state['genres']):
+		keywords = [word for word, _ in top_keywords(state['genres'][genre], args.top_k)]
+		print('%s\t%s' % (json.dumps(genre), json.dumps(keywords)))
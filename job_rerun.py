@@ -0,0 +1,69 @@
+"""
+Helpers for the jobs whose driver does more than run the steps (e.g. writes a side file and runs the job again with
+it), and whose script must then tell the driver from the tasks the runners start.
+
+The command-line arguments of a job are read from MRJob._cl_args, which is private to mrjob: it holds the arguments
+the job was created with, or sys.argv[1:], in every release from 0.6.0 to the 0.7.4 of requirements.txt.
+"""
+import sys
+
+from mrjob.compat import jobconf_from_env
+
+# jobconf property with the name of the job class, for the scripts with several jobs (see task_job_class)
+JOB_CLASS_JOBCONF = 'job_rerun.job.class'
+
+
+def job_args(job):
+	"""
+	Function that returns the command-line arguments a job was created with.
+	:param job: the job
+	:return: list of arguments
+	"""
+	if not hasattr(job, '_cl_args'):
+		raise RuntimeError('this version of mrjob does not keep the arguments of the jobs; see job_rerun.py')
+	return list(job._cl_args)
+
+
+def is_task_process(argv=None):
+	"""
+	Function that checks whether a script was started by a runner (e.g. -r local) to run a task of a job.
+	:param argv: the command line, sys.argv by default
+	:return: True if the command line selects a step, as in '--step-num=0 --mapper', False for the driver
+	"""
+	return any(arg == '--step-num' or arg.startswith('--step-num=') for arg in (sys.argv if argv is None else argv))
+
+
+def job_class_jobconf(job, jobconf):
+	"""
+	Function that adds the name of the class of a job to its jobconf; the runners pass the jobconf to the tasks, so a
+	script with several jobs can tell which one a task belongs to with task_job_class.
+	:param job: the job
+	:param jobconf: the jobconf of the job, as returned by MRJob.jobconf
+	:return: the jobconf with the name of the class
+	"""
+	return dict(jobconf, **{JOB_CLASS_JOBCONF: job.__class__.__name__})
+
+
+def task_job_class(job_classes):
+	"""
+	Function that picks the job a task started by a runner belongs to, from the jobconf set by job_class_jobconf.
+	:param job_classes: the MRJob classes of the script
+	:return: the class of the job of the task
+	"""
+	name = jobconf_from_env(JOB_CLASS_JOBCONF)
+	for job_class in job_classes:
+		if job_class.__name__ == name:
+			return job_class
+	raise RuntimeError('the task does not belong to any job of this script: %s is %r' % (JOB_CLASS_JOBCONF, name))
+
+
+def rerun_with_args(job, extra_args):
+	"""
+	Function that runs a job again, in the driver, with some more command-line arguments; the options of a job cannot
+	be changed once it is created, since the tasks are started with the original command line.
+	:param job: the job, in the driver process
+	:param extra_args: list of arguments added to those of the job
+	"""
+	job_with_args = job.__class__(args=job_args(job) + list(extra_args))
+	job_with_args.sandbox(stdin=job.stdin, stdout=job.stdout, stderr=job.stderr)
+	job_with_args.run_job()
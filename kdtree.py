@@ -0,0 +1,127 @@
+import numpy as np
+
+
+class KDTree:
+	"""
+	KD-tree over a set of labeled points, for k-nearest-neighbour queries that only visit the parts of the space
+	that can still hold one of the k nearest points.
+
+	Every node splits its points at the median of the dimension with the largest spread; the leaves hold at most
+	leaf_size points, which are stored contiguously so they can be scanned with a single NumPy operation.
+	"""
+
+	def __init__(self, points, leaf_size=32):
+		"""
+		:param points: float array of shape (n, d)
+		:param leaf_size: maximum number of points in a leaf
+		"""
+		self.leaf_size = max(1, leaf_size)
+		order = np.arange(len(points))
+
+		# the nodes are stored in parallel lists; leaves have split_dim == -1 and hold the points start:end
+		self.start, self.end, self.split_dim, self.split_value, self.left, self.right = [], [], [], [], [], []
+		if len(points):
+			self.build(points, order, 0, len(points))
+
+		# the points are reordered once, so the points of a leaf are a contiguous slice
+		self.order = order
+		self.points = points[order]
+
+	def add_node(self, start, end):
+		"""
+		Function that adds a leaf node for the points start:end.
+		:return: the index of the node
+		"""
+		self.start.append(start)
+		self.end.append(end)
+		self.split_dim.append(-1)
+		self.split_value.append(0.0)
+		self.left.append(-1)
+		self.right.append(-1)
+		return len(self.start) - 1
+
+	def build(self, points, order, start, end):
+		"""
+		Function that builds the subtree of the points order[start:end], without recursion.
+		:param points: float array of shape (n, d)
+		:param order: permutation of the points, rearranged in place so that every node holds a contiguous range
+		:param start: first position of the range
+		:param end: position after the last one of the range
+		"""
+		stack = [self.add_node(start, end)]
+		while stack:
+			node = stack.pop()
+			start, end = self.start[node], self.end[node]
+			if end - start <= self.leaf_size:
+				continue
+
+			values = points[order[start:end]]
+			dim = int(np.argmax(values.max(axis=0) - values.min(axis=0)))
+			middle = (end - start) // 2
+			partition = np.argpartition(values[:, dim], middle)
+			order[start:end] = order[start:end][partition]
+
+			self.split_dim[node] = dim
+			self.split_value[node] = float(values[partition[middle], dim])
+			self.left[node] = self.add_node(start, start + middle)
+			self.right[node] = self.add_node(start + middle, end)
+			stack.append(self.left[node])
+			stack.append(self.right[node])
+
+	def query(self, point, k):
+		"""
+		Function that finds the k points closest to a query point.
+		:param point: float array of shape (d,)
+		:param k: number of neighbours
+		:return: (distances, indices), sorted by increasing distance; the indices refer to the points given to the tree
+		"""
+		k = min(k, len(self.points))
+		if k == 0:
+			return np.empty(0), np.empty(0, dtype=np.int64)
+
+		best_d2 = np.full(k, np.inf)
+		best_positions = np.zeros(k, dtype=np.int64)
+		worst = np.inf
+
+		# each entry is (node, squared distance from the point to the region of the node, along the last split)
+		stack = [(0, 0.0)]
+		while stack:
+			node, plane_d2 = stack.pop()
+			if plane_d2 > worst:
+				continue
+
+			dim = self.split_dim[node]
+			if dim == -1:
+				start, end = self.start[node], self.end[node]
+				d2 = ((self.points[start:end] - point) ** 2).sum(axis=1)
+				candidates_d2 = np.concatenate((best_d2, d2))
+				candidates = np.concatenate((best_positions, np.arange(start, end)))
+				keep = np.argpartition(candidates_d2, k - 1)[:k]
+				best_d2, best_positions = candidates_d2[keep], candidates[keep]
+				worst = best_d2.max()
+				continue
+
+			difference = point[dim] - self.split_value[node]
+			near, far = (self.left[node], self.right[node]) if difference < 0 else (self.right[node], self.left[node])
+			# the far side is pushed first, so it is only visited after the near side has tightened the bound
+			stack.append((far, difference * difference))
+			stack.append((near, 0.0))
+
+		order = np.argsort(best_d2, kind='stable')
+		return np.sqrt(best_d2[order]), self.order[best_positions[order]]
+
+
+def kdtree_neighbours(queries, labeled, k, leaf_size=32):
+	"""
+	Function with the same interface as knn_distance.nearest_neighbours, which answers the queries with a KD-tree
+	built once over the labeled points.
+	:param queries: float array of shape (q, n)
+	:param labeled: float array of shape (l, n)
+	:param k: number of neighbours
+	:param leaf_size: maximum number of points in a leaf of the tree
+	:return: generator of (query_index, distances, labeled_indices), sorted by increasing distance
+	"""
+	tree = KDTree(labeled, leaf_size)
+	for i, point in enumerate(queries):
+		distances, indices = tree.query(point, k)
+		yield i, distances, indices
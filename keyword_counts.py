@@ -0,0 +1,36 @@
+import heapq
+
+
+def count_words(counts, partial_title):
+	"""
+	Function that adds the words of a processed title to a dictionary of word counts.
+	:param counts: dictionary of {word: number_of_occurrences}, updated in place
+	:param partial_title: the processed title, with the words separated by spaces
+	"""
+	for word in partial_title.split(' '):
+		# just like in combiner_2, the '' values produced by empty titles are not keywords
+		if word != '':
+			counts[word] = counts.get(word, 0) + 1
+
+
+def merge_counts(counts, other):
+	"""
+	Function that adds the word counts of another dictionary to a dictionary of word counts.
+	:param counts: dictionary of {word: number_of_occurrences}, updated in place
+	:param other: dictionary of {word: number_of_occurrences}
+	:return: counts
+	"""
+	for word, count in other.items():
+		counts[word] = counts.get(word, 0) + count
+	return counts
+
+
+def top_keywords(counts, k):
+	"""
+	Function that selects the k most frequent words with a bounded heap instead of sorting the whole vocabulary;
+	ties are broken alphabetically, so the result does not depend on the order the counts were merged in.
+	:param counts: dictionary of {word: number_of_occurrences}
+	:param k: number of words to return
+	:return: list of [word, number_of_occurrences], in decreasing order of occurrences
+	"""
+	return [[word, count] for word, count in heapq.nsmallest(k, counts.items(), key=lambda el: (-el[1], el[0]))]
@@ -0,0 +1,219 @@
+"""
+Compact, memory-mapped index of the word counts of every genre, so that the top keywords for any k, the count of a
+word in a genre or the genres in which a word ranks high can be answered without running MovieGenreKeywords again.
+
+An index is a directory with:
+- vocab.txt: the words, one per line; the line number is the integer id of the word (the most frequent words overall
+  get the smallest ids);
+- genres.json: the genres, in the order of their blocks in the arrays below;
+- offsets.npy: int64 array; the words of the i-th genre are at positions offsets[i]:offsets[i + 1] of the next arrays;
+- word_ids.npy, counts.npy: int32 arrays with the words of each genre and their counts, sorted by decreasing count
+  (ties are broken alphabetically, as in keyword_counts.top_keywords);
+- lookup_ids.npy, lookup_ranks.npy: int32 arrays with the words of each genre sorted by id and their position in the
+  previous arrays, used to find a word with a binary search.
+
+Usage:
+	python keyword_index.py build INDEX_DIR movies.csv [job options]
+	python keyword_index.py build INDEX_DIR --state keywords_state.json
+	python keyword_index.py top INDEX_DIR GENRE K
+	python keyword_index.py count INDEX_DIR GENRE WORD
+	python keyword_index.py genres INDEX_DIR WORD N
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+ARRAYS = ['offsets', 'word_ids', 'counts', 'lookup_ids', 'lookup_ranks']
+
+
+def build_index(genre_counts, index_dir):
+	"""
+	Function that writes the index of a set of per-genre word counts.
+	:param genre_counts: dictionary of {genre: {word: number_of_occurrences}}
+	:param index_dir: directory the index is written to; it is created if needed
+	"""
+	totals = {}
+	for counts in genre_counts.values():
+		for word, count in counts.items():
+			totals[word] = totals.get(word, 0) + count
+	vocab = sorted(totals, key=lambda word: (-totals[word], word))
+	word_id = {word: i for i, word in enumerate(vocab)}
+
+	genres = sorted(genre_counts)
+	offsets = [0]
+	word_ids, counts, lookup_ids, lookup_ranks = [], [], [], []
+	for genre in genres:
+		ranked = sorted(genre_counts[genre].items(), key=lambda el: (-el[1], el[0]))
+		ids = [word_id[word] for word, _ in ranked]
+		word_ids.extend(ids)
+		counts.extend(count for _, count in ranked)
+		by_id = sorted(range(len(ids)), key=lambda rank: ids[rank])
+		lookup_ids.extend(ids[rank] for rank in by_id)
+		lookup_ranks.extend(by_id)
+		offsets.append(offsets[-1] + len(ids))
+
+	os.makedirs(index_dir, exist_ok=True)
+	with open(os.path.join(index_dir, 'vocab.txt'), 'w', encoding='utf-8') as f:
+		f.write(''.join(word + '\n' for word in vocab))
+	with open(os.path.join(index_dir, 'genres.json'), 'w', encoding='utf-8') as f:
+		json.dump(genres, f)
+
+	arrays = {
+		'offsets': np.array(offsets, dtype=np.int64),
+		'word_ids': np.array(word_ids, dtype=np.int32),
+		'counts': np.array(counts, dtype=np.int32),
+		'lookup_ids': np.array(lookup_ids, dtype=np.int32),
+		'lookup_ranks': np.array(lookup_ranks, dtype=np.int32),
+	}
+	for name in ARRAYS:
+		np.save(os.path.join(index_dir, name + '.npy'), arrays[name])
+
+
+class KeywordIndex:
+	"""
+	Read-only view of an index written by build_index; the arrays are memory-mapped, so several processes opening
+	the same index share its pages.
+	"""
+
+	def __init__(self, index_dir):
+		"""
+		:param index_dir: directory the index was written to
+		"""
+		with open(os.path.join(index_dir, 'vocab.txt'), encoding='utf-8') as f:
+			self.vocab = f.read().split('\n')[:-1]
+		self.word_id = {word: i for i, word in enumerate(self.vocab)}
+		with open(os.path.join(index_dir, 'genres.json'), encoding='utf-8') as f:
+			self.genres = json.load(f)
+		self.genre_position = {genre: i for i, genre in enumerate(self.genres)}
+
+		for name in ARRAYS:
+			setattr(self, name, np.load(os.path.join(index_dir, name + '.npy'), mmap_mode='r'))
+
+	def block(self, genre):
+		"""
+		Function that returns the positions of the words of a genre in the arrays.
+		:param genre: the genre
+		:return: (start, stop); (0, 0) for an unknown genre
+		"""
+		position = self.genre_position.get(genre)
+		if position is None:
+			return 0, 0
+		return int(self.offsets[position]), int(self.offsets[position + 1])
+
+	def top(self, genre, k):
+		"""
+		Function that returns the k most frequent words of a genre.
+		:param genre: the genre
+		:param k: number of words to return
+		:return: list of [word, number_of_occurrences], in decreasing order of occurrences
+		"""
+		start, stop = self.block(genre)
+		stop = min(stop, start + k)
+		return [[self.vocab[word_id], int(count)]
+				for word_id, count in zip(self.word_ids[start:stop].tolist(), self.counts[start:stop].tolist())]
+
+	def rank(self, genre, word):
+		"""
+		Function that returns the position of a word in the keywords of a genre.
+		:param genre: the genre
+		:param word: the word
+		:return: the 0-based rank of the word, or None if the word does not appear in the genre
+		"""
+		word_id = self.word_id.get(word)
+		start, stop = self.block(genre)
+		if word_id is None or start == stop:
+			return None
+		i = start + int(np.searchsorted(self.lookup_ids[start:stop], word_id))
+		if i == stop or self.lookup_ids[i] != word_id:
+			return None
+		return int(self.lookup_ranks[i])
+
+	def count(self, genre, word):
+		"""
+		Function that returns the number of occurrences of a word in the titles of a genre.
+		:param genre: the genre
+		:param word: the word
+		:return: the number of occurrences, 0 if the word does not appear in the genre
+		"""
+		rank = self.rank(genre, word)
+		if rank is None:
+			return 0
+		return int(self.counts[self.block(genre)[0] + rank])
+
+	def genres_with_top(self, word, n):
+		"""
+		Function that returns the genres in which a word is one of the n most frequent keywords.
+		:param word: the word
+		:param n: number of top keywords considered in each genre
+		:return: list of [genre, rank], with 1-based ranks, sorted by rank
+		"""
+		found = []
+		for genre in self.genres:
+			rank = self.rank(genre, word)
+			if rank is not None and rank < n:
+				found.append([genre, rank + 1])
+		return sorted(found, key=lambda el: (el[1], el[0]))
+
+
+def counts_from_job(input_paths, job_args=()):
+	"""
+	Function that runs MovieGenreKeywords in counts mode over the whole input.
+	:param input_paths: list of paths of the movies files
+	:param job_args: extra command-line arguments for the job (e.g. --token-cache)
+	:return: dictionary of {genre: {word: number_of_occurrences}}
+	"""
+	from task1 import MovieGenreKeywords
+
+	job = MovieGenreKeywords(args=list(input_paths) + ['--mode', 'counts'] + list(job_args))
+	with job.make_runner() as runner:
+		runner.run()
+		return dict(job.parse_output(runner.cat_output()))
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Build or query a per-genre keyword index.')
+	commands = parser.add_subparsers(dest='command', required=True)
+
+	build = commands.add_parser('build', help='build an index from movies files or from an incremental state')
+	build.add_argument('index_dir')
+	build.add_argument('input', nargs='*', help='movies file(s)')
+	build.add_argument('--state', help='state file written by incremental_keywords.py')
+
+	top = commands.add_parser('top', help='top k keywords of a genre')
+	top.add_argument('index_dir')
+	top.add_argument('genre')
+	top.add_argument('k', type=int)
+
+	count = commands.add_parser('count', help='number of occurrences of a word in a genre')
+	count.add_argument('index_dir')
+	count.add_argument('genre')
+	count.add_argument('word')
+
+	genres = commands.add_parser('genres', help='genres in which a word is one of the top n keywords')
+	genres.add_argument('index_dir')
+	genres.add_argument('word')
+	genres.add_argument('n', type=int)
+
+	args, job_args = parser.parse_known_args()
+
+	if args.command == 'build':
+		if args.state:
+			with open(args.state, encoding='utf-8') as f:
+				genre_counts = json.load(f)['genres']
+		elif args.input:
+			genre_counts = counts_from_job(args.input, job_args)
+		else:
+			parser.error('build needs movies files or --state')
+		build_index(genre_counts, args.index_dir)
+	else:
+		if job_args:
+			parser.error('unrecognized arguments: %s' % ' '.join(job_args))
+		index = KeywordIndex(args.index_dir)
+		if args.command == 'top':
+			print(json.dumps(index.top(args.genre, args.k)))
+		elif args.command == 'count':
+			print(index.count(args.genre, args.word))
+		else:
+			print(json.dumps(index.genres_with_top(args.word, args.n)))
@@ -0,0 +1,107 @@
+import heapq
+from collections import Counter
+
+import numpy as np
+
+# maximum number of differences (query points x labeled points x features) computed at once, which bounds the
+# memory of a block to 8 MB of float64 values
+MAX_BLOCK_SIZE = 1 << 20
+
+
+def parse_features(rows):
+	"""
+	Function that converts [id, feature_1, ..., feature_n] rows of strings into an array of floats, once.
+	:param rows: list of [id, features] lists, as read from the CSV file
+	:return: (list of ids, float64 array of shape (number_of_rows, n))
+	"""
+	ids = [row[0] for row in rows]
+	if not rows:
+		return ids, np.empty((0, 0))
+	return ids, np.array([row[1:] for row in rows], dtype=np.float64)
+
+
+def distance_block(queries, labeled):
+	"""
+	Function that computes the euclidean distance between every query point and every labeled point.
+	:param queries: float array of shape (q, n)
+	:param labeled: float array of shape (l, n)
+	:return: float array of shape (q, l)
+	"""
+	# the differences are computed explicitly (rather than with |x|^2 + |y|^2 - 2xy) so the distances are as exact as
+	# those of the original euclidean_distance
+	return np.sqrt(((queries[:, np.newaxis, :] - labeled[np.newaxis, :, :]) ** 2).sum(axis=2))
+
+
+def nearest_neighbours(queries, labeled, k):
+	"""
+	Function that finds the k labeled points closest to each query point. The distances are computed in blocks of
+	query points, and the k nearest of each block are selected with argpartition, so only k candidates per query
+	point are ever sorted.
+	:param queries: float array of shape (q, n)
+	:param labeled: float array of shape (l, n)
+	:param k: number of neighbours
+	:return: generator of (query_index, distances, labeled_indices), sorted by increasing distance; fewer than k
+	neighbours are returned when there are fewer than k labeled points
+	"""
+	k = min(k, len(labeled))
+	if k == 0:
+		return
+
+	block_size = max(1, MAX_BLOCK_SIZE // max(1, labeled.size))
+	for start in range(0, len(queries), block_size):
+		distances = distance_block(queries[start:start + block_size], labeled)
+
+		if k < distances.shape[1]:
+			nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+		else:
+			nearest = np.broadcast_to(np.arange(k), (len(distances), k))
+		nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+		order = np.argsort(nearest_distances, axis=1, kind='stable')
+
+		for i in range(len(distances)):
+			yield start + i, nearest_distances[i, order[i]], nearest[i, order[i]]
+
+
+def nearest_labels(queries, labeled, label_codes, k):
+	"""
+	Function that finds the labels of the k labeled points closest to each query point, ordered like the [distance,
+	label] pairs the KNN job keeps: by distance, then by label, with the points tied with the k-th distance taken into
+	account.
+	:param queries: float array of shape (q, n)
+	:param labeled: float array of shape (l, n)
+	:param label_codes: int array of shape (l,), codes that sort like the labels they stand for
+	:param k: number of neighbours
+	:return: generator of (query_index, codes of the k nearest labels)
+	"""
+	k = min(k, len(labeled))
+	if k == 0:
+		return
+
+	block_size = max(1, MAX_BLOCK_SIZE // max(1, labeled.size))
+	for start in range(0, len(queries), block_size):
+		distances = distance_block(queries[start:start + block_size], labeled)
+		kth = np.partition(distances, k - 1, axis=1)[:, k - 1]
+		for i, (row, bound) in enumerate(zip(distances, kth)):
+			candidates = np.flatnonzero(row <= bound)
+			codes = label_codes[candidates]
+			yield start + i, codes[np.lexsort((codes, row[candidates]))[:k]]
+
+
+def majority_label(labels):
+	"""
+	Function that applies the vote of the KNN job's reducer_3 to the labels of the nearest neighbours.
+	:param labels: the labels, in the order of nearest_labels
+	:return: the most common label; on a tie, the one that comes first
+	"""
+	return Counter(labels).most_common(1)[0][0]
+
+
+def k_smallest(candidate_lists, k):
+	"""
+	Function that merges lists of [distance, label] candidates into the k best ones, keeping only k of them in memory
+	at any time; the result is the same as sorting all the candidates and keeping the first k.
+	:param candidate_lists: generator of lists of [distance, label] candidates
+	:param k: number of candidates to keep
+	:return: list of the k [distance, label] candidates with the smallest distances, sorted
+	"""
+	return heapq.nsmallest(k, (candidate for candidates in candidate_lists for candidate in candidates))
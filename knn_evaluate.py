@@ -0,0 +1,165 @@
+"""
+n-fold cross-validation of the KNN classification over the labeled rows of a KNN input, for every k from 1 to
+--k-max at once.
+
+Every labeled row belongs to the fold id % --folds. For each fold, the rows of the fold are classified using the
+rows of the other folds; the distances are computed once per fold, the k-max nearest labels of each row are kept in
+the order of the KNN job, and each k is scored with the vote of reducer_3 over the first k of them, so the
+predictions for a given k are those KNNMapReduce --k k would make.
+
+The output has one line per k, with the accuracy over all the folds and the confusion matrix, as
+{true_label: {predicted_label: count}}.
+
+Usage: python knn_evaluate.py Iris.csv --scaling max-abs [--folds 5] [--k-max 30]
+"""
+import numpy as np
+from mrjob.job import MRJob
+from mrjob.step import MRStep
+
+from feature_stats import SCALINGS, Scaler, cached_stats
+from knn_distance import majority_label, nearest_labels, parse_features
+from job_rerun import rerun_with_args
+from knn_queries import is_query_row
+
+
+def merge_confusion(confusion, other):
+	"""
+	Function that adds the counts of a confusion matrix to another one.
+	:param confusion: {true_label: {predicted_label: count}}, updated in place
+	:param other: {true_label: {predicted_label: count}}
+	:return: confusion
+	"""
+	for true_label, predictions in other.items():
+		row = confusion.setdefault(true_label, {})
+		for predicted_label, count in predictions.items():
+			row[predicted_label] = row.get(predicted_label, 0) + count
+	return confusion
+
+
+class KNNEvaluation(MRJob):
+	FILES = ['feature_stats.py', 'job_rerun.py', 'knn_distance.py', 'knn_queries.py']
+
+	def configure_args(self):
+		super(KNNEvaluation, self).configure_args()
+		self.add_passthru_arg('--folds', type=int, default=5, help='number of folds of the cross-validation')
+		self.add_passthru_arg('--k-max', type=int, default=30, help='largest number of nearest neighbours evaluated')
+		self.add_passthru_arg('--scaling', choices=SCALINGS, default='none',
+							  help='scaling of the feature values, applied by the reducers (see feature_stats.py)')
+		self.add_file_arg('--stats',
+						  help='statistics of the input computed by feature_stats.py; by default, they are read from '
+							   'the cache next to the input, and computed if it is missing or stale')
+
+	def load_args(self, args):
+		super(KNNEvaluation, self).load_args(args)
+		if self.options.folds < 2:
+			self.arg_parser.error('--folds must be at least 2')
+		if self.options.k_max < 1:
+			self.arg_parser.error('--k-max must be at least 1')
+
+	def run_job(self):
+		if self.options.scaling != 'none' and self.options.stats is None:
+			if not self.options.args or '-' in self.options.args:
+				self.arg_parser.error('--stats is required when the input is read from stdin')
+			rerun_with_args(self, ['--stats', cached_stats(self.options.args)])
+		else:
+			super(KNNEvaluation, self).run_job()
+
+	def mapper_1(self, _, line):
+		"""
+		Mapper that sends every labeled row to every fold, as a test row of its own fold and as a training row of
+		the others.
+		:param _: None
+		:param line: the current line of the file
+		:return: (fold, [is_test, [id, features], species])
+		"""
+		aux = line.split(',')
+		if aux[0].isnumeric() and not is_query_row(aux):
+			own_fold = int(aux[0]) % self.options.folds
+			for fold in range(self.options.folds):
+				yield fold, [fold == own_fold, aux[:-1], aux[-1]]
+
+	def reducer_init_1(self):
+		"""
+		Loads the scaling of the feature values.
+		"""
+		self.scaler = Scaler(self.options.stats, self.options.scaling)
+
+	def reducer_1(self, fold, rows):
+		"""
+		Reducer that classifies the test rows of a fold with every k, using the training rows of the fold.
+		:param fold: the fold
+		:param rows: generator of [is_test, [id, features], species]
+		:return: (None, [k, confusion matrix of the fold]) for every k
+		"""
+		test, training = [], []
+		for is_test, features, species in rows:
+			(test if is_test else training).append((features, species))
+
+		# the codes of the labels sort like the labels, so that the neighbours are ordered like in the KNN job
+		label_names = sorted(set(species for _, species in training))
+		codes = {label: code for code, label in enumerate(label_names)}
+		training_features = self.scaler.transform(parse_features([features for features, _ in training])[1])
+		test_features = self.scaler.transform(parse_features([features for features, _ in test])[1])
+		label_codes = np.array([codes[species] for _, species in training], dtype=np.int32)
+
+		# the k_max nearest labels of each test row are found once; the prediction for each k is the vote over the
+		# first k of them
+		confusion = [{} for _ in range(self.options.k_max)]
+		if training and test:
+			for i, nearest in nearest_labels(test_features, training_features, label_codes, self.options.k_max):
+				true_label = test[i][1]
+				labels = [label_names[code] for code in nearest]
+				for k in range(1, len(labels) + 1):
+					row = confusion[k - 1].setdefault(true_label, {})
+					predicted_label = majority_label(labels[:k])
+					row[predicted_label] = row.get(predicted_label, 0) + 1
+
+		for k, matrix in enumerate(confusion, 1):
+			if matrix:
+				yield None, [k, matrix]
+
+	def combiner_2(self, _, matrices):
+		"""
+		Combiner that adds the confusion matrices of the same k.
+		:param _: None
+		:param matrices: generator of [k, confusion matrix]
+		:return: (None, [k, confusion matrix]) for every k
+		"""
+		for k, matrix in self.merge_matrices(matrices):
+			yield None, [k, matrix]
+
+	def reducer_2(self, _, matrices):
+		"""
+		Reducer that adds the confusion matrices of all the folds and scores every k.
+		:param _: None
+		:param matrices: generator of [k, confusion matrix]
+		:return: (k, {'accuracy', 'correct', 'total', 'confusion'}), by increasing k
+		"""
+		for k, matrix in self.merge_matrices(matrices):
+			correct = sum(predictions.get(true_label, 0) for true_label, predictions in matrix.items())
+			total = sum(sum(predictions.values()) for predictions in matrix.values())
+			yield k, {'accuracy': correct / total, 'correct': correct, 'total': total, 'confusion': matrix}
+
+	def merge_matrices(self, matrices):
+		"""
+		Function that adds the confusion matrices of the same k.
+		:param matrices: generator of [k, confusion matrix]
+		:return: sorted list of (k, confusion matrix)
+		"""
+		merged = {}
+		for k, matrix in matrices:
+			merge_confusion(merged.setdefault(k, {}), matrix)
+		return sorted(merged.items())
+
+	def steps(self):
+		return [
+			MRStep(mapper=self.mapper_1,
+				   reducer_init=self.reducer_init_1,
+				   reducer=self.reducer_1),
+			MRStep(combiner=self.combiner_2,
+				   reducer=self.reducer_2)
+		]
+
+
+if __name__ == '__main__':
+	KNNEvaluation.run()
@@ -0,0 +1,83 @@
+"""
+Side-input file with the unlabeled rows (the queries) of the KNN jobs. Every mapper reads it from its working
+directory instead of relying on a variable set by a reducer, which only works when the whole job runs in one process.
+
+Usage: python knn_queries.py Iris_normalized.csv queries.csv
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+from job_rerun import rerun_with_args
+
+
+def is_query_row(fields):
+	"""
+	Function that checks whether a split CSV line is an unlabeled row.
+	:param fields: the values of the line
+	:return: True if the line has an id and no species, False otherwise (e.g. the header or a labeled row)
+	"""
+	return fields[0].isnumeric() and fields[-1].strip() == ''
+
+
+def write_query_file(input_paths, query_path):
+	"""
+	Function that copies the unlabeled rows of one or more CSV files to a query file.
+	:param input_paths: list of paths of the CSV files
+	:param query_path: path of the query file
+	:return: the number of queries
+	"""
+	count = 0
+	with open(query_path, 'w') as out:
+		for path in input_paths:
+			with open(path) as f:
+				for line in f:
+					if is_query_row(line.rstrip('\r\n').split(',')):
+						out.write(line.rstrip('\r\n') + '\n')
+						count += 1
+	return count
+
+
+def load_queries(query_path):
+	"""
+	Function that reads a query file.
+	:param query_path: path of the query file
+	:return: list of [id, features] lists of strings, like the values of mapper_1
+	"""
+	with open(query_path) as f:
+		return [line.rstrip('\r\n').split(',')[:-1] for line in f if line.strip()]
+
+
+def block_bounds(num_queries, block_size):
+	"""
+	Function that splits the queries into blocks of consecutive rows.
+	:param num_queries: number of queries
+	:param block_size: maximum number of queries per block; 0 puts all the queries in one block
+	:return: list of (start, stop) pairs
+	"""
+	if block_size <= 0:
+		block_size = max(num_queries, 1)
+	return [(start, min(start + block_size, num_queries)) for start in range(0, num_queries, block_size)]
+
+
+def run_with_query_file(job):
+	"""
+	Function that runs a KNN job that was started without --queries: the unlabeled rows of its input are extracted
+	into a temporary query file and the job is run again with it.
+	:param job: the KNN job, in the driver process
+	"""
+	if not job.options.args or '-' in job.options.args:
+		job.arg_parser.error('--queries is required when the input is read from stdin')
+
+	tmp_dir = tempfile.mkdtemp()
+	try:
+		query_path = os.path.join(tmp_dir, 'queries.csv')
+		write_query_file(job.options.args, query_path)
+		rerun_with_args(job, ['--queries', query_path])
+	finally:
+		shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+	print(write_query_file(sys.argv[1:-1], sys.argv[-1]))
@@ -0,0 +1,395 @@
+"""
+Long-lived KNN prediction server, so that classifying a new sample does not mean running the three steps of
+KNNMapReduce over the whole labeled file.
+
+The labeled rows are read once into a float array; every prediction uses the k labeled rows closest to the sample
+and the same majority vote as reducer_3, so a sample gets the label the job would give it. Concurrent requests are
+gathered into micro-batches, which are scored with a single NumPy distance computation: a batch is closed when it
+holds --max-batch samples or when its first request has waited --max-delay-ms milliseconds.
+
+Endpoints, over HTTP on --port or on the Unix socket --unix:
+- POST /predict with {"features": [f1, ..., fn]} or {"features": [[f1, ..., fn], ...]}, answered with
+  {"labels": [label, ...]}
+- GET /stats, answered with the number of requests, predictions and batches, the p50/p99 latency of the last
+  requests in milliseconds and the throughput in predictions per second of the time spent serving
+  requests (the time during which at least one request was waiting or being scored)
+
+Usage: python knn_server.py serve Iris_normalized.csv [--port 8000 | --unix PATH] [--k 15] [--max-batch 64]
+	   python knn_server.py bench Iris_normalized.csv [--port 8000 | --unix PATH] [--requests 2000] [--concurrency 16]
+"""
+import argparse
+import http.client
+import json
+import queue
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from feature_stats import SCALINGS, Scaler
+from knn_distance import majority_label, nearest_labels, parse_features
+from knn_queries import is_query_row
+
+
+class KNNModel:
+	"""
+	The labeled rows of a KNN input, held in memory as a float array and an array of label codes.
+	"""
+
+	def __init__(self, labeled_path, k=15, scaler=None):
+		"""
+		:param labeled_path: path of the CSV file; its unlabeled rows are ignored
+		:param k: number of nearest neighbours used to classify a sample
+		:param scaler: the feature_stats.Scaler applied to the labeled rows and to the samples
+		"""
+		rows, labels = [], []
+		with open(labeled_path) as f:
+			for line in f:
+				aux = line.rstrip('\r\n').split(',')
+				if aux[0].isnumeric() and not is_query_row(aux):
+					rows.append(aux[:-1])
+					labels.append(aux[-1])
+		if not rows:
+			raise ValueError('%s has no labeled rows' % labeled_path)
+
+		self.scaler = scaler or Scaler()
+		self.features = self.scaler.transform(parse_features(rows)[1])
+		# the codes follow the alphabetical order of the labels, so that sorting by code sorts by label like the job
+		self.label_names = sorted(set(labels))
+		codes = {label: code for code, label in enumerate(self.label_names)}
+		self.label_codes = np.array([codes[label] for label in labels], dtype=np.int32)
+		self.k = min(k, len(labels))
+
+	@property
+	def num_features(self):
+		return self.features.shape[1]
+
+	def predict(self, samples):
+		"""
+		Function that classifies a batch of samples.
+		:param samples: float array of shape (rows, num_features), not scaled yet
+		:return: list of labels, in the same order
+		"""
+		nearest = nearest_labels(self.scaler.transform(samples), self.features, self.label_codes, self.k)
+		return [majority_label(self.label_names[code] for code in codes) for _, codes in nearest]
+
+
+class PendingRequest:
+	"""
+	A request waiting in the queue of a MicroBatcher.
+	"""
+
+	def __init__(self, samples):
+		"""
+		:param samples: float array of shape (rows, num_features)
+		"""
+		self.samples = samples
+		self.arrived = time.perf_counter()
+		self.done = threading.Event()
+		self.labels = None
+		self.error = None
+
+
+class MicroBatcher:
+	"""
+	Gathers the samples of concurrent requests into batches scored by one thread, and keeps the latency and
+	throughput statistics of the requests.
+	"""
+
+	def __init__(self, model, max_batch=64, max_delay=0.002, window=10000):
+		"""
+		:param model: the KNNModel
+		:param max_batch: maximum number of samples in a batch
+		:param max_delay: maximum time, in seconds, the first request of a batch waits for others
+		:param window: number of recent requests the latency percentiles are computed over
+		"""
+		self.model = model
+		self.max_batch = max_batch
+		self.max_delay = max_delay
+		self.queue = queue.Queue()
+		self.lock = threading.Lock()
+		self.latencies = deque(maxlen=window)
+		self.requests = 0
+		self.predictions = 0
+		self.batches = 0
+		# time during which at least one request was waiting or being scored, and when the last batch finished
+		self.serving_time = 0.0
+		self.last_finished = 0.0
+		threading.Thread(target=self.run, daemon=True).start()
+
+	def predict(self, samples):
+		"""
+		Function that classifies samples, waiting for the batch they are put in.
+		:param samples: float array of shape (rows, num_features)
+		:return: list of labels, in the same order
+		"""
+		request = PendingRequest(samples)
+		self.queue.put(request)
+		request.done.wait()
+		if request.error is not None:
+			raise request.error
+		return request.labels
+
+	def next_batch(self):
+		"""
+		Function that waits for a request and gathers the requests that arrive until the batch is full or the first
+		request has waited long enough.
+		:return: list of PendingRequest
+		"""
+		batch = [self.queue.get()]
+		size = len(batch[0].samples)
+		deadline = batch[0].arrived + self.max_delay
+		while size < self.max_batch:
+			# once the delay is over, the requests that are already waiting still join the batch
+			timeout = deadline - time.perf_counter()
+			try:
+				request = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+			except queue.Empty:
+				break
+			batch.append(request)
+			size += len(request.samples)
+		return batch
+
+	def run(self):
+		"""
+		Function that scores the batches, forever; it runs in a thread of its own.
+		"""
+		while True:
+			batch = self.next_batch()
+			try:
+				labels = self.model.predict(np.concatenate([request.samples for request in batch]))
+			except Exception as e:
+				for request in batch:
+					request.error = e
+					request.done.set()
+				continue
+
+			finished = time.perf_counter()
+			start = 0
+			with self.lock:
+				# the requests that arrived while the previous batch was scored were already counted
+				self.serving_time += finished - max(min(request.arrived for request in batch), self.last_finished)
+				self.last_finished = finished
+				for request in batch:
+					request.labels = labels[start:start + len(request.samples)]
+					start += len(request.samples)
+					self.latencies.append(finished - request.arrived)
+				self.requests += len(batch)
+				self.predictions += len(labels)
+				self.batches += 1
+			for request in batch:
+				request.done.set()
+
+	def stats(self):
+		"""
+		Function that summarizes the requests served so far.
+		:return: dictionary of statistics
+		"""
+		with self.lock:
+			latencies = np.array(self.latencies) * 1000
+			return {
+				'requests': self.requests,
+				'predictions': self.predictions,
+				'batches': self.batches,
+				'mean_batch_size': self.predictions / self.batches if self.batches else 0.0,
+				'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+				'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+				'throughput_per_s': self.predictions / self.serving_time if self.serving_time else 0.0,
+			}
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+	"""
+	HTTP handler of the /predict and /stats endpoints; the server has a batcher attribute.
+	"""
+	# keep-alive connections, so that a client does not pay for a new connection on every prediction
+	protocol_version = 'HTTP/1.1'
+	# the headers and the body are written separately; with Nagle's algorithm, the body would wait for the client's
+	# delayed acknowledgement of the headers
+	disable_nagle_algorithm = True
+
+	def send_json(self, status, body):
+		data = json.dumps(body).encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def do_GET(self):
+		if self.path == '/stats':
+			self.send_json(200, self.server.batcher.stats())
+		else:
+			self.send_json(404, {'error': 'unknown path %s' % self.path})
+
+	def do_POST(self):
+		body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+		if self.path != '/predict':
+			self.send_json(404, {'error': 'unknown path %s' % self.path})
+			return
+
+		num_features = self.server.batcher.model.num_features
+		try:
+			samples = np.array(json.loads(body)['features'], dtype=np.float64)
+			samples = samples.reshape(-1, num_features) if samples.size else samples.reshape(0, num_features)
+			if samples.shape[1] != num_features:
+				raise ValueError
+		except (KeyError, TypeError, ValueError):
+			self.send_json(400, {'error': 'expected {"features": [...]} with %d values per sample' % num_features})
+			return
+
+		try:
+			labels = self.server.batcher.predict(samples) if len(samples) else []
+		except Exception as e:
+			self.send_json(500, {'error': 'prediction failed: %s' % e})
+			return
+		self.send_json(200, {'labels': labels})
+
+	def log_message(self, format, *args):
+		# one log line per prediction would cost more than the prediction itself
+		pass
+
+
+class UnixPredictionHandler(PredictionHandler):
+	# Unix sockets have no Nagle's algorithm to disable
+	disable_nagle_algorithm = False
+
+
+class PredictionServer(ThreadingHTTPServer):
+	# the default backlog of 5 connections resets the clients that connect at the same time
+	request_queue_size = 128
+
+
+class UnixPredictionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+	daemon_threads = True
+	request_queue_size = 128
+
+
+def make_server(batcher, port=8000, unix_path=None):
+	"""
+	Function that creates the server of the endpoints.
+	:param batcher: the MicroBatcher
+	:param port: TCP port on localhost, used when unix_path is not given
+	:param unix_path: path of a Unix socket
+	:return: the server, not started yet
+	"""
+	if unix_path:
+		server = UnixPredictionServer(unix_path, UnixPredictionHandler)
+	else:
+		server = PredictionServer(('127.0.0.1', port), PredictionHandler)
+	server.batcher = batcher
+	return server
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+	"""
+	HTTP connection over a Unix socket, for the benchmark client.
+	"""
+
+	def __init__(self, unix_path):
+		super(UnixHTTPConnection, self).__init__('localhost')
+		self.unix_path = unix_path
+
+	def connect(self):
+		self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.sock.connect(self.unix_path)
+
+
+def request_json(connection, method, path, body=None):
+	"""
+	Function that sends a request to the server and decodes its answer.
+	:param connection: an open http.client connection
+	:param method: 'GET' or 'POST'
+	:param path: the endpoint
+	:param body: the JSON body, for POST
+	:return: the decoded answer
+	"""
+	data = json.dumps(body).encode('utf-8') if body is not None else None
+	connection.request(method, path, body=data, headers={'Content-Type': 'application/json'})
+	return json.loads(connection.getresponse().read())
+
+
+def run_bench(samples, connect, num_requests, concurrency):
+	"""
+	Function that sends single-sample predictions from several threads at once.
+	:param samples: list of feature lists, sent in turn
+	:param connect: function that opens a connection to the server
+	:param num_requests: total number of requests
+	:param concurrency: number of client threads
+	:return: (client-side latencies in milliseconds, seconds)
+	"""
+	latencies = []
+	lock = threading.Lock()
+
+	def client(offset):
+		connection = connect()
+		own = []
+		for i in range(offset, num_requests, concurrency):
+			start = time.perf_counter()
+			request_json(connection, 'POST', '/predict', {'features': samples[i % len(samples)]})
+			own.append((time.perf_counter() - start) * 1000)
+		connection.close()
+		with lock:
+			latencies.extend(own)
+
+	start = time.perf_counter()
+	threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	return latencies, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Serve KNN predictions, or benchmark a running server.')
+	parser.add_argument('command', choices=['serve', 'bench'])
+	parser.add_argument('input', help='CSV file with the labeled rows; bench sends the feature values of its rows')
+	parser.add_argument('--port', type=int, default=8000, help='TCP port on localhost')
+	parser.add_argument('--unix', help='path of a Unix socket, used instead of the TCP port')
+	parser.add_argument('--k', type=int, default=15, help='number of nearest neighbours used to classify a sample')
+	parser.add_argument('--scaling', choices=SCALINGS, default='none', help='scaling of the feature values')
+	parser.add_argument('--stats', help='statistics file of the input (see feature_stats.py), needed for scaling')
+	parser.add_argument('--max-batch', type=int, default=64, help='maximum number of samples in a batch')
+	parser.add_argument('--max-delay-ms', type=float, default=2.0,
+						help='maximum time the first request of a batch waits for others')
+	parser.add_argument('--requests', type=int, default=2000, help='number of requests sent by bench')
+	parser.add_argument('--concurrency', type=int, default=16, help='number of client threads of bench')
+	args = parser.parse_args()
+	if args.k < 1:
+		parser.error('--k must be at least 1')
+
+	if args.command == 'serve':
+		if args.scaling != 'none' and not args.stats:
+			from feature_stats import cached_stats
+			args.stats = cached_stats([args.input])
+		model = KNNModel(args.input, args.k, Scaler(args.stats, args.scaling))
+		server = make_server(MicroBatcher(model, args.max_batch, args.max_delay_ms / 1000), args.port, args.unix)
+		print('serving %d labeled rows on %s' % (len(model.label_codes), args.unix or 'port %d' % args.port))
+		try:
+			server.serve_forever()
+		except KeyboardInterrupt:
+			pass
+		finally:
+			server.server_close()
+	else:
+		with open(args.input) as f:
+			rows = [line.rstrip('\r\n').split(',') for line in f]
+		samples = [[float(value) for value in row[1:-1]] for row in rows if row[0].isnumeric()]
+
+		def connect():
+			if args.unix:
+				return UnixHTTPConnection(args.unix)
+			return http.client.HTTPConnection('127.0.0.1', args.port)
+
+		latencies, seconds = run_bench(samples, connect, args.requests, args.concurrency)
+		print('client: %d requests in %.3f s, %.0f requests/s, p50 %.2f ms, p99 %.2f ms'
+			  % (len(latencies), seconds, len(latencies) / seconds, np.percentile(latencies, 50),
+				 np.percentile(latencies, 99)))
+		connection = connect()
+		print('server: %s' % json.dumps(request_json(connection, 'GET', '/stats')))
+		connection.close()
@@ -0,0 +1,215 @@
+"""
+Compressed sparse row (CSR) form of the inverted web graph of task2.py, so that the in-links of a page are read from
+memory-mapped arrays in constant time, instead of parsing the JSON output of InvertWebLink.
+
+A graph is a single file:
+- the magic bytes LINKCSR1, then the length of the header as a little-endian 64-bit integer;
+- the header, a JSON object with the number of nodes (the pages with at least one in-link), of edges and the largest
+  page ID; it is padded with spaces so the arrays start on a 64-byte boundary;
+- nodes, int32, the IDs of the pages with in-links, sorted;
+- offsets, int64, nodes + 1 values: the in-links of nodes[i] are sources[offsets[i]:offsets[i + 1]];
+- sources, int32, the IDs of the pages linking to each node, sorted for each node;
+- positions, int32, for every page ID from 0 to the largest one, its position in nodes, or -1 if it has no in-link.
+Every array starts on a 64-byte boundary and is read with numpy.memmap.
+
+Usage:
+	python task2.py web-Google.txt --csr web-Google.csr
+	python link_graph.py convert inverted_output.txt [...] web-Google.csr
+	python link_graph.py in-links web-Google.csr 11342 [824020 ...]
+"""
+import argparse
+import json
+import struct
+from array import array
+
+import numpy as np
+
+MAGIC = b'LINKCSR1'
+ALIGNMENT = 64
+
+
+def aligned(size):
+	"""
+	Function that rounds a size in bytes up to the alignment of the arrays.
+	:param size: number of bytes
+	:return: the smallest multiple of ALIGNMENT that is at least size
+	"""
+	return -(-size // ALIGNMENT) * ALIGNMENT
+
+
+def array_layout(header, data_start):
+	"""
+	Function that computes where each array of a graph starts.
+	:param header: the header of the graph
+	:param data_start: position of the first array, right after the header
+	:return: list of (name, dtype, length, offset)
+	"""
+	layout = []
+	offset = data_start
+	for name, dtype, length in [('nodes', np.dtype('<i4'), header['nodes']),
+								('offsets', np.dtype('<i8'), header['nodes'] + 1),
+								('sources', np.dtype('<i4'), header['edges']),
+								('positions', np.dtype('<i4'), header['max_id'] + 1)]:
+		layout.append((name, dtype, length, offset))
+		offset += aligned(length * dtype.itemsize)
+	return layout
+
+
+def create_graph(header, graph_path):
+	"""
+	Function that writes the magic bytes and the header of a graph, and makes the file large enough for its arrays.
+	:param header: the header of the graph
+	:param graph_path: path of the graph
+	:return: the layout of the arrays, as returned by array_layout
+	"""
+	encoded = json.dumps(header).encode('utf-8')
+	data_start = aligned(len(MAGIC) + 8 + len(encoded))
+	encoded = encoded.ljust(data_start - len(MAGIC) - 8)
+	layout = array_layout(header, data_start)
+	with open(graph_path, 'wb') as out:
+		out.write(MAGIC + struct.pack('<Q', len(encoded)) + encoded)
+		_, dtype, length, offset = layout[-1]
+		out.truncate(offset + aligned(length * dtype.itemsize))
+	return layout
+
+
+def parse_output_line(line):
+	"""
+	Function that reads a line of the text output of InvertWebLink, without a JSON parser.
+	:param line: 'to_id<tab>[from_ids]', as bytes; the IDs are JSON integers, or strings with the line-by-line mapper
+	:return: (to_id, int64 array of the from_ids, in the order of the line)
+	"""
+	to_id, from_ids = line.split(b'\t', 1)
+	from_ids = from_ids.strip().strip(b'[]').replace(b'"', b'')
+	if not from_ids.strip():
+		return int(to_id.strip(b'"')), np.empty(0, dtype=np.int64)
+	# int() raises on anything but an integer, so a malformed line is not read silently
+	return int(to_id.strip(b'"')), np.array([int(from_id) for from_id in from_ids.split(b',')], dtype=np.int64)
+
+
+def output_records(output_paths):
+	"""
+	Function that reads the text output of InvertWebLink.
+	:param output_paths: paths of the output files, e.g. the part-* files of the reducers
+	:return: generator of (to_id, int64 array of the from_ids)
+	"""
+	for output_path in output_paths:
+		with open(output_path, 'rb') as f:
+			for line in f:
+				if line.strip():
+					yield parse_output_line(line)
+
+
+def write_output_graph(output_paths, graph_path):
+	"""
+	Function that writes the CSR form of the inverted graph in the output files of InvertWebLink, in two passes over
+	them, so that the in-links are written straight to the memory-mapped arrays instead of being kept in memory. The
+	in-links of a page may be on several lines, in any of the files, as long as their ranges of IDs do not overlap, like
+	the sub-partitions of task2.py --hot-threshold: the lines of a page are put one after the other by their smallest ID.
+	:param output_paths: paths of the output files
+	:param graph_path: path of the graph
+	:return: (number of nodes, number of edges)
+	"""
+	# the first pass reads the nodes, the number and the smallest of the in-links of every line, so the arrays can be
+	# laid out before any in-link is written
+	record_nodes, counts, firsts = array('q'), array('q'), array('q')
+	max_id = -1
+	for to_id, from_ids in output_records(output_paths):
+		record_nodes.append(to_id)
+		counts.append(len(from_ids))
+		firsts.append(int(from_ids.min()) if len(from_ids) else -1)
+		max_id = max(max_id, to_id, int(from_ids.max(initial=-1)))
+	record_nodes = np.frombuffer(record_nodes, dtype=np.int64)
+	counts = np.frombuffer(counts, dtype=np.int64)
+
+	order = np.lexsort((np.frombuffer(firsts, dtype=np.int64), record_nodes))
+	record_ends = np.cumsum(counts[order])
+	# position of the in-links of each line of the output in sources
+	record_offsets = np.empty(len(record_nodes), dtype=np.int64)
+	record_offsets[order] = record_ends - counts[order]
+	sorted_nodes = record_nodes[order]
+	first_records = np.flatnonzero(np.concatenate(([True], sorted_nodes[1:] != sorted_nodes[:-1])))
+	nodes = sorted_nodes[first_records]
+	edges = int(record_ends[-1]) if len(record_ends) else 0
+	offsets = np.concatenate((record_offsets[order][first_records], [edges]))
+
+	header = {'nodes': len(nodes), 'edges': edges, 'max_id': max_id}
+	arrays = {name: np.memmap(graph_path, dtype, 'r+', offset, (length,))
+			  for name, dtype, length, offset in create_graph(header, graph_path) if length}
+	if len(nodes):
+		arrays['nodes'][:] = nodes
+		arrays['positions'][:] = -1
+		arrays['positions'][nodes] = np.arange(len(nodes))
+	arrays['offsets'][:] = offsets
+
+	# the second pass writes the in-links of each line, sorted, at the position of the line
+	for record_offset, (_, from_ids) in zip(record_offsets.tolist(), output_records(output_paths)):
+		if len(from_ids):
+			arrays['sources'][record_offset:record_offset + len(from_ids)] = np.sort(from_ids)
+	for values in arrays.values():
+		values.flush()
+	return len(nodes), edges
+
+
+class InvertedGraph:
+	"""
+	Read-only view of a graph, with its arrays memory-mapped.
+	"""
+
+	def __init__(self, graph_path):
+		"""
+		:param graph_path: path of the graph
+		"""
+		with open(graph_path, 'rb') as f:
+			if f.read(len(MAGIC)) != MAGIC:
+				raise ValueError('%s is not an inverted link graph' % graph_path)
+			header_size, = struct.unpack('<Q', f.read(8))
+			self.header = json.loads(f.read(header_size))
+
+		for name, dtype, length, offset in array_layout(self.header, len(MAGIC) + 8 + header_size):
+			# a memory map cannot be empty
+			if length:
+				setattr(self, name, np.memmap(graph_path, dtype, 'r', offset, (length,)))
+			else:
+				setattr(self, name, np.empty(0, dtype))
+
+	def __len__(self):
+		return self.header['nodes']
+
+	def in_links(self, node):
+		"""
+		Function that returns the pages linking to a page.
+		:param node: the ID of the page
+		:return: int32 array of the IDs of the pages, sorted; empty if the page has no in-link
+		"""
+		position = self.positions[node] if 0 <= node < len(self.positions) else -1
+		if position < 0:
+			return self.sources[:0]
+		return self.sources[self.offsets[position]:self.offsets[position + 1]]
+
+	def in_degree(self, node):
+		"""
+		Function that returns the number of pages linking to a page.
+		:param node: the ID of the page
+		:return: the number of in-links
+		"""
+		return len(self.in_links(node))
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Write the CSR form of an inverted web graph, or query one.')
+	subparsers = parser.add_subparsers(dest='command', required=True)
+	convert_parser = subparsers.add_parser('convert', help='convert the text output of InvertWebLink')
+	convert_parser.add_argument('output', nargs='+', help='text output of InvertWebLink, e.g. its part-* files')
+	convert_parser.add_argument('graph', help='path of the graph')
+	in_links_parser = subparsers.add_parser('in-links', help='print the in-links of some pages')
+	in_links_parser.add_argument('graph', help='path of the graph')
+	in_links_parser.add_argument('nodes', type=int, nargs='+', help='IDs of the pages')
+	args = parser.parse_args()
+
+	if args.command == 'convert':
+		print('%d nodes, %d edges' % write_output_graph(args.output, args.graph))
+	else:
+		graph = InvertedGraph(args.graph)
+		for node in args.nodes:
+			print('%d\t%s' % (node, ' '.join(map(str, graph.in_links(node).tolist()))))
@@ -0,0 +1,297 @@
+from fractions import Fraction
+import functools
+import math
+from mrjob.job import MRJob
+from mrjob.step import MRStep
+import numpy as np
+
+from matrix_store import open_matrix, run_with_block_file
+
+# the metrics the job can return, in the order they are returned
+METRICS = ['frobenius', 'max_abs', 'one_norm', 'inf_norm', 'row_sums', 'col_sums', 'nnz', 'nan_count', 'inf_count']
+
+
+def exact_sums(values):
+	"""
+	Function that converts floats to exact sums, so that they can be added in any order with the same result: the
+	finite values become fractions, and the infinite and NaN values, which no fraction can hold, are kept apart.
+	:param values: iterable of floats
+	:return: list of (Fraction, non-finite part), where the non-finite part is 0.0, inf, -inf or nan
+	"""
+	return [(Fraction(value), 0.0) if math.isfinite(value) else (Fraction(0), value) for value in map(float, values)]
+
+
+def add_sums(sums, other):
+	"""
+	Function that adds two lists of exact sums, element by element.
+	:param sums: list of exact sums, or None if there is nothing to add yet
+	:param other: list of exact sums
+	:return: the list of the sums
+	"""
+	if sums is None:
+		return list(other)
+	# the non-finite parts are added as floats: inf + -inf is nan, and nan + anything is nan, in any order
+	return [(a + b, a_non_finite + b_non_finite) for (a, a_non_finite), (b, b_non_finite) in zip(sums, other)]
+
+
+def sum_value(exact_sum):
+	"""
+	Function that rounds an exact sum to a float.
+	:param exact_sum: (Fraction, non-finite part)
+	:return: the float, inf, -inf or nan if a non-finite value was added
+	"""
+	fraction, non_finite = exact_sum
+	return non_finite if non_finite != 0 else float(fraction)
+
+
+def max_value(a, b):
+	"""
+	Function that returns the largest of two floats, or nan if one of them is nan, whatever their order; the built-in
+	max depends on the order of its arguments when one of them is nan.
+	:param a: float
+	:param b: float
+	:return: float
+	"""
+	return math.nan if math.isnan(a) or math.isnan(b) else max(a, b)
+
+
+class MatrixPartial:
+	"""
+	Mergeable partial aggregates of some blocks of rows of a matrix, for the requested metrics.
+
+	Within a block, the sums are computed with NumPy's pairwise summation, so they only depend on the rows of the
+	block; the sums of different blocks are added as exact fractions and rounded once at the end, so the results only
+	depend on the size of the blocks, not on how the blocks are spread across the mappers and combiners.
+
+	The NaN and infinite elements are counted, and they make the metrics they are part of nan or infinite, like with
+	floats: e.g. a NaN element makes the Frobenius norm, max_abs and the sums of its row and of its column nan.
+	"""
+
+	def __init__(self, metrics):
+		"""
+		:param metrics: list of names of METRICS
+		"""
+		self.metrics = metrics
+		self.sum_squares = (Fraction(0), 0.0)
+		self.max_abs = 0.0
+		self.col_sums = None
+		self.col_abs_sums = None
+		self.max_row_abs_sum = 0.0
+		# list of [start, [sums of the rows start, start + 1, ...]]
+		self.row_sums = []
+		self.nnz = 0
+		self.nan_count = 0
+		self.inf_count = 0
+
+	def update(self, start, block):
+		"""
+		Function that adds a block of rows.
+		:param start: the index of the first row of the block
+		:param block: float array of shape (rows, columns)
+		"""
+		block = np.asarray(block, dtype=np.float64)
+		if not block.size:
+			return
+		absolute = np.abs(block)
+		if 'frobenius' in self.metrics:
+			self.sum_squares = add_sums([self.sum_squares], exact_sums([np.sum(block * block)]))[0]
+		if 'max_abs' in self.metrics:
+			self.max_abs = max_value(self.max_abs, float(absolute.max()))
+		if 'one_norm' in self.metrics:
+			self.col_abs_sums = add_sums(self.col_abs_sums, exact_sums(absolute.sum(axis=0)))
+		if 'inf_norm' in self.metrics:
+			self.max_row_abs_sum = max_value(self.max_row_abs_sum, float(absolute.sum(axis=1).max()))
+		if 'row_sums' in self.metrics:
+			self.row_sums.append([start, block.sum(axis=1).tolist()])
+		if 'col_sums' in self.metrics:
+			self.col_sums = add_sums(self.col_sums, exact_sums(block.sum(axis=0)))
+		if 'nnz' in self.metrics:
+			self.nnz += int(np.count_nonzero(block))
+		if 'nan_count' in self.metrics:
+			self.nan_count += int(np.count_nonzero(np.isnan(block)))
+		if 'inf_count' in self.metrics:
+			self.inf_count += int(np.count_nonzero(np.isinf(block)))
+
+	def merge(self, other):
+		"""
+		Function that adds the partial aggregates of other blocks.
+		:param other: MatrixPartial of the same metrics
+		"""
+		self.sum_squares = add_sums([self.sum_squares], [other.sum_squares])[0]
+		self.max_abs = max_value(self.max_abs, other.max_abs)
+		if other.col_abs_sums is not None:
+			self.col_abs_sums = add_sums(self.col_abs_sums, other.col_abs_sums)
+		self.max_row_abs_sum = max_value(self.max_row_abs_sum, other.max_row_abs_sum)
+		self.row_sums.extend(other.row_sums)
+		if other.col_sums is not None:
+			self.col_sums = add_sums(self.col_sums, other.col_sums)
+		self.nnz += other.nnz
+		self.nan_count += other.nan_count
+		self.inf_count += other.inf_count
+
+	def to_dict(self):
+		"""
+		Function that converts the partial aggregates to a JSON-serializable form; the fractions are written as
+		strings, since their numerators and denominators may not fit in 64 bits.
+		:return: dictionary
+		"""
+		def fractions(values):
+			return None if values is None else [[str(value), non_finite] for value, non_finite in values]
+
+		return {'metrics': self.metrics, 'sum_squares': fractions([self.sum_squares])[0], 'max_abs': self.max_abs,
+				'col_abs_sums': fractions(self.col_abs_sums), 'max_row_abs_sum': self.max_row_abs_sum,
+				'row_sums': self.row_sums, 'col_sums': fractions(self.col_sums), 'nnz': self.nnz,
+				'nan_count': self.nan_count, 'inf_count': self.inf_count}
+
+	@classmethod
+	def from_dict(cls, data):
+		"""
+		Function that rebuilds partial aggregates written by to_dict.
+		:param data: dictionary
+		:return: MatrixPartial
+		"""
+		def fractions(values):
+			return None if values is None else [(Fraction(value), non_finite) for value, non_finite in values]
+
+		partial = cls(data['metrics'])
+		partial.sum_squares = fractions([data['sum_squares']])[0]
+		partial.max_abs = data['max_abs']
+		partial.col_abs_sums = fractions(data['col_abs_sums'])
+		partial.max_row_abs_sum = data['max_row_abs_sum']
+		partial.row_sums = data['row_sums']
+		partial.col_sums = fractions(data['col_sums'])
+		partial.nnz = data['nnz']
+		partial.nan_count = data['nan_count']
+		partial.inf_count = data['inf_count']
+		return partial
+
+	def results(self):
+		"""
+		Function that computes the requested metrics.
+		:return: list of (metric, value), in the order of METRICS
+		"""
+		values = {
+			'frobenius': lambda: math.sqrt(sum_value(self.sum_squares)),
+			'max_abs': lambda: self.max_abs,
+			'one_norm': lambda: functools.reduce(max_value, map(sum_value, self.col_abs_sums or []), 0.0),
+			'inf_norm': lambda: self.max_row_abs_sum,
+			'row_sums': lambda: [value for _, sums in sorted(self.row_sums) for value in sums],
+			'col_sums': lambda: [sum_value(value) for value in self.col_sums or []],
+			'nnz': lambda: self.nnz,
+			'nan_count': lambda: self.nan_count,
+			'inf_count': lambda: self.inf_count,
+		}
+		return [(metric, values[metric]()) for metric in METRICS if metric in self.metrics]
+
+
+class MatrixStats(MRJob):
+	"""
+	In this class, I generalize the Frobenius norm jobs: several statistics of the matrix are calculated with a single
+	read of its binary form (see matrix_store.py), like in FrobeniusNormBlocks. Each mapper returns one
+	MatrixPartial with the blocks it read, the combiners and the reducer merge them, and the reducer returns one
+	(metric, value) pair for each requested metric:
+	- frobenius: the Frobenius norm, sqrt(sum(|a_ij|^2))
+	- max_abs: max(|a_ij|)
+	- one_norm: the largest sum of the absolute values of a column
+	- inf_norm: the largest sum of the absolute values of a row
+	- row_sums, col_sums: the lists of the sums of the rows and of the columns
+	- nnz: the number of elements that are not 0
+	- nan_count, inf_count: the numbers of NaN and of infinite elements
+
+	Usage: python matrix_stats.py --matrix A.npy [--metrics frobenius,one_norm] [--block-rows 256] [block_file]
+	"""
+	FILES = ['job_rerun.py', 'matrix_store.py']
+
+	def configure_args(self):
+		super(MatrixStats, self).configure_args()
+		self.add_file_arg('--matrix', help='the matrix, as a .npy file written by matrix_store.py')
+		self.add_passthru_arg('--block-rows', type=int, default=256,
+							  help='number of rows per block when the block file is written by the job; the results '
+								   'are the same for the same number of rows per block')
+		self.add_passthru_arg('--metrics', default=','.join(METRICS),
+							  help='comma-separated metrics to calculate, among %s' % ', '.join(METRICS))
+
+	def run_job(self):
+		if self.options.matrix is None:
+			self.arg_parser.error('--matrix is required')
+		unknown = set(self.metrics()) - set(METRICS)
+		if unknown:
+			self.arg_parser.error('unknown metrics: %s' % ', '.join(sorted(unknown)))
+		if self.options.args:
+			super(MatrixStats, self).run_job()
+		else:
+			run_with_block_file(self)
+
+	def metrics(self):
+		"""
+		Function that returns the requested metrics.
+		:return: list of names of METRICS
+		"""
+		return [metric for metric in self.options.metrics.split(',') if metric]
+
+	def mapper_init_1(self):
+		"""
+		Opens the memory-mapped matrix and starts the partial aggregates of the mapper.
+		"""
+		self.matrix = open_matrix(self.options.matrix)
+		self.partial = MatrixPartial(self.metrics())
+
+	def mapper_1(self, _, line):
+		"""
+		Mapper that reads a line of the block file and adds the block to the partial aggregates of the mapper.
+		:param _: None
+		:param line: 'start stop', the rows of the block
+		"""
+		start, stop = map(int, line.split())
+		self.partial.update(start, self.matrix[start:stop])
+		return iter(())
+
+	def mapper_final_1(self):
+		"""
+		Returns the partial aggregates of all the blocks of the mapper.
+		:return: (None, partial)
+		"""
+		yield None, self.partial.to_dict()
+
+	def combiner_1(self, _, partials):
+		"""
+		Combiner that merges the partial aggregates of the mappers of a machine.
+		:param _: None
+		:param partials: the partial aggregates
+		:return: (None, partial)
+		"""
+		yield None, self.merge_partials(partials).to_dict()
+
+	def reducer_1(self, _, partials):
+		"""
+		Reducer that merges all the partial aggregates and returns the requested metrics.
+		:param _: None
+		:param partials: the partial aggregates
+		:return: (metric, value) for each requested metric
+		"""
+		for metric, value in self.merge_partials(partials).results():
+			yield metric, value
+
+	def merge_partials(self, partials):
+		"""
+		Function that merges partial aggregates.
+		:param partials: iterable of partial aggregates, as written by MatrixPartial.to_dict
+		:return: MatrixPartial
+		"""
+		merged = MatrixPartial(self.metrics())
+		for partial in partials:
+			merged.merge(MatrixPartial.from_dict(partial))
+		return merged
+
+	def steps(self):
+		return [
+			MRStep(mapper_init=self.mapper_init_1,
+				   mapper=self.mapper_1,
+				   mapper_final=self.mapper_final_1,
+				   combiner=self.combiner_1,
+				   reducer=self.reducer_1)
+		]
+
+
+if __name__ == '__main__':
+	MatrixStats.run()
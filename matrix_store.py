@@ -0,0 +1,133 @@
+"""
+Binary form of the matrices of the Frobenius norm jobs, so that a mapper reads a block of rows from a memory-mapped
+.npy file and squares it with NumPy, instead of parsing one number at a time and sending every squared number
+through the shuffle.
+
+The text matrices have one row per line, with the values separated by spaces; the .npy file holds the same values
+as a (rows, columns) float64 (or float32) array. The rows are split into blocks of consecutive rows; a block file
+lists one block per line, as 'start stop', and is the input of FrobeniusNormBlocks, so each mapper gets some of the
+blocks.
+
+Usage:
+	python matrix_store.py convert A.txt A.npy [--dtype float32]
+	python matrix_store.py blocks A.npy A.blocks [--block-rows 256]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from job_rerun import rerun_with_args
+
+
+def parse_row(line):
+	"""
+	Function that converts a line of a text matrix into an array.
+	:param line: the line, with the values separated by spaces
+	:return: float64 array
+	"""
+	return np.array(line.split(), dtype=np.float64)
+
+
+def convert(text_path, npy_path, dtype='float64'):
+	"""
+	Function that converts a text matrix to a .npy file, one line at a time, so the matrix does not need to fit in
+	memory; the first pass only counts the lines.
+	:param text_path: path of the text matrix
+	:param npy_path: path of the .npy file
+	:param dtype: 'float32' or 'float64'
+	:return: the shape of the matrix
+	"""
+	with open(text_path) as f:
+		columns = len(f.readline().split())
+		rows = 1 + sum(1 for line in f if line.strip())
+
+	matrix = np.lib.format.open_memmap(npy_path, mode='w+', dtype=dtype, shape=(rows, columns))
+	with open(text_path) as f:
+		row = 0
+		for line in f:
+			if line.strip():
+				matrix[row] = parse_row(line)
+				row += 1
+	matrix.flush()
+	return rows, columns
+
+
+def open_matrix(npy_path):
+	"""
+	Function that opens a .npy matrix without reading it.
+	:param npy_path: path of the .npy file
+	:return: the memory-mapped array
+	"""
+	return np.load(npy_path, mmap_mode='r')
+
+
+def row_blocks(num_rows, block_rows):
+	"""
+	Function that splits the rows of a matrix into blocks of consecutive rows.
+	:param num_rows: number of rows
+	:param block_rows: maximum number of rows per block
+	:return: list of (start, stop) pairs
+	"""
+	block_rows = max(1, block_rows)
+	return [(start, min(start + block_rows, num_rows)) for start in range(0, num_rows, block_rows)]
+
+
+def write_block_file(npy_path, block_path, block_rows):
+	"""
+	Function that writes the block file of a matrix.
+	:param npy_path: path of the .npy file
+	:param block_path: path of the block file
+	:param block_rows: maximum number of rows per block
+	:return: the number of blocks
+	"""
+	blocks = row_blocks(len(open_matrix(npy_path)), block_rows)
+	with open(block_path, 'w') as out:
+		out.write(''.join('%d %d\n' % block for block in blocks))
+	return len(blocks)
+
+
+def run_with_block_file(job):
+	"""
+	Function that runs a job reading a .npy matrix, which was started without a block file: the block file of its
+	--matrix is written into a temporary directory, with --block-rows rows per block, and the job is run again with it.
+	:param job: the job, in the driver process
+	"""
+	tmp_dir = tempfile.mkdtemp()
+	try:
+		block_path = os.path.join(tmp_dir, 'blocks.txt')
+		write_block_file(job.options.matrix, block_path, job.options.block_rows)
+		rerun_with_args(job, [block_path])
+	finally:
+		shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def sum_of_squares(block):
+	"""
+	Function that computes the sum of the squared absolute values of a block of a matrix.
+	:param block: array of rows of the matrix
+	:return: the sum, as a float
+	"""
+	block = np.asarray(block, dtype=np.float64)
+	return float(np.sum(block * block))
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Convert a text matrix to .npy, or write the block file of one.')
+	subparsers = parser.add_subparsers(dest='command', required=True)
+	convert_parser = subparsers.add_parser('convert', help='convert a text matrix to a .npy file')
+	convert_parser.add_argument('text', help='text matrix')
+	convert_parser.add_argument('npy', help='.npy file')
+	convert_parser.add_argument('--dtype', choices=['float32', 'float64'], default='float64')
+	blocks_parser = subparsers.add_parser('blocks', help='write the block file of a .npy matrix')
+	blocks_parser.add_argument('npy', help='.npy file')
+	blocks_parser.add_argument('blocks', help='block file')
+	blocks_parser.add_argument('--block-rows', type=int, default=256, help='maximum number of rows per block')
+	args = parser.parse_args()
+
+	if args.command == 'convert':
+		print('%d x %d' % convert(args.text, args.npy, args.dtype))
+	else:
+		print(write_block_file(args.npy, args.blocks, args.block_rows))
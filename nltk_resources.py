@@ -0,0 +1,155 @@
+"""
+Lazy loading of the NLTK resources used by the movie keyword jobs.
+
+Nothing is imported or downloaded when this module is imported: the resources are looked up the first time a title
+has to be tagged, at most once per process, and the tagger is then kept for the lifetime of the process. The data
+is searched for in NLTK_DATA, in the usual NLTK locations and in the nltk_data directory next to the jobs, which is
+uploaded with them when it exists; it is only downloaded if it cannot be found and NLTK_OFFLINE is not set.
+
+Usage: python nltk_resources.py, which prints how long each stage of the start-up takes.
+"""
+import os
+import time
+
+# directory the resources can be bundled in, e.g. with nltk.download(..., download_dir=BUNDLED_DATA_DIR)
+BUNDLED_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nltk_data')
+
+# for each resource: the package to download and the path the tokenizer or the tagger loads it from; NLTK 3.9
+# renamed the tokenizer and tagger packages, and each version only loads its own names
+RESOURCES = [
+	('punkt', 'tokenizers/punkt/'),
+	('averaged_perceptron_tagger', 'taggers/averaged_perceptron_tagger/'),
+	('universal_tagset', 'taggers/universal_tagset/'),
+]
+RESOURCES_3_9 = [
+	('punkt_tab', 'tokenizers/punkt_tab/english/'),
+	('averaged_perceptron_tagger_eng', 'taggers/averaged_perceptron_tagger_eng/'),
+	('universal_tagset', 'taggers/universal_tagset/'),
+]
+
+verified = False
+tagger = None
+
+
+def required_resources(version):
+	"""
+	Function that returns the resources a version of NLTK loads for word_tokenize and pos_tag.
+	:param version: the version of NLTK, e.g. '3.9.1'
+	:return: list of (package, path)
+	"""
+	major_minor = tuple(int(part) if part.isdigit() else 0 for part in version.split('.')[:2])
+	return RESOURCES_3_9 if major_minor >= (3, 9) else RESOURCES
+
+
+def find_resource(path):
+	"""
+	Function that checks whether a resource can be found locally.
+	:param path: the path the resource is loaded from
+	:return: True if it exists, False otherwise
+	"""
+	import nltk
+
+	try:
+		nltk.data.find(path)
+		return True
+	except LookupError:
+		return False
+
+
+def ensure_resources():
+	"""
+	Function that makes sure the tokenizer and tagger data are available; it only does any work the first time it
+	is called in a process.
+	"""
+	global verified
+	if verified:
+		return
+
+	import nltk
+
+	if os.path.isdir(BUNDLED_DATA_DIR) and BUNDLED_DATA_DIR not in nltk.data.path:
+		nltk.data.path.append(BUNDLED_DATA_DIR)
+
+	for package, path in required_resources(nltk.__version__):
+		if find_resource(path):
+			continue
+		# offline workers must have the data preloaded; there is no point in waiting for the download to time out
+		if os.environ.get('NLTK_OFFLINE') or not nltk.download(package, quiet=True) or not find_resource(path):
+			raise LookupError('NLTK resource %r not found; install it in NLTK_DATA or in %s'
+							  % (package, BUNDLED_DATA_DIR))
+
+	verified = True
+
+
+def get_tagger():
+	"""
+	Function that returns the part of speech tagger of this process, loading it on first use.
+	:return: the nltk PerceptronTagger
+	"""
+	global tagger
+	if tagger is None:
+		ensure_resources()
+		from nltk.tag import PerceptronTagger
+		tagger = PerceptronTagger()
+	return tagger
+
+
+def word_tokenize(text):
+	"""
+	Function that tokenises a text with nltk.word_tokenize, once the resources are verified.
+	:param text: the text
+	:return: list of tokens
+	"""
+	ensure_resources()
+	import nltk
+
+	return nltk.word_tokenize(text)
+
+
+def pos_tag_sents(sentences):
+	"""
+	Function that tags a batch of tokenised sentences with the universal tagset, like
+	nltk.pos_tag_sents(sentences, 'universal'), but reusing the tagger of the process.
+	:param sentences: list of lists of tokens
+	:return: list of lists of (token, part_of_speech) pairs
+	"""
+	from nltk.tag.mapping import map_tag
+
+	tagger = get_tagger()
+	return [[(token, map_tag('en-ptb', 'universal', tag)) for token, tag in tagger.tag(tokens)]
+			for tokens in sentences]
+
+
+def measure_startup():
+	"""
+	Function that measures the start-up stages of the tagging in a fresh process.
+	:return: list of (stage, seconds)
+	"""
+	stages = []
+	start = time.perf_counter()
+
+	import nltk
+	stages.append(('import nltk', time.perf_counter() - start))
+
+	start = time.perf_counter()
+	ensure_resources()
+	stages.append(('verify resources', time.perf_counter() - start))
+
+	start = time.perf_counter()
+	get_tagger()
+	stages.append(('load tagger', time.perf_counter() - start))
+
+	start = time.perf_counter()
+	pos_tag_sents([word_tokenize('The Lord of the Rings')])
+	stages.append(('first title', time.perf_counter() - start))
+
+	start = time.perf_counter()
+	pos_tag_sents([word_tokenize('The Empire Strikes Back')])
+	stages.append(('second title', time.perf_counter() - start))
+
+	return stages
+
+
+if __name__ == '__main__':
+	for stage, seconds in measure_startup():
+		print('%-18s %8.3f s' % (stage, seconds))
@@ -0,0 +1,170 @@
+"""
+PageRank and degree histograms of the web graph inverted by task2.py, computed from its CSR form (see link_graph.py).
+
+The graph is loaded once and kept in memory for all the iterations, as arrays of page indices: for every edge, the
+index of its source, grouped by target like the in-links of the CSR form. An iteration only computes a new rank
+vector from the previous one: the rank of every page is divided by its out-degree, gathered for every edge, and summed
+for every target with numpy.add.reduceat over the groups of in-links. The rank of the pages without out-links is
+spread over all the pages, so the ranks always sum to 1:
+
+	rank'(p) = (1 - damping) / N + damping * (sum(rank(q) / out_degree(q) for q linking to p) + dangling / N)
+
+The iterations stop when the L1 distance between two rank vectors is below --tol, or after --max-iter iterations.
+The ranks are saved as a .npz file with the page IDs and their ranks, and such a file can be used as the starting
+point of another run (--initial), e.g. after the graph has been updated; the pages missing from it start with the
+average rank.
+
+The pages are those that link to or are linked to by another page.
+
+Usage: python pagerank.py web-Google.csr [--output ranks.npz] [--initial ranks.npz] [--top 10] [--histograms]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from link_graph import InvertedGraph
+
+
+def degree_histogram(degrees):
+	"""
+	Function that counts the pages with each degree.
+	:param degrees: int array with the degree of every page
+	:return: list of (degree, number of pages), for the degrees of at least one page, by increasing degree
+	"""
+	counts = np.bincount(degrees)
+	return [(degree, int(counts[degree])) for degree in np.flatnonzero(counts).tolist()]
+
+
+class PageRank:
+	"""
+	PageRank of an inverted graph, with the structure of the graph kept in memory between the iterations.
+	"""
+
+	def __init__(self, graph, damping=0.85):
+		"""
+		:param graph: InvertedGraph
+		:param damping: probability of following a link instead of jumping to a random page
+		"""
+		self.damping = damping
+		nodes = np.asarray(graph.nodes)
+		sources = np.asarray(graph.sources)
+		# the groups of in-links of the CSR form are kept, with the page IDs replaced by indices in pages
+		self.offsets = np.asarray(graph.offsets[:-1])
+		present = np.zeros(graph.header['max_id'] + 1, dtype=bool)
+		present[nodes] = True
+		present[sources] = True
+		self.pages = np.flatnonzero(present)
+		indices = np.cumsum(present) - 1
+		self.targets = indices[nodes]
+		self.sources = indices[sources]
+
+		self.in_degrees = np.zeros(len(self.pages), dtype=np.int64)
+		self.in_degrees[self.targets] = np.diff(np.asarray(graph.offsets))
+		self.out_degrees = np.bincount(self.sources, minlength=len(self.pages))
+		self.dangling = self.out_degrees == 0
+		self.inverse_out_degrees = np.zeros(len(self.pages))
+		self.inverse_out_degrees[~self.dangling] = 1.0 / self.out_degrees[~self.dangling]
+
+	def __len__(self):
+		return len(self.pages)
+
+	def initial_ranks(self, initial_path=None):
+		"""
+		Function that returns the starting rank vector.
+		:param initial_path: .npz file of ranks saved by save_ranks, or None to start from the uniform vector
+		:return: float64 array, with the rank of each page of pages, summing to 1
+		"""
+		ranks = np.full(len(self), 1.0 / max(1, len(self)))
+		if initial_path is not None:
+			with np.load(initial_path) as saved:
+				saved_pages, saved_ranks = saved['pages'], saved['ranks']
+			positions = np.searchsorted(self.pages, saved_pages)
+			known = positions < len(self)
+			known[known] = self.pages[positions[known]] == saved_pages[known]
+			ranks[positions[known]] = saved_ranks[known]
+			ranks /= ranks.sum()
+		return ranks
+
+	def iterate(self, ranks):
+		"""
+		Function that computes one iteration of PageRank.
+		:param ranks: the rank vector
+		:return: the next rank vector
+		"""
+		incoming = np.zeros(len(self))
+		if len(self.sources):
+			# every target has at least one in-link, so reduceat sums exactly the in-links of each target
+			incoming[self.targets] = np.add.reduceat((ranks * self.inverse_out_degrees)[self.sources], self.offsets)
+		dangling = ranks[self.dangling].sum()
+		return (1 - self.damping) / len(self) + self.damping * (incoming + dangling / len(self))
+
+	def run(self, ranks=None, tol=1e-10, max_iter=100):
+		"""
+		Function that iterates until the ranks converge.
+		:param ranks: the starting rank vector, uniform by default
+		:param tol: L1 distance between two rank vectors below which the ranks have converged
+		:param max_iter: maximum number of iterations
+		:return: (ranks, list of the L1 distances of every iteration)
+		"""
+		if ranks is None:
+			ranks = self.initial_ranks()
+		distances = []
+		for _ in range(max_iter if len(self) else 0):
+			new_ranks = self.iterate(ranks)
+			distances.append(float(np.abs(new_ranks - ranks).sum()))
+			ranks = new_ranks
+			if distances[-1] < tol:
+				break
+		return ranks, distances
+
+	def save_ranks(self, ranks, output_path):
+		"""
+		Function that saves a rank vector with the IDs of the pages.
+		:param ranks: the rank vector
+		:param output_path: path of the .npz file
+		"""
+		np.savez(output_path, pages=self.pages, ranks=ranks)
+
+	def top(self, ranks, k):
+		"""
+		Function that returns the pages with the highest ranks.
+		:param ranks: the rank vector
+		:param k: number of pages
+		:return: list of (page ID, rank), by decreasing rank; ties are broken by page ID
+		"""
+		order = np.lexsort((self.pages, -ranks))[:k]
+		return list(zip(self.pages[order].tolist(), ranks[order].tolist()))
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Compute the PageRank of an inverted web graph.')
+	parser.add_argument('graph', help='CSR form of the graph, written by task2.py --csr or link_graph.py')
+	parser.add_argument('--damping', type=float, default=0.85, help='probability of following a link')
+	parser.add_argument('--tol', type=float, default=1e-10, help='L1 distance between two iterations to stop at')
+	parser.add_argument('--max-iter', type=int, default=100, help='maximum number of iterations')
+	parser.add_argument('--initial', help='ranks of a previous run (.npz) to start from')
+	parser.add_argument('--output', help='.npz file where the ranks are saved')
+	parser.add_argument('--top', type=int, default=10, help='number of pages with the highest ranks to print')
+	parser.add_argument('--histograms', action='store_true', help='print the in-degree and out-degree histograms')
+	args = parser.parse_args()
+
+	start = time.time()
+	pagerank = PageRank(InvertedGraph(args.graph), args.damping)
+	loaded = time.time()
+	ranks, distances = pagerank.run(pagerank.initial_ranks(args.initial), args.tol, args.max_iter)
+	end = time.time()
+
+	print('%d pages, %d links' % (len(pagerank), len(pagerank.sources)))
+	print('%d iterations, last L1 distance %g' % (len(distances), distances[-1] if distances else 0.0))
+	for page, rank in pagerank.top(ranks, args.top):
+		print('%d\t%.6g' % (page, rank))
+	if args.histograms:
+		for name, degrees in [('in-degree', pagerank.in_degrees), ('out-degree', pagerank.out_degrees)]:
+			print(name)
+			for degree, count in degree_histogram(degrees):
+				print('%d\t%d' % (degree, count))
+	if args.output:
+		pagerank.save_ranks(ranks, args.output)
+	print('loading time: ', loaded - start)
+	print('iteration time: ', end - loaded)
@@ -0,0 +1,525 @@
+"""
+In-process engine that runs the steps of an MRJob on several cores, without the subprocesses, the temporary files and
+the on-disk sort of the mrjob local runner.
+
+The steps run one after the other, and their input is split like the mrjob runners do it with --num-cores cores:
+each input file into splits of (total size) // (2 * --num-cores) bytes, at the end of a line, and each compressed
+file into a single split. The driver only finds the ends of the splits; the map tasks (mapper and combiner, see
+shared_scan.ScanJob) run in a pool of --num-cores processes, which read their own split from the input file (or
+decompress the whole compressed file) and write their output, sorted by key (the sort is stable, like the mrjob sort),
+to a shared-memory block.
+
+The keys are then range-partitioned between --num-cores reduce tasks, with boundaries picked from a sample of the keys
+of every map task: the reduce task of a range finds it in every block by binary search, merges the lines of the blocks
+in the order of the map tasks, runs the reducer on every key and writes its output to a new shared-memory block. Since
+the partitions are ranges, their outputs follow each other in the order of the keys, and the driver only cuts them,
+from the number of bytes of input of every key, into the reduce tasks mrjob would have run (ranges of keys of about
+(total size) // (2 * --num-cores) bytes of input), which are the input files of the next step; the data between the
+steps stays in shared memory. So the output of a job is the one mrjob writes with the same number of cores, byte for
+byte, when mrjob reads its output files in the order of their names (it reads them in the order of the file system),
+as long as the reducer_init and reducer_final methods do not return anything: they run once per partition here.
+
+The jobs that prepare some files in the driver before running (e.g. the query file of task3.py) run as usual: the
+engine replaces the mrjob runner of the job.
+
+Usage: python parallel_engine.py task4.FrobeniusNormIndex [--num-cores 4] -- A.txt
+"""
+import argparse
+import heapq
+import itertools
+import os
+import sys
+import time
+from multiprocessing import Pool, cpu_count, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from mrjob.cat import decompress, is_compressed
+from mrjob.util import save_current_environment
+from mrjob.util import to_lines
+
+from job_rerun import job_args
+from shared_scan import ScanJob, line_key, load_job_class, sort_lines
+
+# number of bytes read at once when looking for the end of a line
+FIND_BYTES = 64 * 1024
+# number of keys of the output of each map task sampled to pick the ranges of the reduce tasks
+SAMPLE_KEYS = 64
+
+
+def share(data):
+	"""
+	Function that copies bytes to a new shared-memory block.
+	:param data: bytes
+	:return: (name, size) of the block, or None if data is empty
+	"""
+	if not data:
+		return None
+	block = SharedMemory(create=True, size=len(data))
+	try:
+		block.buf[:len(data)] = data
+	except BaseException:
+		block.close()
+		block.unlink()
+		raise
+	block.close()
+	return block.name, len(data)
+
+
+def free(name):
+	"""
+	Function that frees a shared-memory block written by share.
+	:param name: name of the block
+	"""
+	try:
+		block = SharedMemory(name=name)
+	except FileNotFoundError:
+		return
+	block.close()
+	block.unlink()
+
+
+def read_bytes(name, start, stop, shared):
+	"""
+	Function that reads a range of bytes of a file or of a shared-memory block.
+	:param name: path of the file, or name of the block
+	:param start: position of the first byte
+	:param stop: position after the last byte
+	:param shared: whether name is a shared-memory block
+	:return: the bytes
+	"""
+	if not shared:
+		with open(name, 'rb') as f:
+			f.seek(start)
+			return f.read(stop - start)
+	block = SharedMemory(name=name)
+	try:
+		return bytes(block.buf[start:stop])
+	finally:
+		block.close()
+
+
+def file_size(segments):
+	"""
+	:param segments: list of (name, start, stop, shared), the ranges of bytes of files or shared-memory blocks that
+	make up a file, one after the other
+	:return: the size of the file
+	"""
+	return sum(stop - start for _, start, stop, _ in segments)
+
+
+def read_segments(segments, start, stop):
+	"""
+	Function that reads a range of bytes of a file made of segments.
+	:param segments: list of (name, start, stop, shared), see file_size
+	:param start: position of the first byte in the file
+	:param stop: position after the last byte
+	:return: the bytes
+	"""
+	parts = []
+	offset = 0
+	for name, segment_start, segment_stop, shared in segments:
+		length = segment_stop - segment_start
+		low, high = max(start, offset), min(stop, offset + length)
+		if low < high:
+			parts.append(read_bytes(name, segment_start + low - offset, segment_start + high - offset, shared))
+		offset += length
+	return b''.join(parts)
+
+
+def line_end(segments, position):
+	"""
+	Function that finds the end of the line of a position in a file made of segments.
+	:param segments: list of (name, start, stop, shared), see file_size
+	:param position: position in the file
+	:return: the position after the first newline at or after position, or the size of the file
+	"""
+	size = file_size(segments)
+	while position < size:
+		window = read_segments(segments, position, position + FIND_BYTES)
+		newline = window.find(b'\n')
+		if newline >= 0:
+			return position + newline + 1
+		position += len(window)
+	return size
+
+
+def line_start(segments, position):
+	"""
+	:param segments: list of (name, start, stop, shared), see file_size
+	:param position: position in the file
+	:return: the position of the first line that starts at or after position, or the size of the file
+	"""
+	return line_end(segments, position - 1) if position else 0
+
+
+def key_at(segments, position):
+	"""
+	Function that reads the key of a line, like shared_scan.line_key.
+	:param segments: list of (name, start, stop, shared), see file_size
+	:param position: position of the start of the line
+	:return: the encoded key
+	"""
+	size = file_size(segments)
+	parts = []
+	while position < size:
+		window = read_segments(segments, position, position + FIND_BYTES)
+		newline = window.find(b'\n')
+		if newline >= 0:
+			window = window[:newline + 1]
+		tab = window.find(b'\t')
+		if tab >= 0:
+			parts.append(window[:tab])
+			break
+		parts.append(window)
+		if newline >= 0:
+			break
+		position += len(window)
+	return b''.join(parts)
+
+
+def lower_bound(segments, key):
+	"""
+	Function that finds where the lines of a key start, by binary search, in a file of lines sorted by key.
+	:param segments: list of (name, start, stop, shared), see file_size
+	:param key: the encoded key
+	:return: the position of the first line whose key is not smaller than key, or the size of the file
+	"""
+	low, high = 0, file_size(segments)
+	# the lines before low have smaller keys, and the line at high, if any, does not
+	while low < high:
+		middle = line_start(segments, (low + high) // 2)
+		if middle >= high:
+			middle = low
+		if key_at(segments, middle) < key:
+			low = line_start(segments, middle + 1)
+		else:
+			high = middle
+	return low
+
+
+def input_files(paths, stdin=None):
+	"""
+	Function that lists the input files of a job; only stdin is read, into a shared-memory block.
+	:param paths: the input paths, or ['-'] (or []) for stdin; .gz and .bz2 files are decompressed by the map tasks
+	:param stdin: binary stream read for '-', sys.stdin.buffer by default
+	:return: list of (path, compressed, segments), see file_size
+	"""
+	files = []
+	for path in paths or ['-']:
+		if path == '-':
+			block = share((stdin or sys.stdin.buffer).read())
+			files.append((path, False, [(block[0], 0, block[1], True)] if block else []))
+		else:
+			files.append((path, is_compressed(path), [(path, 0, os.path.getsize(path), False)]))
+	return files
+
+
+def split_files(files, num_cores):
+	"""
+	Function that splits the input files of a step like the mrjob runners do.
+	:param files: list of (path, compressed, segments), see file_size
+	:param num_cores: number of cores; the input is split in about twice as many splits
+	:return: list of (path, compressed, segments, start, stop); an empty file is an empty split
+	"""
+	num_compressed = sum(1 for _, compressed, _ in files if compressed)
+	uncompressed_bytes = sum(file_size(segments) for _, compressed, segments in files if not compressed)
+	split_size = uncompressed_bytes // max(2 * num_cores - num_compressed, 1)
+
+	splits = []
+	for path, compressed, segments in files:
+		size = file_size(segments)
+		if compressed or not size:
+			splits.append((path, compressed, segments, 0, size))
+			continue
+		# like mrjob, a split ends with the line that brings it to split_size bytes
+		start = 0
+		while start < size:
+			stop = line_end(segments, max(start, start + split_size - 1))
+			splits.append((path, compressed, segments, start, stop))
+			start = stop
+	return splits
+
+
+def shared_blocks(files):
+	"""
+	:param files: list of (path, compressed, segments), see file_size
+	:return: set of the names of the shared-memory blocks of the files
+	"""
+	return {name for _, _, segments in files for name, _, _, shared in segments if shared}
+
+
+def run_tasks(pool, function, tasks, blocks):
+	"""
+	Function that runs tasks in the pool and waits for all of them, even if one fails, so that the shared-memory
+	blocks of the others can be freed.
+	:param pool: the pool
+	:param function: the function of the tasks, which returns a shared-memory block (or None) and other values
+	:param tasks: list of the arguments of each task
+	:param blocks: set to which the names of the blocks of the tasks are added
+	:return: list of the outputs of the tasks
+	"""
+	results = [pool.apply_async(function, task) for task in tasks]
+	outputs, error = [], None
+	for result in results:
+		try:
+			output = result.get()
+		except Exception as e:
+			error = error or e
+			continue
+		if output[0] is not None:
+			blocks.add(output[0][0])
+		outputs.append(output)
+	if error is not None:
+		raise error
+	return outputs
+
+
+def run_map_task(job_class, args, step_num, split, sort):
+	"""
+	Function that runs a map task, in a process of the pool.
+	:param job_class: the MRJob class
+	:param args: the command-line arguments of the job
+	:param step_num: the step
+	:param split: (path, compressed, segments, start, stop), the input of the task
+	:param sort: whether the output is sorted by key and its keys sampled, for the reduce tasks
+	:return: (shared-memory block of the output, list of sampled keys)
+	"""
+	path, compressed, segments, start, stop = split
+	if compressed:
+		with open(segments[0][0], 'rb') as f:
+			lines = list(to_lines(decompress(f, path)))
+	else:
+		lines = list(to_lines([read_segments(segments, start, stop)]))
+	job = ScanJob(job_class, args)
+	pairs = []
+	if job.steps[step_num].has_explicit_mapper:
+		read = job.new_task().pick_protocols(step_num, 'mapper')[0]
+		pairs = [read(line.rstrip(b'\r\n')) for line in lines]
+	with save_current_environment():
+		os.environ.update({'mapreduce_map_input_file': path, 'mapreduce_map_input_start': str(start),
+						   'mapreduce_map_input_length': str(sum(len(line) for line in lines))})
+		output = job.run_map_task(step_num, pairs, lines)
+	if not sort:
+		return share(b''.join(output)), []
+
+	# without a mapper, the last line of the input may not end with a newline
+	if output and not output[-1].endswith(b'\n'):
+		output[-1] += b'\n'
+	output = sort_lines(output)
+	return share(b''.join(output)), [line_key(line) for line in output[::max(1, len(output) // SAMPLE_KEYS)]]
+
+
+def run_reduce_task(job_class, args, step_num, blocks, low_key, high_key):
+	"""
+	Function that runs the reducer of a range of keys, in a process of the pool.
+	:param job_class: the MRJob class
+	:param args: the command-line arguments of the job
+	:param step_num: the step
+	:param blocks: the shared-memory blocks of the sorted output of the map tasks, in their order
+	:param low_key: first key of the range, or None
+	:param high_key: key after the range, or None
+	:return: (shared-memory block of the output, size of the output of reducer_init, size of the output of
+	reducer_final, int64 array of the bytes of input of each key, int64 array of the end of the output of each key
+	after the output of reducer_init), with the keys in increasing order
+	"""
+	runs = []
+	for block in blocks:
+		if block is None:
+			continue
+		segments = [(block[0], 0, block[1], True)]
+		start = lower_bound(segments, low_key) if low_key is not None else 0
+		stop = lower_bound(segments, high_key) if high_key is not None else block[1]
+		runs.append(list(to_lines([read_segments(segments, start, stop)])))
+
+	task = ScanJob(job_class, args).new_task()
+	step = task.steps()[step_num]
+	read, write = task.pick_protocols(step_num, 'reducer')
+
+	def encode(pairs):
+		return b''.join(write(key, value) + b'\n' for key, value in pairs or ())
+
+	init_output = encode(step['reducer_init']()) if step['reducer_init'] else b''
+	outputs, input_sizes, output_ends = [], [], []
+	output_size = 0
+	# heapq.merge is stable, so the lines of a key stay in the order of the map tasks
+	for _, lines in itertools.groupby(heapq.merge(*runs, key=line_key), key=line_key):
+		lines = list(lines)
+		pairs = [read(line.rstrip(b'\r\n')) for line in lines]
+		outputs.append(encode(step['reducer'](pairs[0][0], (value for _, value in pairs))))
+		output_size += len(outputs[-1])
+		input_sizes.append(sum(len(line) for line in lines))
+		output_ends.append(output_size)
+	final_output = encode(step['reducer_final']()) if step['reducer_final'] else b''
+	return (share(init_output + b''.join(outputs) + final_output), len(init_output), len(final_output),
+			np.array(input_sizes, dtype=np.int64), np.array(output_ends, dtype=np.int64))
+
+
+def pick_ranges(keys, num_partitions):
+	"""
+	Function that picks the ranges of keys of the reduce tasks.
+	:param keys: sample of the encoded keys
+	:param num_partitions: largest number of ranges
+	:return: list of (first key or None, key after the range or None), in order
+	"""
+	keys = sorted(keys)
+	boundaries = sorted({keys[len(keys) * i // num_partitions] for i in range(1, num_partitions)}) if keys else []
+	return list(zip([None] + boundaries, boundaries + [None]))
+
+
+def reduce_tasks(reduce_outputs, num_cores):
+	"""
+	Function that cuts the output of the ranges of keys into the reduce tasks mrjob would have run.
+	:param reduce_outputs: list of the outputs of run_reduce_task, in the order of the ranges
+	:param num_cores: number of cores
+	:return: list of the output files of the tasks, (path, compressed, segments)
+	"""
+	input_sizes = np.concatenate([sizes for _, _, _, sizes, _ in reduce_outputs])
+	input_ends = np.cumsum(input_sizes)
+	split_size = int(input_ends[-1]) // (2 * num_cores) if len(input_ends) else 0
+	# like mrjob, a new task starts with a new key once the task has enough input
+	cuts = [0]
+	while cuts[-1] < len(input_sizes):
+		task_start = int(input_ends[cuts[-1] - 1]) if cuts[-1] else 0
+		stop = int(np.searchsorted(input_ends, task_start + split_size)) + 1
+		cuts.append(min(len(input_sizes), max(cuts[-1] + 1, stop)))
+	tasks = [[] for _ in range(max(1, len(cuts) - 1))]
+
+	first_key = 0
+	for block, init_size, _, sizes, output_ends in reduce_outputs:
+		# the keys of the range, first_key to last_key, are in the tasks from the one of first_key
+		last_key = first_key + len(sizes)
+		for i in range(int(np.searchsorted(cuts, first_key, side='right')) - 1, len(tasks) if len(sizes) else 0):
+			low, high = max(cuts[i], first_key) - first_key, min(cuts[i + 1], last_key) - first_key
+			if low >= high:
+				break
+			start = init_size + (int(output_ends[low - 1]) if low else 0)
+			stop = init_size + int(output_ends[high - 1])
+			if start < stop:
+				tasks[i].append((block[0], start, stop, True))
+		first_key = last_key
+
+	# the output of reducer_init goes before the first task, and the output of reducer_final after the last one
+	tasks[0][:0] = [(block[0], 0, init_size, True) for block, init_size, _, _, _ in reduce_outputs if init_size]
+	tasks[-1].extend((block[0], block[1] - final_size, block[1], True)
+					 for block, _, final_size, _, _ in reduce_outputs if final_size)
+	return [('-', False, segments) for segments in tasks]
+
+
+def run_parallel(job_class, args, num_cores=None, stdin=None):
+	"""
+	Function that runs a job on several cores of this machine.
+	:param job_class: the MRJob class
+	:param args: the command-line arguments of the job, with its input paths
+	:param num_cores: number of processes, the number of CPUs by default
+	:param stdin: binary stream read if the input is stdin
+	:return: (the encoded output, as bytes, list of {'map': seconds, 'reduce': seconds} for each step)
+	"""
+	num_cores = num_cores or cpu_count()
+	job = ScanJob(job_class, args)
+	timings = []
+	# the shared-memory blocks are created and freed by different processes of the pool, which must share the
+	# resource tracker of this process
+	resource_tracker.ensure_running()
+	# the names of the shared-memory blocks that are not freed yet
+	blocks = set()
+	try:
+		files = input_files(job.job.options.args, stdin)
+		blocks |= shared_blocks(files)
+		with Pool(num_cores) as pool:
+			for step_num, step in enumerate(job.steps):
+				start = time.perf_counter()
+				map_outputs = run_tasks(pool, run_map_task, [
+					(job_class, job.args, step_num, split, step.has_explicit_reducer)
+					for split in split_files(files, num_cores)], blocks)
+				# the input of the step is not needed anymore
+				for name in shared_blocks(files):
+					free(name)
+					blocks.discard(name)
+				mapped = time.perf_counter()
+				if step.has_explicit_reducer:
+					map_blocks = [block for block, _ in map_outputs]
+					reduce_outputs = run_tasks(pool, run_reduce_task, [
+						(job_class, job.args, step_num, map_blocks, low_key, high_key)
+						for low_key, high_key in pick_ranges([key for _, keys in map_outputs for key in keys],
+															 num_cores)], blocks)
+					for block in map_blocks:
+						if block is not None:
+							free(block[0])
+							blocks.discard(block[0])
+					files = reduce_tasks(reduce_outputs, num_cores)
+				else:
+					# the output of each map task is an input file of the next step
+					files = [('-', False, [(block[0], 0, block[1], True)] if block else []) for block, _ in map_outputs]
+				timings.append({'map': mapped - start, 'reduce': time.perf_counter() - mapped})
+		output = b''.join(read_segments(segments, 0, file_size(segments)) for _, _, segments in files)
+	finally:
+		for name in blocks:
+			free(name)
+	return output, timings
+
+
+class ParallelRunner:
+	"""
+	Stand-in for the mrjob runner made by MRJob.make_runner, which runs the job with run_parallel.
+	"""
+
+	def __init__(self, job, num_cores=None):
+		"""
+		:param job: the job, in the driver process
+		:param num_cores: number of processes, the number of CPUs by default
+		"""
+		self.job = job
+		self.num_cores = num_cores
+		self.output = b''
+		self.timings = []
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		pass
+
+	def run(self):
+		self.output, self.timings = run_parallel(self.job.__class__, job_args(self.job), self.num_cores, self.job.stdin)
+
+	def cat_output(self):
+		"""
+		:return: generator of the output of the job, as bytes
+		"""
+		yield self.output
+
+
+def run_job(job_class, args, num_cores=None):
+	"""
+	Function that runs a job from the command line like MRJob.run does, but with the engine instead of a runner; the
+	jobs created by the job itself (see job_rerun.py) also use the engine.
+	:param job_class: the MRJob class
+	:param args: the command-line arguments of the job
+	:param num_cores: number of processes, the number of CPUs by default
+	"""
+	had_make_runner = 'make_runner' in job_class.__dict__
+	make_runner = job_class.__dict__.get('make_runner')
+	job_class.make_runner = lambda job: ParallelRunner(job, num_cores)
+	try:
+		job_class(args=args).execute()
+	finally:
+		if had_make_runner:
+			job_class.make_runner = make_runner
+		else:
+			del job_class.make_runner
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Run an MRJob on several cores of this machine.')
+	parser.add_argument('job', help='the job, as module.Class')
+	parser.add_argument('--num-cores', type=int, help='number of processes, the number of CPUs by default')
+	argv = sys.argv[1:]
+	# the arguments after -- are those of the job
+	job_argv = argv[argv.index('--') + 1:] if '--' in argv else []
+	args = parser.parse_args(argv[:argv.index('--')] if '--' in argv else argv)
+
+	sys.path.insert(0, os.getcwd())
+	start = time.time()
+	run_job(load_job_class(args.job), job_argv, args.num_cores)
+	sys.stderr.write('execution time: %.3f s\n' % (time.time() - start))
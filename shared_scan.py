@@ -0,0 +1,404 @@
+"""
+Runner that executes several MRJobs over the same input with a single read of it, instead of running them one after
+the other and reading and parsing the input once per job.
+
+The input is read in splits of about --split-size bytes, like the map tasks of the mrjob runners. What is shared is
+the reading of the input (and its decompression), its splitting into lines, and the decoding of every line by the
+input protocol, done once per protocol; the records are then passed to the first mapper of every job, which still
+parses their fields (e.g. the numbers of a line of a matrix) on its own. Each job then runs its combiner on the output
+of the split, and its reducer and other steps once all the input has been read, in the same process. The jobs run
+with the same command-line arguments, so they must accept the same options and have a mapper (or no mapper at all)
+as first step.
+
+The output of the map tasks is not kept in memory: it is written to disk in sorted runs of about --spill-bytes bytes
+(see SortedRuns), which are merged as the reducer reads them, and the reducer output of each step is passed on to the
+next step as it is produced. Only the final output of each job is kept in memory.
+
+Each job gets a fresh instance for every task, as with mrjob, so mapper_init and mapper_final run once per split; the
+reducers of a step run as a single task. The output of each job is the one mrjob would write, and the time spent in
+each job is measured apart from the time spent reading and decoding the input.
+
+Usage: python shared_scan.py task4.FrobeniusNormIndex task4.FrobeniusNormNoIndex [--output-dir DIR] [--split-size N]
+	[--spill-bytes N] -- A.txt
+"""
+import argparse
+import heapq
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from mrjob.cat import decompress
+from mrjob.step import MRStep
+from mrjob.util import save_current_environment
+from mrjob.util import to_lines
+
+SPLIT_SIZE = 16 * 1024 * 1024
+SPILL_BYTES = 64 * 1024 * 1024
+
+
+def input_splits(paths, split_size=SPLIT_SIZE, stdin=None):
+	"""
+	Function that reads the input of the jobs in splits of consecutive lines.
+	:param paths: the input paths, or ['-'] (or []) for stdin; .gz and .bz2 files are decompressed
+	:param split_size: number of bytes after which a split ends, at the end of a line
+	:param stdin: binary stream read for '-', sys.stdin.buffer by default
+	:return: generator of (path, start, lines), where start is the position of the split in the (decompressed) file
+	"""
+	for path in paths or ['-']:
+		if path == '-':
+			for start, lines in file_splits(stdin or sys.stdin.buffer, split_size):
+				yield path, start, lines
+		else:
+			with open(path, 'rb') as f:
+				for start, lines in file_splits(to_lines(decompress(f, path)), split_size):
+					yield path, start, lines
+
+
+def file_splits(lines, split_size):
+	"""
+	Function that groups the lines of a file into splits.
+	:param lines: iterable of the lines of the file, as bytes
+	:param split_size: number of bytes after which a split ends
+	:return: generator of (start, lines)
+	"""
+	start, size, split = 0, 0, []
+	for line in lines:
+		split.append(line)
+		size += len(line)
+		if size >= split_size:
+			yield start, split
+			start, size, split = start + size, 0, []
+	if split:
+		yield start, split
+
+
+def line_key(line):
+	"""
+	Function that returns the key the encoded lines are sorted by.
+	:param line: an encoded line
+	:return: the encoded key, the bytes before the first tab
+	"""
+	return line.split(b'\t', 1)[0]
+
+
+def sort_lines(lines):
+	"""
+	Function that sorts the encoded output of a task by key, like the local mrjob runners do before a reducer.
+	:param lines: list of encoded lines
+	:return: the sorted list
+	"""
+	return sorted(lines, key=line_key)
+
+
+class SortedRuns:
+	"""
+	Encoded lines sorted by key like sort_lines, which are kept on disk in sorted runs of about spill_bytes bytes once
+	they grow too large, and read back with a merge of the runs. The lines with the same key come out in the order they
+	were added, as with the stable sort of the mrjob runners.
+
+	Usage:
+		with SortedRuns(spill_bytes) as runs:
+			for lines in outputs:
+				runs.extend(lines)
+			for line in runs:
+				...
+	"""
+
+	def __init__(self, spill_bytes=SPILL_BYTES):
+		"""
+		:param spill_bytes: number of bytes of lines kept in memory before they are written to disk
+		"""
+		self.spill_bytes = max(1, spill_bytes)
+		self.buffer = []
+		self.buffer_bytes = 0
+		self.runs = []
+		self.tmp_dir = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def extend(self, lines):
+		"""
+		Function that adds some lines.
+		:param lines: iterable of encoded lines
+		"""
+		for line in lines:
+			# the lines of a run are read back one per line of the file
+			if not line.endswith(b'\n'):
+				line += b'\n'
+			self.buffer.append(line)
+			self.buffer_bytes += len(line)
+			if self.buffer_bytes >= self.spill_bytes:
+				self.spill()
+
+	def spill(self):
+		"""
+		Function that writes the lines in memory to disk, as a sorted run.
+		"""
+		if self.tmp_dir is None:
+			self.tmp_dir = tempfile.mkdtemp()
+		run_path = os.path.join(self.tmp_dir, '%d.run' % len(self.runs))
+		with open(run_path, 'wb') as out:
+			out.writelines(sort_lines(self.buffer))
+		self.runs.append(run_path)
+		self.buffer = []
+		self.buffer_bytes = 0
+
+	def read_run(self, run_path):
+		"""
+		Function that reads a run back.
+		:param run_path: path of the run
+		:return: generator of the lines of the run
+		"""
+		with open(run_path, 'rb') as f:
+			yield from f
+
+	def __iter__(self):
+		"""
+		:return: iterator of all the lines, sorted by key
+		"""
+		if not self.runs:
+			return iter(sort_lines(self.buffer))
+		# on equal keys, heapq.merge takes the lines of the earlier runs first, so the merge is stable too
+		return heapq.merge(*[self.read_run(run_path) for run_path in self.runs], sort_lines(self.buffer), key=line_key)
+
+	def close(self):
+		"""
+		Function that removes the runs written to disk.
+		"""
+		if self.tmp_dir is not None:
+			shutil.rmtree(self.tmp_dir, ignore_errors=True)
+			self.tmp_dir = None
+		self.runs = []
+
+
+class ScanJob:
+	"""
+	A job run by the shared scan, with the output of its map tasks and the time spent in it.
+	"""
+
+	def __init__(self, job_class, args, spill_bytes=SPILL_BYTES):
+		"""
+		:param job_class: the MRJob class
+		:param args: the command-line arguments of the job
+		:param spill_bytes: number of bytes of map output kept in memory by each step before it is written to disk
+		"""
+		self.job_class = job_class
+		self.args = list(args)
+		self.spill_bytes = spill_bytes
+		self.job = self.new_task()
+		self.steps = self.job.steps()
+		if not all(isinstance(step, MRStep) for step in self.steps):
+			raise ValueError('%s: only MRStep steps can be run by the shared scan' % job_class.__name__)
+		if self.steps[0]['mapper_raw']:
+			raise ValueError('%s: the first mapper cannot be a raw mapper' % job_class.__name__)
+		# the encoded output of the map tasks of the first step, after their combiner; it is only sorted if the step
+		# has a reducer
+		self.map_output = SortedRuns(spill_bytes) if self.steps[0].has_explicit_reducer else []
+		self.timings = {'map': 0.0, 'reduce': 0.0}
+
+	def new_task(self):
+		"""
+		Function that creates the instance of the job that runs a task.
+		:return: the job
+		"""
+		return self.job_class(args=self.args)
+
+	def run_map_task(self, step_num, pairs, lines):
+		"""
+		Function that runs a map task and its combiner.
+		:param step_num: the step
+		:param pairs: list of the decoded input records of the task
+		:param lines: list of the input lines of the task, used if the step has no mapper
+		:return: list of encoded lines
+		"""
+		step = self.steps[step_num]
+		task = self.new_task()
+		if step.has_explicit_mapper:
+			write = task.pick_protocols(step_num, 'mapper')[1]
+			output = [write(key, value) + b'\n' for key, value in task.map_pairs(pairs, step_num)]
+		else:
+			output = lines
+		if step.has_explicit_combiner:
+			read, write = task.pick_protocols(step_num, 'combiner')
+			combined = task.combine_pairs((read(line.rstrip(b'\r\n')) for line in sort_lines(output)), step_num)
+			output = [write(key, value) + b'\n' for key, value in combined]
+		return output
+
+	def run_step_map_task(self, step_num, lines):
+		"""
+		Function that runs the mapper and the combiner of a step after the first one, as a single task over the output
+		of the previous step.
+		:param step_num: the step
+		:param lines: iterable of the encoded output of the previous step
+		:return: generator of encoded lines
+		"""
+		step = self.steps[step_num]
+		task = self.new_task()
+		if step.has_explicit_mapper:
+			read, write = task.pick_protocols(step_num, 'mapper')
+			mapped = task.map_pairs((read(line.rstrip(b'\r\n')) for line in lines), step_num)
+			lines = (write(key, value) + b'\n' for key, value in mapped)
+		if not step.has_explicit_combiner:
+			yield from lines
+			return
+		with SortedRuns(self.spill_bytes) as runs:
+			runs.extend(lines)
+			read, write = task.pick_protocols(step_num, 'combiner')
+			for key, value in task.combine_pairs((read(line.rstrip(b'\r\n')) for line in runs), step_num):
+				yield write(key, value) + b'\n'
+
+	def run_reduce_task(self, step_num, lines):
+		"""
+		Function that runs the reducer of a step over the output of all its map tasks.
+		:param step_num: the step
+		:param lines: iterable of the encoded lines, sorted by key
+		:return: generator of encoded lines
+		"""
+		task = self.new_task()
+		read, write = task.pick_protocols(step_num, 'reducer')
+		for key, value in task.reduce_pairs((read(line.rstrip(b'\r\n')) for line in lines), step_num):
+			yield write(key, value) + b'\n'
+
+	def map_split(self, path, start, pairs, lines):
+		"""
+		Function that runs the first mapper and its combiner over a split of the input; like the mrjob runners, the
+		position of the split is passed in the mapreduce.map.input.* environment variables.
+		:param path: the input file of the split
+		:param start: the position of the split in the file
+		:param pairs: list of the decoded records of the split
+		:param lines: list of the lines of the split
+		"""
+		task_start = time.perf_counter()
+		with save_current_environment():
+			os.environ.update({'mapreduce_map_input_file': path, 'mapreduce_map_input_start': str(start),
+							   'mapreduce_map_input_length': str(sum(len(line) for line in lines))})
+			self.map_output.extend(self.run_map_task(0, pairs, lines))
+		self.timings['map'] += time.perf_counter() - task_start
+
+	def finish(self):
+		"""
+		Function that runs the reducer of the first step and the other steps of the job; the output of each step is
+		passed on to the next one as it is produced.
+		:return: list of the encoded output lines of the job
+		"""
+		start = time.perf_counter()
+		all_runs = [self.map_output] if isinstance(self.map_output, SortedRuns) else []
+		lines = self.map_output
+		try:
+			for step_num, step in enumerate(self.steps):
+				if step_num:
+					lines = self.run_step_map_task(step_num, lines)
+				if step.has_explicit_reducer:
+					if step_num:
+						all_runs.append(SortedRuns(self.spill_bytes))
+						all_runs[-1].extend(lines)
+					lines = self.run_reduce_task(step_num, all_runs[-1])
+			output = list(lines)
+		finally:
+			for runs in all_runs:
+				runs.close()
+		self.map_output = []
+		self.timings['reduce'] += time.perf_counter() - start
+		self.timings['total'] = self.timings['map'] + self.timings['reduce']
+		return output
+
+
+def run_shared_scan(job_classes, args, split_size=SPLIT_SIZE, stdin=None, spill_bytes=SPILL_BYTES):
+	"""
+	Function that runs several jobs over the same input, reading and decoding it only once.
+	:param job_classes: list of MRJob classes, with different names
+	:param args: the command-line arguments of the jobs; their input paths are the input of the scan
+	:param split_size: number of bytes of input per map task
+	:param stdin: binary stream read if the input is stdin
+	:param spill_bytes: number of bytes of map output each job keeps in memory before it is written to disk
+	:return: (outputs, timings): outputs is {job name: list of encoded output lines}, timings is {'scan': seconds
+	spent reading and decoding the input, job name: {'map', 'reduce', 'total'} seconds}
+	"""
+	jobs = [ScanJob(job_class, args, spill_bytes) for job_class in job_classes]
+	names = [job.job_class.__name__ for job in jobs]
+	if len(set(names)) != len(names):
+		raise ValueError('the jobs of a shared scan must have different names')
+
+	# the jobs that read their input with the same protocol share the decoding of the lines
+	by_protocol = {}
+	for job in jobs:
+		by_protocol.setdefault(type(job.job.input_protocol()), []).append(job)
+	scan_time = 0.0
+	splits = input_splits(jobs[0].job.options.args, split_size, stdin)
+	while True:
+		scan_start = time.perf_counter()
+		split = next(splits, None)
+		scan_time += time.perf_counter() - scan_start
+		if split is None:
+			break
+		path, start, lines = split
+		for protocol_jobs in by_protocol.values():
+			scan_start = time.perf_counter()
+			read = protocol_jobs[0].job.pick_protocols(0, 'mapper')[0]
+			pairs = [read(line.rstrip(b'\r\n')) for line in lines]
+			scan_time += time.perf_counter() - scan_start
+			for job in protocol_jobs:
+				job.map_split(path, start, pairs, lines)
+
+	outputs = {name: job.finish() for name, job in zip(names, jobs)}
+	timings = {'scan': scan_time}
+	timings.update((name, job.timings) for name, job in zip(names, jobs))
+	return outputs, timings
+
+
+def write_outputs(outputs, timings, output_dir=None):
+	"""
+	Function that writes the output of the jobs of a shared scan, and prints the timings.
+	:param outputs: {job name: list of encoded output lines}
+	:param timings: the timings returned by run_shared_scan
+	:param output_dir: directory where the output of each job is written to a file named after the job; by default,
+	the outputs are written to stdout, each one after the name of its job
+	"""
+	for name, lines in outputs.items():
+		if output_dir:
+			os.makedirs(output_dir, exist_ok=True)
+			with open(os.path.join(output_dir, name), 'wb') as out:
+				out.writelines(lines)
+		else:
+			sys.stdout.write('%s\n' % name)
+			sys.stdout.flush()
+			sys.stdout.buffer.writelines(lines)
+			sys.stdout.buffer.flush()
+	print('scan time: ', timings['scan'])
+	for name in outputs:
+		print('%s time: ' % name, timings[name]['total'])
+
+
+def load_job_class(name):
+	"""
+	Function that imports an MRJob class.
+	:param name: 'module.Class'
+	:return: the class
+	"""
+	module, _, class_name = name.rpartition('.')
+	return getattr(importlib.import_module(module), class_name)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Run several MRJobs over one read of their input.')
+	parser.add_argument('jobs', nargs='+', help='the jobs, as module.Class')
+	parser.add_argument('--output-dir', help='directory for the output of the jobs, one file per job')
+	parser.add_argument('--split-size', type=int, default=SPLIT_SIZE, help='number of bytes of input per map task')
+	parser.add_argument('--spill-bytes', type=int, default=SPILL_BYTES,
+						help='number of bytes of map output each job keeps in memory before it is written to disk')
+	argv = sys.argv[1:]
+	# the arguments after -- are those of the jobs
+	job_args = argv[argv.index('--') + 1:] if '--' in argv else []
+	args = parser.parse_args(argv[:argv.index('--')] if '--' in argv else argv)
+
+	sys.path.insert(0, os.getcwd())
+	outputs, timings = run_shared_scan([load_job_class(name) for name in args.jobs], job_args, args.split_size,
+									   spill_bytes=args.spill_bytes)
+	write_outputs(outputs, timings, args.output_dir)
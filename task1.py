@@ -1,48 +1,141 @@
+import logging
+import os
 import time
-import nltk
-nltk.download('punkt')
-nltk.download('averaged_perceptron_tagger')
-nltk.download('universal_tagset')
 from mrjob.job import MRJob
 from mrjob.step import MRStep
 
+from heavy_hitters import SpaceSaving
+from keyword_counts import count_words, merge_counts, top_keywords
+from nltk_resources import BUNDLED_DATA_DIR
+from title_processing import TitleProcessor, parse_movie_line, process_titles
+from token_cache import cached_movie, is_cache_valid, load_token_cache
+from vocabulary import InternedProtocol, load_vocabulary
+
+log = logging.getLogger(__name__)
+
 
 class MovieGenreKeywords(MRJob):
+	# the helper module has to be uploaded next to the job when it runs in separate processes
+	FILES = ['heavy_hitters.py', 'keyword_counts.py', 'nltk_resources.py', 'title_processing.py', 'token_cache.py',
+			 'vocabulary.py']
+	
+	def dirs(self):
+		# the NLTK data bundled with the jobs, if there is any, is uploaded too, so the workers don't need to
+		# download it
+		if os.path.isdir(BUNDLED_DATA_DIR):
+			return [BUNDLED_DATA_DIR]
+		return []
+	
+	def configure_args(self):
+		super(MovieGenreKeywords, self).configure_args()
+		self.add_passthru_arg('--tagging-batch-size', type=int, default=256,
+							  help='number of titles sent to the POS tagger in one call')
+		self.add_passthru_arg('--tagging-processes', type=int, default=1,
+							  help='number of worker processes used by each mapper for POS tagging')
+		self.add_passthru_arg('--title-cache-size', type=int, default=10000,
+							  help='maximum number of processed titles each mapper keeps in memory')
+		self.add_passthru_arg('--mode', choices=['classic', 'single-pass', 'counts', 'streaming'], default='classic',
+							  help='classic runs the original three steps; single-pass counts the words inside the '
+								   'mappers and selects the top keywords in a single step; counts is the same step, '
+								   'but returns every word count of each genre; streaming keeps a fixed-size '
+								   'approximate summary per genre and reports error bounds')
+		self.add_passthru_arg('--top-k', type=int, default=10,
+							  help='number of keywords returned for each genre in single-pass and streaming mode')
+		self.add_passthru_arg('--summary-size', type=int, default=1000,
+							  help='number of counters kept for each genre in streaming mode')
+		self.add_file_arg('--token-cache',
+						  help='token cache built by token_cache.py; cached titles are not tagged again')
+		self.add_file_arg('--vocab',
+						  help='vocabulary built by vocabulary.py; in classic mode, the steps exchange word ids '
+							   'instead of JSON-encoded words')
+	
+	def is_interned(self):
+		"""
+		Function that checks whether the classic steps run on interned word ids.
+		:return: True if a vocabulary was given in classic mode, False otherwise
+		"""
+		return self.options.mode == 'classic' and self.options.vocab is not None
+	
+	def internal_protocol(self):
+		if self.is_interned():
+			return InternedProtocol()
+		return super(MovieGenreKeywords, self).internal_protocol()
+	
+	def run_job(self):
+		# a cache built from another version of the input is still used for the rows that did not change, but we
+		# let the user know that the other rows will be tagged again
+		if self.options.token_cache and self.options.args:
+			# stdin and the other inputs that are not regular files (e.g. pipes) cannot be read twice to be hashed
+			if not all(os.path.isfile(path) for path in self.options.args):
+				log.warning('token cache %s cannot be checked against input that is not a regular file; the rows '
+							'that changed will still be tagged again' % self.options.token_cache)
+			elif not is_cache_valid(self.options.token_cache, self.options.args):
+				log.warning('token cache %s was not built from this input; changed rows will be tagged again'
+							% self.options.token_cache)
+		super(MovieGenreKeywords, self).run_job()
+	
+	def mapper_init_1(self):
+		"""
+		Initialises the title processor, the buffer of movies waiting to be tagged and, if one was given, the
+		token cache.
+		"""
+		self.title_processor = TitleProcessor(cache_size=self.options.title_cache_size,
+											  batch_size=self.options.tagging_batch_size,
+											  processes=self.options.tagging_processes)
+		self.pending_movies = []
+		self.token_cache = load_token_cache(self.options.token_cache) if self.options.token_cache else {}
 	
 	def mapper_1(self, _, line):
 		"""
-        Mapper that reads the input file line by line and returns a (genre, partial_title) pair for each genre of the
-        movie. The partial_title is the original title without numerals, punctuation marks, adverbs, conjunctions etc.
-        ans is obtained using the function remove_title_words.
-        :param _: None
-        :param line: the line of the file that is being read
-        :return: (genre, partial_title)
-        """
-		# first, I eliminate all possible trailing empty spaces and convert the text to lowercase
-		line = line.strip().lower()
-		
-		# the titles are written in the file in two ways: [id, title, genres] or [id, "title", genres]; the "title"
-		# may include commas and quotations marks inside it, so it needs a different delimiter
-		if line.find('"') > -1:
-			# I use ',"' to separate the index from the rest of the line
-			aux = line.split(',"')
-			aux = aux[1]
-			# I use '",' to separate the title and the genre
-			[title, genres] = aux.split('",')
+		Mapper that reads the input file line by line and returns a (genre, partial_title) pair for each genre of the
+		movie. The partial_title is the original title without numerals, punctuation marks, adverbs, conjunctions etc.
+		ans is obtained from the token cache or using the title processor. The movies are buffered, so their titles
+		are tagged once (whatever the number of genres) and in batches, --tagging-processes batches at a time.
+		:param _: None
+		:param line: the line of the file that is being read
+		:return: (genre, partial_title)
+		"""
+		# if the line was cached, its partial title is already known
+		cached = cached_movie(self.token_cache, line)
+		if cached is not None:
+			genres, partial_title = cached
+			self.pending_movies.append((None, genres, partial_title))
 		else:
-			# in case of [id, title, genres] U use the comma as a delimiter
-			words = line.split(',')
-			title = words[1]
-			genres = words[2]
+			_, title, genres = parse_movie_line(line)
+			# the program also reads the first line of the input file, which contains the names of the columns and
+			# has no genres; there is nothing to return for it
+			if genres:
+				self.pending_movies.append((title, genres, None))
 		
-		# I isolate each genre
-		genres = genres.split('|')
+		# every tagging process gets a whole batch
+		if len(self.pending_movies) >= self.options.tagging_batch_size * max(1, self.options.tagging_processes):
+			for pair in self.flush_movies():
+				yield pair
+	
+	def mapper_final_1(self):
+		"""
+		Returns the (genre, partial_title) pairs of the movies still waiting in the buffer.
+		:return: (genre, partial_title)
+		"""
+		for pair in self.flush_movies():
+			yield pair
+		self.title_processor.close()
+	
+	def flush_movies(self):
+		"""
+		Function that tags the buffered titles that were not cached in one batch and returns a (genre, partial_title)
+		pair for each genre of each buffered movie, in the order in which the movies were read.
+		:return: (genre, partial_title)
+		"""
+		movies, self.pending_movies = self.pending_movies, []
+		processed = iter(self.title_processor.process_batch(
+			[title for title, _, partial_title in movies if partial_title is None]))
 		
-		for genre in genres:
-			# the program also reads the first line of the input file, which contains the names of the columns; I added
-			# this condition in order to ignore the first line
-			if (genre != 'genres'):
-				yield genre, self.remove_title_words(title)
+		for _, genres, partial_title in movies:
+			if partial_title is None:
+				partial_title = next(processed)
+			for genre in genres:
+				yield genre, partial_title
 	
 	def reducer_1(self, genre, title):
 		"""
@@ -124,9 +217,293 @@ class MovieGenreKeywords(MRJob):
 		# so we transform it into a list
 		yield genre, list(word)
 	
+	def mapper_init_counts(self):
+		"""
+		Initialises everything mapper_1 needs and the per-genre word counts of this mapper.
+		"""
+		self.mapper_init_1()
+		self.genre_counts = {}
+	
+	def mapper_counts(self, _, line):
+		"""
+		Mapper that processes the titles like mapper_1, but counts their words by genre in memory instead of
+		returning them, so nothing leaves the mapper before mapper_final_counts.
+		:param _: None
+		:param line: the line of the file that is being read
+		"""
+		for genre, partial_title in self.mapper_1(_, line):
+			count_words(self.genre_counts.setdefault(genre, {}), partial_title)
+		# this mapper returns nothing for each line, but it still needs to be a generator
+		return
+		yield
+	
+	def mapper_final_counts(self):
+		"""
+		Returns the word counts of this mapper, one dictionary per genre.
+		:return: (genre, {word: number_of_occurrences})
+		"""
+		for genre, partial_title in self.mapper_final_1():
+			count_words(self.genre_counts.setdefault(genre, {}), partial_title)
+		
+		for genre, counts in self.genre_counts.items():
+			yield genre, counts
+	
+	def combiner_counts(self, genre, counts):
+		"""
+		Combiner that merges the word count dictionaries of a genre.
+		:param genre: the genre of a movie
+		:param counts: generator of {word: number_of_occurrences} dictionaries
+		:return: (genre, {word: number_of_occurrences})
+		"""
+		merged = {}
+		for partial_counts in counts:
+			merge_counts(merged, partial_counts)
+		yield genre, merged
+	
+	def reducer_counts(self, genre, counts):
+		"""
+		Reducer that merges the word count dictionaries of a genre and returns its top keywords; its memory is
+		proportional to the vocabulary of the genre, not to its number of titles.
+		:param genre: the genre of a movie
+		:param counts: generator of {word: number_of_occurrences} dictionaries
+		:return: (genre, top_k_keywords), or (genre, {word: number_of_occurrences}) in counts mode
+		"""
+		merged = {}
+		for partial_counts in counts:
+			merge_counts(merged, partial_counts)
+		
+		# in counts mode, the whole dictionary is returned, e.g. to update a saved state
+		if self.options.mode == 'counts':
+			yield genre, merged
+		else:
+			yield genre, [word for word, _ in top_keywords(merged, self.options.top_k)]
+	
+	def mapper_init_streaming(self):
+		"""
+		Initialises everything mapper_1 needs and the per-genre Space-Saving summaries of this mapper.
+		"""
+		self.mapper_init_1()
+		self.genre_summaries = {}
+	
+	def update_summary(self, genre, partial_title):
+		"""
+		Function that adds the words of a processed title to the summary of its genre.
+		:param genre: the genre of a movie
+		:param partial_title: the processed title
+		"""
+		summary = self.genre_summaries.get(genre)
+		if summary is None:
+			summary = self.genre_summaries[genre] = SpaceSaving(self.options.summary_size)
+		for word in partial_title.split(' '):
+			if word != '':
+				summary.update(word)
+	
+	def mapper_streaming(self, _, line):
+		"""
+		Mapper that processes the titles like mapper_1 and adds their words to the summary of each genre; the memory
+		used by the summaries does not depend on the number of movies.
+		:param _: None
+		:param line: the line of the file that is being read
+		"""
+		for genre, partial_title in self.mapper_1(_, line):
+			self.update_summary(genre, partial_title)
+		# this mapper returns nothing for each line, but it still needs to be a generator
+		return
+		yield
+	
+	def mapper_final_streaming(self):
+		"""
+		Returns the summaries of this mapper, one per genre.
+		:return: (genre, summary_dictionary)
+		"""
+		for genre, partial_title in self.mapper_final_1():
+			self.update_summary(genre, partial_title)
+		
+		for genre, summary in self.genre_summaries.items():
+			yield genre, summary.to_dict()
+	
+	def combiner_streaming(self, genre, summaries):
+		"""
+		Combiner that merges the summaries of a genre.
+		:param genre: the genre of a movie
+		:param summaries: generator of summary dictionaries
+		:return: (genre, summary_dictionary)
+		"""
+		yield genre, self.merge_summaries(summaries).to_dict()
+	
+	def reducer_streaming(self, genre, summaries):
+		"""
+		Reducer that merges the summaries of a genre and returns its top keywords with their error bounds: each word
+		occurred between count - error and count times.
+		:param genre: the genre of a movie
+		:param summaries: generator of summary dictionaries
+		:return: (genre, [[word, count, error]])
+		"""
+		yield genre, self.merge_summaries(summaries).top(self.options.top_k)
+	
+	def merge_summaries(self, summaries):
+		"""
+		Function that merges a sequence of summary dictionaries.
+		:param summaries: generator of summary dictionaries
+		:return: SpaceSaving summary
+		"""
+		merged = SpaceSaving(self.options.summary_size)
+		for summary in summaries:
+			merged.merge(SpaceSaving.from_dict(summary))
+		return merged
+	
+	def mapper_init_interned_1(self):
+		"""
+		Initialises everything mapper_1 needs and the {word: id} dictionary of the vocabulary.
+		"""
+		self.mapper_init_1()
+		self.word_ids = {word: i for i, word in enumerate(load_vocabulary(self.options.vocab))}
+	
+	def intern(self, partial_title):
+		"""
+		Function that replaces the words of a processed title by their ids; the words missing from the vocabulary
+		are kept as they are.
+		:param partial_title: the processed title
+		:return: list of word ids
+		"""
+		return [self.word_ids.get(word, word) for word in partial_title.split(' ') if word != '']
+	
+	def mapper_interned_1(self, _, line):
+		"""
+		Mapper that works like mapper_1, but returns the processed titles as lists of word ids.
+		:param _: None
+		:param line: the line of the file that is being read
+		:return: (genre, [word_ids])
+		"""
+		for genre, partial_title in self.mapper_1(_, line):
+			yield genre, self.intern(partial_title)
+	
+	def mapper_final_interned_1(self):
+		"""
+		Returns the interned titles of the movies still waiting in the buffer.
+		:return: (genre, [word_ids])
+		"""
+		for genre, partial_title in self.mapper_final_1():
+			yield genre, self.intern(partial_title)
+	
+	def reducer_interned_1(self, genre, titles):
+		"""
+		Reducer that groups the interned titles by genre; mapper_2 does not need to know where a title ends, so the
+		ids are returned as a single list.
+		:param genre: the genre of a movie
+		:param titles: generator of lists of word ids
+		:return: (genre, [word_ids])
+		"""
+		yield genre, [word_id for title in titles for word_id in title]
+	
+	def mapper_interned_2(self, genre, word_ids):
+		"""
+		Mapper that returns (genre, [word_id, 1]) for each word of a genre.
+		:param genre: the genre of a movie
+		:param word_ids: the list of word ids of the genre
+		:return: (genre, [word_id, 1])
+		"""
+		for word_id in word_ids:
+			yield genre, [word_id, 1]
+	
+	def merge_interned_counts(self, pairs):
+		"""
+		Function that adds up flat [word_id, count, word_id, count, ...] lists.
+		:param pairs: generator of flat lists
+		:return: dictionary of {word_id: number_of_occurrences}, in order of first appearance
+		"""
+		word_dict = {}
+		for pair in pairs:
+			for i in range(0, len(pair), 2):
+				word_dict[pair[i]] = word_dict.get(pair[i], 0) + pair[i + 1]
+		return word_dict
+	
+	def combiner_interned_2(self, genre, pairs):
+		"""
+		Combiner that works like combiner_2, but returns the counts as a flat [word_id, count, ...] list.
+		:param genre: the genre of a movie
+		:param pairs: generator of flat [word_id, count, ...] lists
+		:return: (genre, [word_id, count, ...])
+		"""
+		yield genre, [item for pair in self.merge_interned_counts(pairs).items() for item in pair]
+	
+	def reducer_interned_2(self, genre, pairs):
+		"""
+		Reducer that works like reducer_2 on interned counts and returns the 10 most used word ids with their counts.
+		reducer_2 only reads the first dictionary of a genre, while this one adds up all the lists it gets; they only
+		differ if a genre gets several lists, which does not happen, since the input of the step has one line per
+		genre and the combiner turns it into a single list. The ties are ordered like in reducer_2, by first
+		appearance of the word in the titles of the genre, since both dictionaries keep that order and the sort is
+		stable.
+		:param genre: the genre of a movie
+		:param pairs: generator of flat [word_id, count, ...] lists
+		:return: (genre, [word_id, count, ...])
+		"""
+		top = sorted(self.merge_interned_counts(pairs).items(), key=lambda el: el[1], reverse=True)[:10]
+		yield genre, [item for pair in top for item in pair]
+	
+	def mapper_interned_3(self, genre, pairs):
+		"""
+		Mapper that eliminates the word counts from the previous reducer's output.
+		:param genre: the genre of a movie
+		:param pairs: flat [word_id, count, ...] list
+		:return: (genre, [word_id])
+		"""
+		for i in range(0, len(pairs), 2):
+			yield genre, [pairs[i]]
+	
+	def reducer_init_interned_3(self):
+		"""
+		Loads the vocabulary, to turn the ids back into words.
+		"""
+		self.vocab = load_vocabulary(self.options.vocab)
+	
+	def reducer_interned_3(self, genre, word_ids):
+		"""
+		Reducer that works like reducer_3, but also turns the ids back into words.
+		:param genre: the genre of a movie
+		:param word_ids: generator of [word_id] lists
+		:return: (genre, top_ten_keywords)
+		"""
+		yield genre, [self.vocab[word_id] if isinstance(word_id, int) else word_id for [word_id] in word_ids]
+	
 	def steps(self):
+		if self.options.mode == 'streaming':
+			return [
+				MRStep(mapper_init=self.mapper_init_streaming,
+					   mapper=self.mapper_streaming,
+					   mapper_final=self.mapper_final_streaming,
+					   combiner=self.combiner_streaming,
+					   reducer=self.reducer_streaming)
+			]
+		
+		if self.is_interned():
+			return [
+				MRStep(mapper_init=self.mapper_init_interned_1,
+					   mapper=self.mapper_interned_1,
+					   mapper_final=self.mapper_final_interned_1,
+					   reducer=self.reducer_interned_1),
+				MRStep(mapper=self.mapper_interned_2,
+					   combiner=self.combiner_interned_2,
+					   reducer=self.reducer_interned_2),
+				MRStep(mapper=self.mapper_interned_3,
+					   reducer_init=self.reducer_init_interned_3,
+					   reducer=self.reducer_interned_3)
+			]
+		
+		if self.options.mode in ('single-pass', 'counts'):
+			return [
+				MRStep(mapper_init=self.mapper_init_counts,
+					   mapper=self.mapper_counts,
+					   mapper_final=self.mapper_final_counts,
+					   combiner=self.combiner_counts,
+					   reducer=self.reducer_counts)
+			]
+		
 		return [
-			MRStep(mapper=self.mapper_1,
+			MRStep(mapper_init=self.mapper_init_1,
+				   mapper=self.mapper_1,
+				   mapper_final=self.mapper_final_1,
 				   reducer=self.reducer_1),
 			MRStep(mapper=self.mapper_2,
 				   combiner=self.combiner_2,
@@ -141,29 +518,7 @@ class MovieGenreKeywords(MRJob):
 		:param title: the original title
 		:return: the processed title
 		"""
-		#  since all the titles end with the year they were produced in, I eliminate the year
-		title = title[:title.find('(')]
-		
-		# using the nltk package, the title is tokenised and then each token (word) is tagged as a part of speech
-		text = nltk.word_tokenize(title)
-		tagged = nltk.pos_tag(text, 'universal')
-		
-		# list of undesirable parts of speech (adposition, adverb, conjunction, determiner/article, particle,
-		# punctuation marks, other); more info at https://www.nltk.org/book/ch05.html
-		remove_pos = ['ADP', 'ADV', 'CONJ', 'DET', 'PRT', '.', 'NUM', 'X']
-		# list of words that have appeared in practice in the final top 10 keywords and which shouldn't be keywords;
-		# the tagger fails to identify them as undesirable parts of speech (e.g. 'ii' is considered a noun)
-		remove_words = ['a.k.a', '*', 'ii', 'iii']
-		final = ''
-		
-		for i in tagged:
-			# if the word is not an undesirable part of speech or an undesirable word, we add it to the result and
-			# add a space after it, so the string can be properly split later on
-			if i[1] not in remove_pos and i[0] not in remove_words:
-				final += (i[0] + ' ')
-		
-		# the processed title is returned without the last space at the end
-		return final[0:-1]
+		return process_titles([title])[0]
 
 
 if __name__ == '__main__':
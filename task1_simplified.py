@@ -1,14 +1,31 @@
 import time
 
-import nltk
 from mrjob.job import MRJob
 from mrjob.step import MRStep
 from collections import Counter
 
+from title_processing import REMOVE_WORDS, process_titles
+from token_cache import cached_movie, load_token_cache
+
 
 class MovieGenreKeywords(MRJob):
+	FILES = ['nltk_resources.py', 'title_processing.py', 'token_cache.py']
+	
+	def configure_args(self):
+		super(MovieGenreKeywords, self).configure_args()
+		self.add_file_arg('--token-cache')
+	
+	def mapper_init_1(self):
+		self.token_cache = load_token_cache(self.options.token_cache) if self.options.token_cache else {}
 	
 	def mapper_1(self, _, line):
+		cached = cached_movie(self.token_cache, line)
+		if cached is not None:
+			genres, title = cached
+			for genre in genres:
+				yield genre, title
+			return
+		
 		line = line.strip().lower()
 		if line.find('"') > -1:
 			
@@ -57,7 +74,8 @@ class MovieGenreKeywords(MRJob):
 	
 	def steps(self):
 		return [
-			MRStep(mapper=self.mapper_1,
+			MRStep(mapper_init=self.mapper_init_1,
+				   mapper=self.mapper_1,
 				   # combiner=self.combiner_1,
 				   reducer=self.reducer_1),
 			MRStep(mapper=self.mapper_2,
@@ -66,20 +84,7 @@ class MovieGenreKeywords(MRJob):
 		]
 	
 	def remove_title_words(self, title):
-		title = title[:title.find('(')]
-		text = nltk.word_tokenize(title)
-		
-		tagged = nltk.pos_tag(text, 'universal')
-		
-		remove_pos = ['ADP', 'ADV', 'CONJ', 'DET', 'PRT', '.', 'NUM', 'X']
-		remove_words = ['a.k.a', '*', 'ii', 'iii', '']
-		final = ''
-		
-		for i in tagged:
-			if i[1] not in remove_pos and i[0] not in remove_words:
-				final += (i[0] + ' ')
-		
-		return final[0:-1]
+		return process_titles([title], REMOVE_WORDS + [''])[0]
 
 
 if __name__ == '__main__':
@@ -1,11 +1,74 @@
+import codecs
+import itertools
+import os
 import re
 import time
 
+import numpy as np
 from mrjob.job import MRJob
+from mrjob.step import MRStep
+
+from edge_list import SPLIT_BYTES, parse_edges, parse_range_line, read_range, run_with_range_file
+from hot_keys import SAMPLE_BYTES, SPILL_VALUES, SortedSpill, chunks, load_hot_keys, run_with_hot_keys, sub_partition
+from job_rerun import is_task_process
+from link_graph import write_output_graph
 
 WORD_RE = re.compile(r"[\w']+") # match words
 
 class InvertWebLink(MRJob):
+	FILES = ['edge_list.py', 'heavy_hitters.py', 'hot_keys.py', 'job_rerun.py', 'link_graph.py']
+	
+	def configure_args(self):
+		super(InvertWebLink, self).configure_args()
+		self.add_passthru_arg('--csr',
+							  help='path of a file where the inverted graph is written in CSR form (see link_graph.py), '
+								   'instead of writing the JSON lists to the output')
+		self.add_passthru_arg('--edges', action='append',
+							  help='edge list (.txt or .gz) read in byte ranges by the fast parser of edge_list.py, '
+								   'instead of line by line; the input of the job is then a range file, written by '
+								   'the job if none is given; can be given several times')
+		self.add_passthru_arg('--split-bytes', type=int, default=SPLIT_BYTES,
+							  help='number of bytes of the edge lists per range when the range file is written by '
+								   'the job, and per sampled window of --hot-threshold')
+		self.add_passthru_arg('--hot-threshold', type=int,
+							  help='in-degree from which the in-links of a page are split into sub-partitions by '
+								   'ranges of IDs, written on separate lines (see hot_keys.py); the hot pages are found '
+								   'by sampling the input, unless --hot-keys is given')
+		self.add_file_arg('--hot-keys', help='hot keys written by hot_keys.py, as {to_id: [boundaries]}')
+		self.add_passthru_arg('--sample-bytes', type=int, default=SAMPLE_BYTES,
+							  help='number of bytes sampled at the start of every --split-bytes bytes of the input')
+		self.add_passthru_arg('--spill-values', type=int, default=SPILL_VALUES,
+							  help='number of in-links of a page kept in memory by a reducer of --hot-threshold '
+								   'before they are spilled to disk, and largest number of in-links on a line of the '
+								   'output')
+	
+	'''
+	With --edges and no range file, the range file is written and the job is run again with it; with --hot-threshold
+	and no --hot-keys, the hot keys are sampled and the job is run again with them; if --csr is given, the output files
+	of the reducers are written as a graph of link_graph.py
+	'''
+	def run_job(self):
+		if self.options.edges and not self.options.args:
+			run_with_range_file(self)
+			return
+		if self.options.hot_threshold and self.options.hot_keys is None:
+			run_with_hot_keys(self)
+			return
+		if self.options.csr is None:
+			super(InvertWebLink, self).run_job()
+			return
+		self.set_up_logging(quiet=self.options.quiet, verbose=self.options.verbose,
+							stream=codecs.getwriter('utf_8')(self.stderr))
+		with self.make_runner() as runner:
+			runner.run()
+			# the graph is written from the output files of the reducers, which must be local
+			output_paths = sorted(path for path in runner.fs.ls(runner.get_output_dir())
+								  if os.path.basename(path).startswith('part-'))
+			if not all(os.path.exists(path) for path in output_paths):
+				raise ValueError('--csr needs a runner that writes its output locally, like -r inline or -r local')
+			nodes, edges = write_output_graph(output_paths, self.options.csr)
+		if not self.options.quiet:
+			self.stderr.write(('%d nodes, %d edges written to %s\n' % (nodes, edges, self.options.csr)).encode('utf-8'))
 	
 	'''
 	Mapper takes each line of the file and, if it is of [from_id, to_id] form, returns a (to_id, from_id) pair
@@ -39,10 +102,104 @@ class InvertWebLink(MRJob):
 		# we just need to return it as a serializable object (because of JSON default protocol in MRJob),
 		# in this case a list
 		yield to_id, list(from_id)
+	
+	'''
+	Mapper that reads a byte range of an edge list with the fast parser and returns the pages linking to each page of
+	the range, with the IDs as integers
+	:param _: None
+	:param line: the current line of the range file, 'path start stop'
+	:return: (to_id, [from_id]) for each page linked to in the range
+	'''
+	def mapper_ranges(self, _, line):
+		edges = [parse_edges(chunk) for chunk in read_range(*parse_range_line(line))]
+		from_ids = np.concatenate([chunk_from_ids for chunk_from_ids, _ in edges] or [np.empty(0, dtype=np.int64)])
+		to_ids = np.concatenate([chunk_to_ids for _, chunk_to_ids in edges] or [np.empty(0, dtype=np.int64)])
+		if not len(to_ids):
+			return
+		# the edges are sorted by to_id, so the in-links of each page are consecutive
+		order = np.lexsort((from_ids, to_ids))
+		from_ids, to_ids = from_ids[order], to_ids[order]
+		bounds = np.flatnonzero(np.diff(to_ids)) + 1
+		for to_id, sources in zip(to_ids[np.concatenate(([0], bounds))].tolist(), np.split(from_ids, bounds)):
+			yield to_id, sources.tolist()
+	
+	'''
+	Reducer that merges the lists of pages linking to a page found by the mappers of the byte ranges
+	:param to_id: ID of the page that is linked to
+	:param from_ids: generator of lists of IDs of pages linking to page to_id
+	:return: (to_id, [from_id]), with the IDs sorted
+	'''
+	def reducer_ranges(self, to_id, from_ids):
+		yield to_id, sorted(itertools.chain.from_iterable(from_ids))
+	
+	'''
+	Loads the hot keys
+	'''
+	def mapper_init_hot(self):
+		self.hot_keys = load_hot_keys(self.options.hot_keys)
+	
+	'''
+	Mapper that reads the edges like mapper or mapper_ranges, and sends the in-links of each hot page to the
+	sub-partitions of their ranges of IDs
+	:param _: None
+	:param line: the current line of the input file or of the range file
+	:return: ([to_id, sub-partition], [from_id]); the sub-partition is 0 for the pages that are not hot
+	'''
+	def mapper_hot(self, _, line):
+		if self.options.edges:
+			edges = self.mapper_ranges(_, line)
+		else:
+			edges = ((int(to_id), [int(from_id)]) for to_id, from_id in self.mapper(_, line))
+		for to_id, from_ids in edges:
+			boundaries = self.hot_keys.get(to_id)
+			if boundaries is None:
+				yield [to_id, 0], from_ids
+			else:
+				partitions = {}
+				for from_id in from_ids:
+					partitions.setdefault(sub_partition(boundaries, from_id), []).append(from_id)
+				for partition, partition_ids in sorted(partitions.items()):
+					yield [to_id, partition], partition_ids
+	
+	'''
+	Combiner that concatenates the in-links of a sub-partition found by the mappers of a machine
+	:param key: [to_id, sub-partition]
+	:param from_ids: generator of lists of IDs of pages linking to page to_id
+	:return: ([to_id, sub-partition], [from_id])
+	'''
+	def combiner_hot(self, key, from_ids):
+		yield key, list(itertools.chain.from_iterable(from_ids))
+	
+	'''
+	Reducer that sorts the in-links of a sub-partition, spilling them to disk if there are too many; the
+	sub-partitions of a page are reduced separately and not merged, since their ranges of IDs do not overlap
+	:param key: [to_id, sub-partition]
+	:param from_ids: generator of lists of IDs of pages linking to page to_id
+	:return: (to_id, [from_id]), with the IDs sorted, in lists of at most --spill-values IDs
+	'''
+	def reducer_hot(self, key, from_ids):
+		with SortedSpill(self.options.spill_values) as values:
+			for part in from_ids:
+				values.extend(part)
+			for chunk in chunks(values, self.options.spill_values):
+				yield key[0], chunk
+	
+	def steps(self):
+		if self.options.hot_keys:
+			# the mappers of the byte ranges already group the in-links of each page
+			return [MRStep(mapper_init=self.mapper_init_hot,
+						   mapper=self.mapper_hot,
+						   combiner=None if self.options.edges else self.combiner_hot,
+						   reducer=self.reducer_hot)]
+		if self.options.edges:
+			return [MRStep(mapper=self.mapper_ranges, reducer=self.reducer_ranges)]
+		return [MRStep(mapper=self.mapper, reducer=self.reducer)]
 
 
 if __name__ == '__main__':
 	start = time.time()
 	InvertWebLink.run()
 	end = time.time()
-	print('execution time: ', end - start)
+	# the tasks run by the runners (-r local, ...) write their output to stdout
+	if not is_task_process():
+		print('execution time: ', end - start)
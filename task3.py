@@ -1,41 +1,110 @@
 import math
-import re
 from collections import Counter
 import time
 import numpy as np
 from mrjob.job import MRJob
 from mrjob.step import MRStep
 
-unlabeled_data = re.compile(r"\w")
+from feature_stats import SCALINGS, Scaler, cached_stats
+from feature_store import FeatureStore, check_store
+from job_rerun import rerun_with_args
+from kdtree import kdtree_neighbours
+from knn_distance import k_smallest, nearest_neighbours, parse_features
+from knn_queries import block_bounds, is_query_row, load_queries, run_with_query_file
 
 class KNNMapReduce(MRJob):
+	FILES = ['feature_stats.py', 'feature_store.py', 'job_rerun.py', 'kdtree.py', 'knn_distance.py', 'knn_queries.py']
+	
+	def configure_args(self):
+		super(KNNMapReduce, self).configure_args()
+		self.add_passthru_arg('--k', type=int, default=15)
+		self.add_file_arg('--queries')
+		self.add_passthru_arg('--query-block-size', type=int, default=1000)
+		self.add_passthru_arg('--backend', choices=['brute', 'kdtree'], default='brute')
+		self.add_passthru_arg('--leaf-size', type=int, default=32)
+		self.add_passthru_arg('--scaling', choices=SCALINGS, default='none')
+		self.add_file_arg('--stats')
+		self.add_file_arg('--store')
+		self.add_passthru_arg('--store-chunk-size', type=int, default=100000)
+	
+	def load_args(self, args):
+		super(KNNMapReduce, self).load_args(args)
+		if self.options.k < 1:
+			self.arg_parser.error('--k must be at least 1')
+	
+	def run_job(self):
+		stale = check_store(self.options.store, self.options.args) if self.options.store else None
+		if stale:
+			self.arg_parser.error('%s; rebuild it with feature_store.py' % stale)
+		if self.options.scaling != 'none' and self.options.stats is None:
+			if not self.options.args or '-' in self.options.args:
+				self.arg_parser.error('--stats is required when the input is read from stdin')
+			rerun_with_args(self, ['--stats', cached_stats(self.options.args)])
+		elif self.options.queries is None:
+			run_with_query_file(self)
+		else:
+			super(KNNMapReduce, self).run_job()
+	
+	def mapper_init_1(self):
+		self.num_blocks = len(block_bounds(len(load_queries(self.options.queries)), self.options.query_block_size))
 	
 	def mapper_1(self, _, line):
 		aux = line.split(',')
-		if aux[0].isnumeric():
-			yield aux[-1], aux[:-1]
+		if aux[0].isnumeric() and not is_query_row(aux):
+			for block in range(self.num_blocks):
+				yield [block, aux[-1]], aux[:-1]
 	
-	def reducer_1(self, species, features):
-		if species == '':
-			global unlabeled_data
-			unlabeled_data = list(features)
-		else:
-			yield species, list(features)
+	def reducer_1(self, block_species, features):
+		yield block_species, list(features)
+	
+	def mapper_store_1(self, _, line):
+		return iter(())
 	
-	def mapper_2(self, species, features):
-		for el in unlabeled_data:
-			for feature in features:
-				yield el[0], (self.euclidean_distance(el[1:], feature[1:]), species)
-		# yield species[''], list(features)
+	def mapper_final_store_1(self):
+		num_chunks = len(FeatureStore(self.options.store).chunks(self.options.store_chunk_size))
+		for block in range(self.num_blocks):
+			for chunk in range(num_chunks):
+				yield [block, chunk], None
+	
+	def reducer_store_1(self, block_chunk, _):
+		yield block_chunk, None
+	
+	def mapper_init_2(self):
+		query_rows = load_queries(self.options.queries)
+		self.query_blocks = block_bounds(len(query_rows), self.options.query_block_size)
+		self.scaler = Scaler(self.options.stats, self.options.scaling)
+		self.unlabeled_ids, unlabeled_features = parse_features(query_rows)
+		self.unlabeled_features = self.scaler.transform(unlabeled_features)
+		if self.options.store:
+			self.store = FeatureStore(self.options.store)
+			self.store_chunks = self.store.chunks(self.options.store_chunk_size)
+	
+	def mapper_2(self, block_species, features):
+		block, species = block_species
+		_, labeled_features = parse_features(features)
+		return self.k_nearest(block, species, labeled_features)
+	
+	def mapper_store_2(self, block_chunk, _):
+		block, chunk = block_chunk
+		start, stop, species = self.store_chunks[chunk]
+		return self.k_nearest(block, species, np.asarray(self.store.features[start:stop], dtype=np.float64))
+	
+	def k_nearest(self, block, species, labeled_features):
+		start, stop = self.query_blocks[block]
+		labeled_features = self.scaler.transform(labeled_features)
+		queries = self.unlabeled_features[start:stop]
+		if self.options.backend == 'kdtree':
+			neighbours = kdtree_neighbours(queries, labeled_features, self.options.k, self.options.leaf_size)
+		else:
+			neighbours = nearest_neighbours(queries, labeled_features, self.options.k)
+		for i, distances, _ in neighbours:
+			yield self.unlabeled_ids[start + i], [(float(distance), species) for distance in distances]
 	
 	def combiner_2(self, uf, distances):
-		# list_d = list(distances)
-		yield uf, list(distances)
+		yield uf, k_smallest(distances, self.options.k)
 		
 	def reducer_2(self, uf, distances):
-		list_d = [item for sublist in list(distances) for item in sublist]
-		list_d.sort()
-		yield uf, list_d[:15]
+		yield uf, k_smallest(distances, self.options.k)
 		
 	def mapper_3(self, uf, distances):
 		for i in distances:
@@ -48,10 +117,19 @@ class KNNMapReduce(MRJob):
 	# def reducer_3(self, uf, distances):
 	
 	def steps(self):
+		if self.options.store:
+			step_1 = MRStep(mapper_init=self.mapper_init_1,
+							mapper=self.mapper_store_1,
+							mapper_final=self.mapper_final_store_1,
+							reducer=self.reducer_store_1)
+		else:
+			step_1 = MRStep(mapper_init=self.mapper_init_1,
+							mapper=self.mapper_1,
+							reducer=self.reducer_1)
 		return [
-			MRStep(mapper=self.mapper_1,
-				   reducer=self.reducer_1),
-			MRStep(mapper=self.mapper_2,
+			step_1,
+			MRStep(mapper_init=self.mapper_init_2,
+				   mapper=self.mapper_store_2 if self.options.store else self.mapper_2,
 				   combiner=self.combiner_2,
 				   reducer=self.reducer_2),
 			MRStep(mapper=self.mapper_3,
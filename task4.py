@@ -1,55 +1,83 @@
 import math
-import time
+import sys
+from mrjob.compat import jobconf_from_env
 from mrjob.job import MRJob
 from mrjob.step import MRStep
 
+from job_rerun import is_task_process, job_class_jobconf, task_job_class
+from shared_scan import run_shared_scan, write_outputs
+
+BLOCK_BYTES = 65536
+
 
 class FrobeniusNormIndex(MRJob):
 	"""
 	In this class, I show how we can calculate the Frobenius norm using a key for the MapReduce, in this case
-	the index of the matrix line that is being read.
+	the block of the matrix the line that is being read belongs to.
+	
+	The blocks are the --block-bytes byte ranges of the input file, so a line is in block (position of the line in the
+	file) // --block-bytes; the position comes from the start of the split of the mapper, which the runners pass in
+	mapreduce.map.input.start, and from the lengths of the lines read before. So the keys do not depend on how the
+	file is split among the mappers, and the reducers get blocks of about the same number of rows. The lines are
+	assumed to end with a single '\n'.
 	"""
-	# in order to use the index of the line we are reading as key, we need to save it in a variable
-	index = -1
+	FILES = ['job_rerun.py', 'shared_scan.py']
+	
+	def configure_args(self):
+		super(FrobeniusNormIndex, self).configure_args()
+		self.add_passthru_arg('--block-bytes', type=int, default=BLOCK_BYTES,
+							  help='number of bytes of the input file per block of rows')
+	
+	def jobconf(self):
+		# the tasks started by the runners run this script, which must tell which of its jobs they belong to
+		return job_class_jobconf(self, super(FrobeniusNormIndex, self).jobconf())
+	
+	def mapper_init_1(self):
+		"""
+		Reads the position of the split of the mapper in the input file.
+		"""
+		self.offset = int(jobconf_from_env('mapreduce.map.input.start', 0))
 	
 	def mapper_1(self, _, line):
 		"""
-		Mapper that reads the file line by line and returns (line_index, squared_absolute_value) for each number.
+		Mapper that reads the file line by line and returns (block_index, squared_absolute_value) for each number.
 		:param _: None
 		:param line: the current line of the file
-		:return: (line_index, squared_absolute_value)
+		:return: (block_index, squared_absolute_value)
 		"""
-		# we increase the index for each line we read
-		FrobeniusNormIndex.index += 1
+		# the block of the line is given by its position in the file
+		block = self.offset // max(1, self.options.block_bytes)
+		self.offset += len(line.encode('utf-8')) + 1
 		# we split the line along the spaces between the numbers to get the numbers
 		for number in line.split(' '):
 			# the numbers are read as strings, so we convert them to float; then, we square their absolute value
-			# we return a (line_index, squared_absolute_value) pair for each number
-			yield self.index, abs(float(number)) ** 2
+			# we return a (block_index, squared_absolute_value) pair for each number
+			yield block, abs(float(number)) ** 2
 			
 	def reducer_1(self, index, number):
 		"""
-		Reducer that groups the new values by row and returns their sum.
-		:param index: the index of the matrix line the number was read from, used as key; we don't actually use it,
+		Reducer that groups the new values by block of rows and returns their sum.
+		:param index: the index of the block of rows the number was read from, used as key; we don't actually use it,
 		but we pass it as an input argument so that the reducer knows how to group the numbers
 		:param number: the squared absolute value of one element of the matrix
-		:return: (None, row_sum = the sum of the numbers on the same one row)
+		:return: (None, row_sum = the sum of the numbers of the same block of rows)
 		"""
 		# since we are just going to add together all the row sums, we don't need a key
 		yield None, sum(number)
 		
 	def reducer_2(self, _, row_sum):
 		"""
-		Reducer that takes all the row sums and returns the Frobenius norm.
+		Reducer that takes all the block sums and returns the Frobenius norm.
 		:param _: None
-		:param row_sum: the sum of all the elements of a row
+		:param row_sum: the sum of all the elements of a block of rows
 		:return: (None, Frobenius_norm = sqrt(sum(row_sum)) )
 		"""
 		yield None, math.sqrt(sum(row_sum))
 		
 	def steps(self):
 		return [
-			MRStep(mapper=self.mapper_1,
+			MRStep(mapper_init=self.mapper_init_1,
+				   mapper=self.mapper_1,
 				   reducer=self.reducer_1),
 			MRStep(reducer=self.reducer_2)
 		]
@@ -58,6 +86,17 @@ class FrobeniusNormNoIndex(MRJob):
 	"""
 	In this class, I show that we can calculate the Frobenius norm without using a key for the MapReduce.
 	"""
+	FILES = ['job_rerun.py', 'shared_scan.py']
+	
+	def configure_args(self):
+		super(FrobeniusNormNoIndex, self).configure_args()
+		# task4.py runs both jobs with the same arguments, so this job accepts the option of FrobeniusNormIndex
+		self.add_passthru_arg('--block-bytes', type=int, default=BLOCK_BYTES,
+							  help='not used by this job, see FrobeniusNormIndex')
+	
+	def jobconf(self):
+		# the tasks started by the runners run this script, which must tell which of its jobs they belong to
+		return job_class_jobconf(self, super(FrobeniusNormNoIndex, self).jobconf())
 	
 	def mapper_1(self, _, line):
 		"""
@@ -100,8 +139,10 @@ class FrobeniusNormNoIndex(MRJob):
 
 
 if __name__ == '__main__':
-	start = time.time()
-	FrobeniusNormIndex.run()
-	FrobeniusNormNoIndex.run()
-	end = time.time()
-	print('execution time: ', end - start)
+	if is_task_process():
+		# this script is run as a task of one of the jobs by a runner like -r local
+		task_job_class([FrobeniusNormIndex, FrobeniusNormNoIndex]).run()
+	else:
+		# both jobs run over a single read of the matrix, with the time spent in each one
+		outputs, timings = run_shared_scan([FrobeniusNormIndex, FrobeniusNormNoIndex], sys.argv[1:])
+		write_outputs(outputs, timings)
@@ -1,87 +1,226 @@
 import math
+import sys
 import time
 from collections import Counter
+import numpy as np
 from mrjob.job import MRJob
 from mrjob.step import MRStep
-import pandas as pd
+
+from feature_stats import SCALINGS, Scaler, cached_stats
+from feature_store import FeatureStore, check_store
+from job_rerun import is_task_process, rerun_with_args
+from kdtree import kdtree_neighbours
+from knn_distance import k_smallest, nearest_neighbours, parse_features
+from knn_queries import block_bounds, is_query_row, load_queries, run_with_query_file
 
 class KNNMapReduce(MRJob):
-	# class variable used to store the feature values of the unlabeled data
-	unlabeled_data = []
+	FILES = ['feature_stats.py', 'feature_store.py', 'job_rerun.py', 'kdtree.py', 'knn_distance.py', 'knn_queries.py']
+	
+	def configure_args(self):
+		super(KNNMapReduce, self).configure_args()
+		self.add_passthru_arg('--k', type=int, default=15, help='number of nearest neighbours used to classify a point')
+		self.add_file_arg('--queries',
+						  help='file with the unlabeled rows (see knn_queries.py); by default, it is extracted from '
+							   'the input')
+		self.add_passthru_arg('--query-block-size', type=int, default=1000,
+							  help='number of unlabeled rows handled by one call of mapper_2; 0 for a single block')
+		self.add_passthru_arg('--backend', choices=['brute', 'kdtree'], default='brute',
+							  help='brute compares every unlabeled row with every labeled row; kdtree builds a KD-tree '
+								   'over the labeled rows of each call of mapper_2 and only visits the relevant parts')
+		self.add_passthru_arg('--leaf-size', type=int, default=32,
+							  help='maximum number of labeled rows in a leaf of the KD-tree')
+		self.add_passthru_arg('--scaling', choices=SCALINGS, default='none',
+							  help='scaling of the feature values, applied by the mappers (see feature_stats.py); none '
+								   'for an input that is already normalized')
+		self.add_file_arg('--stats',
+						  help='statistics of the input computed by feature_stats.py; by default, they are read from '
+							   'the cache next to the input, and computed if it is missing or stale')
+		self.add_file_arg('--store',
+						  help='binary store of the labeled rows built by feature_store.py; the labeled rows are then '
+							   'read from it instead of the input, which only provides the unlabeled rows')
+		self.add_passthru_arg('--store-chunk-size', type=int, default=100000,
+							  help='number of labeled rows of the store handled by one call of mapper_2')
+	
+	def load_args(self, args):
+		super(KNNMapReduce, self).load_args(args)
+		if self.options.k < 1:
+			self.arg_parser.error('--k must be at least 1')
+	
+	def run_job(self):
+		# a store built from another version of the input would hold the labeled rows of that version
+		stale = check_store(self.options.store, self.options.args) if self.options.store else None
+		if stale:
+			self.arg_parser.error('%s; rebuild it with feature_store.py' % stale)
+		# the statistics of the input are computed in a pass of their own before the job, unless they are already
+		# cached for this input
+		if self.options.scaling != 'none' and self.options.stats is None:
+			if not self.options.args or '-' in self.options.args:
+				self.arg_parser.error('--stats is required when the input is read from stdin')
+			rerun_with_args(self, ['--stats', cached_stats(self.options.args)])
+		# the unlabeled rows have to reach every mapper as a file; if none was given, we extract them from the input
+		# into a temporary file and run the job with it
+		elif self.options.queries is None:
+			run_with_query_file(self)
+		else:
+			super(KNNMapReduce, self).run_job()
+	
+	def load_query_blocks(self):
+		"""
+		Function that reads the query file and splits the queries into blocks.
+		:return: list of (start, stop) positions of the blocks
+		"""
+		self.query_rows = load_queries(self.options.queries)
+		return block_bounds(len(self.query_rows), self.options.query_block_size)
+	
+	def mapper_init_1(self):
+		"""
+		Reads the query file once, to know how many blocks of queries there are.
+		"""
+		self.num_blocks = len(self.load_query_blocks())
 	
 	def mapper_1(self, _, line):
 		"""
-		Mapper that takes each line of the file and returns a (species, [id, features]) pair
+		Mapper that takes each line of the file and returns a ([block, species], [id, features]) pair for each block
+		of queries, so that every block can be compared with the labeled data by a different mapper
 		:param _: None
 		:param line: the current line of the file
-		:return : (species, [id, feature])
+		:return : ([block, species], [id, feature])
 		"""
 		# since we read the data from a CSV, we split the line along the commas
 		aux = line.split(',')
-		# the first line contains the names of the columns, so we add a condition to ignore it
-		if aux[0].isnumeric():
-			yield aux[-1], aux[:-1]
+		# the first line contains the names of the columns, so we add a condition to ignore it; the unlabeled rows
+		# are ignored too, since they are read from the query file
+		if aux[0].isnumeric() and not is_query_row(aux):
+			for block in range(self.num_blocks):
+				yield [block, aux[-1]], aux[:-1]
 	
-	def reducer_1(self, species, features):
+	def reducer_1(self, block_species, features):
 		"""
-		Reducer that brings the [species, [id, features]) pairs together and that saves in the global
-		variable the values of the '' key, meaning of the unlabeled data.
-		:param species: if the data was labeled, the name of the species; if it was unlabeled, ''
+		Reducer that brings the ([block, species], [id, features]) pairs together.
+		:param block_species: the block of queries and the name of the species
 		:param features: the [id, features] values of each key
-		:return: (species, [id, features]) -- only for labeled data
+		:return: ([block, species], [[id, features]])
 		"""
-		# if the data is unlabeled, we save it in the global variable
-		if species == '':
-			KNNMapReduce.unlabeled_data = list(features)
-		# if it is labeled, we return a (species, [if, features]) pair
 		# the features input argument is a generator and cannot be yielded as such, so we transform it into a list
-		else:
-			yield species, list(features)
+		yield block_species, list(features)
+	
+	def mapper_store_1(self, _, line):
+		"""
+		Mapper used with --store, which ignores the lines of the file: the labeled rows are read from the store by
+		mapper_store_2 and the unlabeled ones from the query file.
+		:param _: None
+		:param line: the current line of the file
+		"""
+		return iter(())
+	
+	def mapper_final_store_1(self):
+		"""
+		Returns a ([block, chunk], None) pair for each block of queries and each chunk of the store; every mapper
+		returns all of them, and reducer_store_1 keeps one of each.
+		:return: ([block, chunk], None)
+		"""
+		num_chunks = len(FeatureStore(self.options.store).chunks(self.options.store_chunk_size))
+		for block in range(self.num_blocks):
+			for chunk in range(num_chunks):
+				yield [block, chunk], None
+	
+	def reducer_store_1(self, block_chunk, _):
+		"""
+		Reducer that keeps one ([block, chunk], None) pair of each key.
+		:param block_chunk: the block of queries and the chunk of the store
+		:param _: None values
+		:return: ([block, chunk], None)
+		"""
+		yield block_chunk, None
+	
+	def mapper_init_2(self):
+		"""
+		Reads the query file and converts the feature values of the unlabeled data to an array of scaled floats, once
+		for all the calls of mapper_2.
+		"""
+		self.query_blocks = self.load_query_blocks()
+		self.scaler = Scaler(self.options.stats, self.options.scaling)
+		self.unlabeled_ids, unlabeled_features = parse_features(self.query_rows)
+		self.unlabeled_features = self.scaler.transform(unlabeled_features)
+		if self.options.store:
+			self.store = FeatureStore(self.options.store)
+			self.store_chunks = self.store.chunks(self.options.store_chunk_size)
 	
-	def mapper_2(self, species, features):
+	def mapper_2(self, block_species, features):
 		"""
 		Mapper that takes the previous output, calculates the distance between the unlabeled data's
-		features' values and the labeled data's features' values; returns a (unlabeled_set_id, [distance, label]) pair
-		:param species: the label of the data, also the key of the previous output
-		:param features: the [id, features] value of each key (label)
-		:return: (unlabeled_set_id, [distance, label]) pair
+		features' values in one block and the labeled data's features' values; returns a
+		(unlabeled_set_id, [[distance, label]]) pair with the k labeled sets closest to each unlabeled set
+		:param block_species: the block of queries and the label of the data, also the key of the previous output
+		:param features: the [id, features] values of the labeled data
+		:return: (unlabeled_set_id, [[distance, label]]) pair
 		"""
-		# for each set of feature values in unlabeled_data, we calculate the distance between it and each
-		# labeled feature set; then, we return a (unlabeled_set_id, [distance, label]) pair
-		for el in KNNMapReduce.unlabeled_data:
-			for feature in features:
-				yield el[0], (self.euclidean_distance(el[1:], feature[1:]), species)
+		block, species = block_species
+		_, labeled_features = parse_features(features)
+		return self.k_nearest(block, species, labeled_features)
+	
+	def mapper_store_2(self, block_chunk, _):
+		"""
+		Mapper used with --store, which does the same as mapper_2 with a chunk of the labeled rows of the store; all
+		the rows of a chunk have the same label.
+		:param block_chunk: the block of queries and the chunk of the store, also the key of the previous output
+		:param _: None
+		:return: (unlabeled_set_id, [[distance, label]]) pair
+		"""
+		block, chunk = block_chunk
+		start, stop, species = self.store_chunks[chunk]
+		# the rows are read from the memory-mapped store, without any parsing; a float32 store is converted here
+		labeled_features = np.asarray(self.store.features[start:stop], dtype=np.float64)
+		return self.k_nearest(block, species, labeled_features)
+	
+	def k_nearest(self, block, species, labeled_features):
+		"""
+		Function that finds the k labeled sets closest to each unlabeled set of a block, among labeled sets with the
+		same label.
+		:param block: the block of queries
+		:param species: the label of the labeled sets
+		:param labeled_features: float array with the feature values of the labeled sets, not scaled yet
+		:return: generator of (unlabeled_set_id, [[distance, label]]) pairs
+		"""
+		start, stop = self.query_blocks[block]
+		
+		# with the brute backend, the distances between all the unlabeled feature sets of the block and the labeled
+		# feature sets are calculated at once with NumPy; with the kdtree backend, a KD-tree is built over the labeled
+		# feature sets and each unlabeled set only visits the nodes that can hold one of its nearest neighbours.
+		# Since only the k nearest labeled sets of each unlabeled set can end up in reducer_2's result, we only
+		# return those; the labeled feature values are scaled here, so the input never has to be rewritten
+		labeled_features = self.scaler.transform(labeled_features)
+		queries = self.unlabeled_features[start:stop]
+		if self.options.backend == 'kdtree':
+			neighbours = kdtree_neighbours(queries, labeled_features, self.options.k, self.options.leaf_size)
+		else:
+			neighbours = nearest_neighbours(queries, labeled_features, self.options.k)
+		for i, distances, _ in neighbours:
+			yield self.unlabeled_ids[start + i], [(float(distance), species) for distance in distances]
 	
 	def combiner_2(self, unlabeled_set_id, distances):
 		"""
-		Combiner that partially combines the (unlabeled_set_id, [distance, label]) pairs by key
+		Combiner that partially combines the (unlabeled_set_id, [[distance, label]]) pairs by key, keeping only the k
+		nearest candidates, so at most k candidates per unlabeled set leave each mapper
 		:param unlabeled_set_id: list of unlabeled sets' IDs, used as key
-		:param distances: generator of [distance, label] elements
+		:param distances: generator of lists of [distance, label] elements
 		:return: (unlabeled_set_id, [[distance, label]])
 		"""
-		# just like before, we need to convert the generator to a list
-		yield unlabeled_set_id, list(distances)
+		yield unlabeled_set_id, k_smallest(distances, self.options.k)
 	
 	def reducer_2(self, unlabeled_set_id, distances):
 		"""
-		Reducer that finishes combining the (unlabeled_set_id, [distance, label]) pairs by key and returns a list of
-		the closest 15 elements to each unlabeled_set_id key, together with their labels
+		Reducer that finishes combining the (unlabeled_set_id, [[distance, label]]) pairs by key and returns a list of
+		the closest k elements to each unlabeled_set_id key, together with their labels
 		:param unlabeled_set_id: list of unlabeled sets' IDs, used as key
-		:param distances: generator of [distance, label] elements
+		:param distances: generator of lists of [distance, label] elements
 		:return: (unlabeled_set_id, [[distance, label]]) pairs
 		"""
-		# the generator 'distances' is of form [list 1 from combiner, list 2 from combiner, ...], where "list n from
-		# combiner" is of shape (number_elements, 2); in other words, it is 3D-shaped and we need to make it 2D
-		list_d = [item for sublist in list(distances) for item in sublist]
-		
-		# the Python implicit sort function works as follows on matrices: it sorts the elements in increasing order
-		# based on the value of the first element, using the second element just to differentiate between elements
-		# that have the same first value; this works for us, since our elements are of [distance, label] form
-		list_d.sort()
-		
-		# we return only the first 15 elements of the sorted list, which correspond to the 15 nearest neighbours of
-		# each set of unlabeled values
-		yield unlabeled_set_id, list_d[:15]
+		# the generator 'distances' is of form [list 1 from combiner, list 2 from combiner, ...]; instead of
+		# flattening and sorting all the lists, we go through them with a heap that never holds more than k elements.
+		# Just like Python's sort, the heap compares the [distance, label] elements by distance first and by label
+		# for equal distances, so the result is the same as sorting everything and keeping the first k elements
+		yield unlabeled_set_id, k_smallest(distances, self.options.k)
 	
 	def mapper_3(self, unlabeled_set_id, distances):
 		"""
@@ -98,10 +237,10 @@ class KNNMapReduce(MRJob):
 		"""
 		Reducer that returns the most common label for each unlabeled_set_id.
 		:param unlabeled_set_id: the id of the unlabeled feature set, used as key
-		:param species: generator with all the 15 species nearest to the unlabeled_set_id
+		:param species: generator with all the k species nearest to the unlabeled_set_id
 		:return: (unlabeled_set_id, predicted_label)
 		"""
-		# because we know the generator has only 15 elements, it makes no sense to use MapReduce to count the number
+		# because we know the generator has only k elements, it makes no sense to use MapReduce to count the number
 		# of occurrences of each element; instead, we use the implicit collections.Counter function and its attribute
 		# most_common
 		# Because Counter(species).most_common(1)[0][0] outputs [[most common label, number of occurrences]], we return
@@ -109,10 +248,21 @@ class KNNMapReduce(MRJob):
 		yield unlabeled_set_id, Counter(species).most_common(1)[0][0]
 	
 	def steps(self):
+		# with a store, the labeled rows are not passed between the steps: the first step only produces the pairs of
+		# blocks of queries and chunks of the store
+		if self.options.store:
+			step_1 = MRStep(mapper_init=self.mapper_init_1,
+							mapper=self.mapper_store_1,
+							mapper_final=self.mapper_final_store_1,
+							reducer=self.reducer_store_1)
+		else:
+			step_1 = MRStep(mapper_init=self.mapper_init_1,
+							mapper=self.mapper_1,
+							reducer=self.reducer_1)
 		return [
-			MRStep(mapper=self.mapper_1,
-				   reducer=self.reducer_1),
-			MRStep(mapper=self.mapper_2,
+			step_1,
+			MRStep(mapper_init=self.mapper_init_2,
+				   mapper=self.mapper_store_2 if self.options.store else self.mapper_2,
 				   combiner=self.combiner_2,
 				   reducer=self.reducer_2),
 			MRStep(mapper=self.mapper_3,
@@ -142,19 +292,16 @@ class KNNMapReduce(MRJob):
 
 
 if __name__ == '__main__':
-	start = time.time()
-	
-	# we read the CSV file into a pandas DataFrame, using the already existing IDs as DataFrame IDs
-	data = pd.read_csv('Iris.csv', index_col=0)
+	# the local and Hadoop runners run this script again for every task; only the job itself should run there
+	if is_task_process():
+		KNNMapReduce.run()
+		sys.exit()
 	
-	# we normalize the feature values using the formula
-	# x_norm = x / |x_max|
-	for col in data.columns[:-1]:
-		data[col] = data[col] / data[col].abs().max()
-	
-	# we write the newly normalized data back into the CSV file, since we will use it as input for the MapReduce
-	data.to_csv('Iris_normalized.csv')
+	start = time.time()
 	
+	# the feature values are normalized with the formula x_norm = x / |x_max| by the mappers, e.g. with
+	# python task_3_simplified.py Iris.csv --scaling max-abs; the statistics of the input are computed on the first
+	# run and cached in Iris.csv.stats.json
 	KNNMapReduce.run()
 	end = time.time()
 	print('execution time: ', end - start)
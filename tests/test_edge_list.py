@@ -0,0 +1,16 @@
+import pytest
+
+from edge_list import parse_edges
+
+
+def test_parse_edges():
+	sources, targets = parse_edges(b'# comment\n1\t2\r\n3 4\n\n#5 6\n')
+	assert sources.tolist() == [1, 3]
+	assert targets.tolist() == [2, 4]
+	assert len(parse_edges(b'# only a comment\n\n')[0]) == 0
+
+
+@pytest.mark.parametrize('chunk', [b'1\t2\n3\tx\n5\t6\n', b'1\t2\n3\t4a\n', b'1.5\t2\n', b'1\t2\n3\n'])
+def test_parse_edges_malformed(chunk):
+	with pytest.raises(ValueError):
+		parse_edges(chunk)
@@ -0,0 +1,57 @@
+import os
+import shutil
+
+import token_cache
+from feature_store import build_store, check_store
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build(tmp_path):
+	csv_path = str(tmp_path / 'input.csv')
+	shutil.copy(os.path.join(ROOT, 'Iris_normalized.csv'), csv_path)
+	store_path = str(tmp_path / 'input.knn')
+	build_store(csv_path, store_path)
+	return csv_path, store_path
+
+
+def counted_hashes(monkeypatch):
+	calls = []
+
+	def file_hash(paths):
+		calls.append(paths)
+		return hash_file(paths)
+
+	hash_file = token_cache.file_hash
+	monkeypatch.setattr(token_cache, 'file_hash', file_hash)
+	return calls
+
+
+def test_unchanged_input_is_not_hashed(tmp_path, monkeypatch):
+	csv_path, store_path = build(tmp_path)
+	calls = counted_hashes(monkeypatch)
+	assert check_store(store_path, [csv_path]) is None
+	assert calls == []
+
+	# a new modification time alone does not make the store stale, but the file is then hashed
+	stat = os.stat(csv_path)
+	os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+	assert check_store(store_path, [csv_path]) is None
+	assert calls == [[csv_path]]
+
+
+def test_changed_input_is_rejected(tmp_path):
+	csv_path, store_path = build(tmp_path)
+	with open(csv_path, 'a') as f:
+		f.write('1000,0.1,0.2,0.3,0.4,Iris-setosa\n')
+	assert 'older version' in check_store(store_path, [csv_path])
+
+
+def test_other_input_is_rejected(tmp_path):
+	csv_path, store_path = build(tmp_path)
+	other_path = str(tmp_path / 'other.csv')
+	shutil.copy(csv_path, other_path)
+	for input_paths in [[other_path], ['-'], [csv_path, other_path]]:
+		assert 'not from the input of the job' in check_store(store_path, input_paths)
+	# a relative path to the same file is its source
+	assert check_store(store_path, [os.path.relpath(csv_path)]) is None
@@ -0,0 +1,64 @@
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+from hot_keys import SortedSpill, chunks, sample_hot_keys, sub_partition
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize('spill_values', [1, 7, 1000])
+def test_sorted_spill_sorts_the_unsorted_parts(spill_values):
+	random.seed(spill_values)
+	parts = [[random.randrange(100) for _ in range(random.randrange(10))] for _ in range(30)]
+	with SortedSpill(spill_values) as values:
+		for part in parts:
+			values.extend(part)
+		merged = [value for chunk in chunks(values, 4) for value in chunk]
+	assert merged == sorted(value for part in parts for value in part)
+
+
+def write_graph(path):
+	random.seed(1)
+	with open(path, 'w') as out:
+		out.write('# a graph where pages 7 and 11 have many in-links\n')
+		for _ in range(20000):
+			to_id = random.choice([7, 7, 7, 11, random.randrange(500), random.randrange(500)])
+			out.write('%d\t%d\n' % (random.randrange(100000), to_id))
+
+
+def test_hot_keys_are_split_into_ranges(tmp_path):
+	graph_path = str(tmp_path / 'graph.txt')
+	write_graph(graph_path)
+	size = os.path.getsize(graph_path)
+	hot_keys = sample_hot_keys([(graph_path, 0, size)], 1000, sample_bytes=size)
+	assert set(hot_keys) == {7, 11}
+
+	with open(graph_path) as f:
+		edges = [tuple(map(int, line.split())) for line in f if not line.startswith('#')]
+	sizes = {}
+	for from_id, to_id in edges:
+		if to_id == 7:
+			partition = sub_partition(hot_keys[7], from_id)
+			sizes[partition] = sizes.get(partition, 0) + 1
+	# the sub-partitions have about --hot-threshold in-links each
+	assert len(sizes) == len(hot_keys[7]) + 1 > 1
+	assert max(sizes.values()) <= 1100
+
+
+def test_hot_keys_write_the_same_graph(tmp_path):
+	graph_path = str(tmp_path / 'graph.txt')
+	write_graph(graph_path)
+
+	def run(args, csr_path):
+		subprocess.run([sys.executable, 'task2.py', '-r', 'local', '--no-conf', '-q', '--csr', str(csr_path)] + args,
+					   cwd=ROOT, check=True, capture_output=True)
+		return csr_path.read_bytes()
+
+	classic = run([graph_path], tmp_path / 'classic.csr')
+	hot_args = ['--hot-threshold', '500', '--split-bytes', '20000', '--spill-values', '100']
+	assert run(hot_args + [graph_path], tmp_path / 'lines.csr') == classic
+	assert run(hot_args + ['--edges', graph_path], tmp_path / 'edges.csr') == classic
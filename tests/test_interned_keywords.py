@@ -0,0 +1,28 @@
+import title_processing
+from task1 import MovieGenreKeywords
+
+MOVIES = 'movies_mini.csv'
+
+
+def fake_process_titles(titles, remove_words=None):
+	# the words of the title without the year, so the test does not need the NLTK data
+	return [' '.join(title[:title.find('(')].split()) for title in titles]
+
+
+def run_job(args):
+	job = MovieGenreKeywords(args + ['-r', 'inline', '--no-conf', MOVIES])
+	with job.make_runner() as runner:
+		runner.run()
+		return list(job.parse_output(runner.cat_output()))
+
+
+def test_interned_steps_match_classic_steps(monkeypatch, tmp_path):
+	monkeypatch.setattr(title_processing, 'process_titles', fake_process_titles)
+	classic = run_job([])
+
+	# a vocabulary with only some of the words, so the words missing from it go through the shuffle as themselves
+	words = sorted({word for _, keywords in classic for word in keywords})
+	vocab_path = tmp_path / 'vocab.txt'
+	vocab_path.write_text(''.join(word + '\n' for word in words[::2]), encoding='utf-8')
+
+	assert run_job(['--vocab', str(vocab_path)]) == classic
@@ -0,0 +1,49 @@
+import math
+
+import numpy as np
+import pytest
+
+from matrix_stats import MatrixStats
+from matrix_store import write_block_file
+
+
+def run_job(npy_path, block_rows):
+	block_path = str(npy_path) + '.blocks'
+	write_block_file(str(npy_path), block_path, block_rows)
+	job = MatrixStats(['-r', 'inline', '--no-conf', '--matrix', str(npy_path), block_path])
+	with job.make_runner() as runner:
+		runner.run()
+		return dict(job.parse_output(runner.cat_output()))
+
+
+@pytest.mark.parametrize('block_rows', [1, 3])
+def test_non_finite_elements(tmp_path, block_rows):
+	matrix = np.arange(12, dtype=np.float64).reshape(4, 3)
+	matrix[1, 1] = np.nan
+	matrix[2, 0] = np.inf
+	matrix[3, 2] = -np.inf
+	npy_path = tmp_path / 'matrix.npy'
+	np.save(str(npy_path), matrix)
+
+	stats = run_job(npy_path, block_rows)
+	assert stats['nan_count'] == 1
+	assert stats['inf_count'] == 2
+	assert all(math.isnan(stats[metric]) for metric in ['frobenius', 'max_abs', 'one_norm', 'inf_norm'])
+	assert stats['row_sums'][0] == 3.0 and math.isnan(stats['row_sums'][1])
+	assert stats['row_sums'][2:] == [math.inf, -math.inf]
+	assert stats['col_sums'][0] == math.inf and math.isnan(stats['col_sums'][1]) and stats['col_sums'][2] == -math.inf
+
+
+def test_infinite_elements(tmp_path):
+	matrix = np.ones((4, 3))
+	matrix[0, 0] = np.inf
+	matrix[3, 0] = -np.inf
+	npy_path = tmp_path / 'matrix.npy'
+	np.save(str(npy_path), matrix)
+
+	stats = run_job(npy_path, 2)
+	assert stats['frobenius'] == math.inf
+	assert stats['max_abs'] == math.inf
+	# inf + -inf in the first column
+	assert math.isnan(stats['col_sums'][0]) and stats['col_sums'][1:] == [4.0, 4.0]
+	assert stats['nan_count'] == 0 and stats['inf_count'] == 2
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from mrjob.job import MRJob
+
+import parallel_engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NUM_CORES = 3
+
+
+def run_local(job, args, output_dir):
+	# the output of mrjob, read in the order of the names of its files
+	subprocess.run([sys.executable, '-c', 'from shared_scan import load_job_class; load_job_class(%r).run()' % job,
+					'-r', 'local', '--no-conf', '--num-cores', str(NUM_CORES), '--output-dir', str(output_dir),
+					'--no-output', '-q'] + args, cwd=ROOT, check=True, capture_output=True)
+	return b''.join((output_dir / name).read_bytes() for name in sorted(os.listdir(output_dir))
+					if name.startswith('part-'))
+
+
+def run_engine(job, args):
+	return subprocess.run([sys.executable, 'parallel_engine.py', job, '--num-cores', str(NUM_CORES), '--', '-q'] + args,
+						  cwd=ROOT, check=True, capture_output=True).stdout
+
+
+@pytest.mark.parametrize('job, args', [
+	('task2.InvertWebLink', ['web-Google_mini.txt']),
+	('task2.InvertWebLink', ['web-Google_mini.txt', '--hot-threshold', '3', '--split-bytes', '2000',
+							 '--sample-bytes', '1000']),
+	('task4.FrobeniusNormIndex', ['A_mini.txt']),
+	('task4.FrobeniusNormNoIndex', ['A_mini.txt']),
+	('task3.KNNMapReduce', ['Iris.csv']),
+])
+def test_output_is_the_output_of_the_local_runner(job, args, tmp_path):
+	expected = run_local(job, args, tmp_path / 'output')
+	assert expected
+	assert run_engine(job, args) == expected
+
+
+class FailingReducer(MRJob):
+
+	def mapper(self, _, line):
+		yield line.split('\t')[0], 1
+
+	def reducer(self, key, values):
+		if key == '1':
+			raise ValueError('failed reducer')
+		yield key, sum(values)
+
+
+@pytest.mark.skipif(not os.path.isdir('/dev/shm'), reason='needs the shared-memory blocks in /dev/shm')
+def test_blocks_are_freed_when_a_task_fails():
+	blocks = set(os.listdir('/dev/shm'))
+	with pytest.raises(ValueError, match='failed reducer'):
+		parallel_engine.run_parallel(FailingReducer, [os.path.join(ROOT, 'web-Google_mini.txt')], NUM_CORES)
+	assert set(os.listdir('/dev/shm')) <= blocks
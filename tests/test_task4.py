@@ -0,0 +1,56 @@
+import glob
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MATRIX = 'A_mini.txt'
+
+
+def run_script(args):
+	return subprocess.run([sys.executable, 'task4.py'] + args, cwd=ROOT, check=True, capture_output=True,
+						  text=True).stdout
+
+
+def norms(output):
+	# the output of each job is the line after its name
+	lines = output.splitlines()
+	return [float(lines[lines.index(name) + 1].split('\t')[1])
+			for name in ['FrobeniusNormIndex', 'FrobeniusNormNoIndex']]
+
+
+def test_script_accepts_block_bytes():
+	default = norms(run_script([MATRIX]))
+	# the blocks change the order of the sums
+	assert norms(run_script([MATRIX, '--block-bytes', '1000'])) == pytest.approx(default)
+
+
+def step_outputs(job, runner, tmp_dir):
+	# the output of the mappers and of the reducers of every step, kept with --cleanup NONE
+	subprocess.run([sys.executable, '-c', 'from shared_scan import load_job_class; load_job_class(%r).run()' % job,
+					'-r', runner, '--no-conf', '--num-cores', '2', '--cleanup', 'NONE', '--local-tmp-dir',
+					str(tmp_dir), '--block-bytes', '1000', '--no-output', '-q', MATRIX],
+				   cwd=ROOT, check=True, capture_output=True)
+	job_dir, = glob.glob(os.path.join(str(tmp_dir), '*'))
+	outputs = {}
+	for pattern in ['step/*/mapper/*/output', 'step-output/*/part-*', 'output/part-*']:
+		for path in glob.glob(os.path.join(job_dir, pattern)):
+			# e.g. step/000, the output of the mappers of the first step
+			step = '/'.join(os.path.relpath(path, job_dir).split(os.sep)[:2])
+			with open(path) as f:
+				outputs.setdefault(step, []).extend(f.read().splitlines())
+	return {step: sorted(lines) for step, lines in outputs.items()}
+
+
+@pytest.mark.parametrize('job', ['task4.FrobeniusNormIndex', 'task4.FrobeniusNormNoIndex'])
+def test_local_tasks_run_their_own_job(job, tmp_path):
+	# the tasks of -r local run task4.py, the inline runner runs the job class itself
+	expected = step_outputs(job, 'inline', tmp_path / 'inline')
+	assert step_outputs(job, 'local', tmp_path / 'local') == expected
+	keys = {line.split('\t')[0] for line in expected['step/000']}
+	if job.endswith('NoIndex'):
+		assert keys == {'null'}
+	else:
+		assert 'null' not in keys and len(keys) > 1
@@ -0,0 +1,51 @@
+import title_processing
+from task1 import MovieGenreKeywords
+from title_processing import TitleProcessor
+
+
+class RecordingPool:
+	"""
+	Stand-in for multiprocessing.Pool that runs the chunks in this process and records them.
+	"""
+
+	def __init__(self):
+		self.chunks = []
+
+	def starmap(self, function, args):
+		self.chunks.extend(chunk for chunk, _ in args)
+		return [function(*arg) for arg in args]
+
+
+def fake_process_titles(titles, remove_words=None):
+	return [title.upper() for title in titles]
+
+
+def test_pool_gets_one_chunk_per_process(monkeypatch):
+	monkeypatch.setattr(title_processing, 'process_titles', fake_process_titles)
+	processor = TitleProcessor(batch_size=4, processes=2)
+	processor.pool = pool = RecordingPool()
+
+	titles = ['title %d' % i for i in range(4)]
+	assert processor.process_batch(titles) == [title.upper() for title in titles]
+	assert pool.chunks == [titles[:2], titles[2:]]
+
+
+def test_single_process_does_not_use_pool(monkeypatch):
+	monkeypatch.setattr(title_processing, 'process_titles', fake_process_titles)
+	processor = TitleProcessor(batch_size=4, processes=1)
+	assert processor.process_batch(['a', 'b', 'c']) == ['A', 'B', 'C']
+	assert processor.pool is None
+
+
+def test_mapper_buffers_a_batch_per_process(monkeypatch):
+	monkeypatch.setattr(title_processing, 'process_titles', fake_process_titles)
+	job = MovieGenreKeywords(['--tagging-batch-size', '2', '--tagging-processes', '2'])
+	job.mapper_init_1()
+	job.title_processor.pool = pool = RecordingPool()
+
+	lines = ['%d,Movie %d (2000),Drama' % (i, i) for i in range(4)]
+	assert [pair for line in lines[:3] for pair in job.mapper_1(None, line)] == []
+	assert pool.chunks == []
+	assert len(list(job.mapper_1(None, lines[3]))) == 4
+	# nothing is tagged before a batch per process is buffered
+	assert pool.chunks == [['movie %d (2000)' % i for i in range(2)], ['movie %d (2000)' % i for i in range(2, 4)]]
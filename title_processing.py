@@ -0,0 +1,164 @@
+from collections import OrderedDict
+from multiprocessing import Pool
+
+import nltk_resources
+
+# list of undesirable parts of speech (adposition, adverb, conjunction, determiner/article, particle,
+# punctuation marks, other); more info at https://www.nltk.org/book/ch05.html
+REMOVE_POS = ['ADP', 'ADV', 'CONJ', 'DET', 'PRT', '.', 'NUM', 'X']
+# list of words that have appeared in practice in the final top 10 keywords and which shouldn't be keywords;
+# the tagger fails to identify them as undesirable parts of speech (e.g. 'ii' is considered a noun)
+REMOVE_WORDS = ['a.k.a', '*', 'ii', 'iii']
+
+
+def parse_movie_line(line):
+	"""
+	Function that splits a line of movies.csv into its id, title and genres.
+	:param line: the line of the file that is being read
+	:return: (movie_id, title, [genres]); the header line is returned with an empty list of genres
+	"""
+	# first, I eliminate all possible trailing empty spaces and convert the text to lowercase
+	line = line.strip().lower()
+	movie_id = line.split(',')[0]
+
+	# the titles are written in the file in two ways: [id, title, genres] or [id, "title", genres]; the "title"
+	# may include commas and quotations marks inside it, so it needs a different delimiter
+	if line.find('"') > -1:
+		# I use ',"' to separate the index from the rest of the line and '",' to separate the title and the genre
+		aux = line.split(',"')[1]
+		[title, genres] = aux.split('",')
+	else:
+		words = line.split(',')
+		title = words[1]
+		genres = words[2]
+
+	# the first line of the input file contains the names of the columns, so its only "genre" is 'genres'
+	genres = [genre for genre in genres.split('|') if genre != 'genres']
+	return movie_id, title, genres
+
+
+def tokenize_title(title):
+	"""
+	Function that removes the production year from a title and splits it into tokens.
+	:param title: the original title
+	:return: list of tokens
+	"""
+	#  since all the titles end with the year they were produced in, I eliminate the year
+	return nltk_resources.word_tokenize(title[:title.find('(')])
+
+
+def filter_tagged(tagged, remove_words=REMOVE_WORDS):
+	"""
+	Function that keeps only the desirable words of a tagged title and joins them with spaces.
+	:param tagged: list of (word, part_of_speech) pairs
+	:param remove_words: words that are never keywords, whatever their part of speech
+	:return: the processed title
+	"""
+	return ' '.join(word for word, pos in tagged if pos not in REMOVE_POS and word not in remove_words)
+
+
+def process_titles(titles, remove_words=REMOVE_WORDS):
+	"""
+	Function that tokenises, tags and filters a batch of titles with a single call to the tagger.
+	:param titles: list of original titles
+	:param remove_words: words that are never keywords, whatever their part of speech
+	:return: list of processed titles, in the same order
+	"""
+	tagged = nltk_resources.pos_tag_sents([tokenize_title(title) for title in titles])
+	return [filter_tagged(sentence, remove_words) for sentence in tagged]
+
+
+class TitleProcessor:
+	"""
+	Tags each distinct title once: results are kept in a bounded LRU cache, the titles that are not cached are
+	tagged in batches and the batches can be spread across a process pool.
+	"""
+
+	def __init__(self, remove_words=REMOVE_WORDS, cache_size=10000, batch_size=256, processes=1):
+		"""
+		:param remove_words: words that are never keywords, whatever their part of speech
+		:param cache_size: maximum number of processed titles kept in memory
+		:param batch_size: number of titles sent to the tagger in one call
+		:param processes: number of worker processes used for tagging; 1 tags in the current process
+		"""
+		self.remove_words = remove_words
+		self.cache_size = cache_size
+		self.batch_size = batch_size
+		self.processes = processes
+		self.cache = OrderedDict()
+		self.pool = None
+
+	def process(self, title):
+		"""
+		Function that returns the processed version of one title.
+		:param title: the original title
+		:return: the processed title
+		"""
+		return self.process_batch([title])[0]
+
+	def process_batch(self, titles):
+		"""
+		Function that returns the processed versions of a list of titles; only the titles missing from the cache
+		are tagged, and each of them only once.
+		:param titles: list of original titles
+		:return: list of processed titles, in the same order
+		"""
+		# the cache may be smaller than the batch, so the results of this batch are also kept aside
+		results = {}
+		missing = []
+		for title in titles:
+			if title in results:
+				continue
+			if title in self.cache:
+				self.cache.move_to_end(title)
+				results[title] = self.cache[title]
+			else:
+				results[title] = None
+				missing.append(title)
+
+		if missing:
+			for title, processed in zip(missing, self.tag(missing)):
+				results[title] = processed
+				self.remember(title, processed)
+
+		return [results[title] for title in titles]
+
+	def tag(self, titles):
+		"""
+		Function that tags a list of titles, in chunks of at most batch_size titles; with several processes, the titles
+		are split into at least one chunk per process.
+		:param titles: list of original titles, none of them cached
+		:return: list of processed titles, in the same order
+		"""
+		chunk_size = max(1, min(self.batch_size, -(-len(titles) // max(1, self.processes))))
+		chunks = [titles[i:i + chunk_size] for i in range(0, len(titles), chunk_size)]
+
+		if self.processes > 1 and len(chunks) > 1:
+			if self.pool is None:
+				self.pool = Pool(self.processes)
+			processed = self.pool.starmap(process_titles, [(chunk, self.remove_words) for chunk in chunks])
+		else:
+			processed = [process_titles(chunk, self.remove_words) for chunk in chunks]
+
+		return [title for chunk in processed for title in chunk]
+
+	def remember(self, title, processed):
+		"""
+		Function that adds a processed title to the cache, evicting the least recently used one if it is full.
+		:param title: the original title
+		:param processed: the processed title
+		"""
+		if self.cache_size <= 0:
+			return
+		self.cache[title] = processed
+		if len(self.cache) > self.cache_size:
+			self.cache.popitem(last=False)
+
+	def close(self):
+		"""
+		Function that shuts down the process pool, if one was started.
+		"""
+		if self.pool is not None:
+			self.pool.close()
+			self.pool.join()
+			self.pool = None
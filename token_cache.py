@@ -0,0 +1,144 @@
+"""
+On-disk cache of the processed movie titles, so that a run over an unchanged movies.csv does not need NLTK at all.
+
+The cache is a gzipped, tab-separated file. Its first line records the SHA-256 of the input it was built from and
+every other line holds (movieId, checksum of the original line, genres, keyword tokens). The checksum lets the jobs
+trust a cached row only if the line it was built from is still the same, so a cache built for an older version of
+the catalog can still be used for the rows that did not change.
+
+Usage: python token_cache.py movies.csv [cache_path]
+"""
+import gzip
+import hashlib
+import sys
+import zlib
+
+from title_processing import TitleProcessor, parse_movie_line
+
+HEADER_PREFIX = '#sha256:'
+
+
+def default_cache_path(input_path):
+	"""
+	Function that returns the path the cache of an input file is stored at by default.
+	:param input_path: path of the movies file
+	:return: path of the cache file
+	"""
+	return input_path + '.tokens.gz'
+
+
+def file_hash(paths):
+	"""
+	Function that computes the SHA-256 of the contents of one or more files, read in order.
+	:param paths: list of file paths
+	:return: the hexadecimal digest
+	"""
+	digest = hashlib.sha256()
+	for path in paths:
+		with open(path, 'rb') as f:
+			for chunk in iter(lambda: f.read(1 << 20), b''):
+				digest.update(chunk)
+	return digest.hexdigest()
+
+
+def line_checksum(line):
+	"""
+	Function that computes the checksum stored next to each cached row.
+	:param line: the original line of the movies file, without the trailing newline
+	:return: the CRC-32 of the line, as an integer
+	"""
+	return zlib.crc32(line.encode('utf-8'))
+
+
+def build_token_cache(input_path, cache_path=None, processor=None):
+	"""
+	Function that tags every title of a movies file once and writes the result to a token cache.
+	:param input_path: path of the movies file
+	:param cache_path: path of the cache file; by default, the input path followed by '.tokens.gz'
+	:param processor: the TitleProcessor used for tagging
+	:return: the path of the cache file
+	"""
+	cache_path = cache_path or default_cache_path(input_path)
+	processor = processor or TitleProcessor()
+
+	rows = []
+	with open(input_path, encoding='utf-8') as f:
+		for line in f:
+			line = line.rstrip('\r\n')
+			movie_id, title, genres = parse_movie_line(line)
+			# the header line has no genres and is not cached
+			if genres:
+				rows.append((movie_id, line_checksum(line), title, genres))
+
+	processed = processor.process_batch([title for _, _, title, _ in rows])
+	processor.close()
+
+	with gzip.open(cache_path, 'wt', encoding='utf-8') as out:
+		out.write(HEADER_PREFIX + file_hash([input_path]) + '\n')
+		for (movie_id, checksum, _, genres), partial_title in zip(rows, processed):
+			out.write('%s\t%d\t%s\t%s\n' % (movie_id, checksum, '|'.join(genres), partial_title))
+
+	return cache_path
+
+
+def read_cache_hash(cache_path):
+	"""
+	Function that returns the hash of the input a cache was built from.
+	:param cache_path: path of the cache file
+	:return: the hexadecimal digest, or None if the file is missing or is not a token cache
+	"""
+	try:
+		with gzip.open(cache_path, 'rt', encoding='utf-8') as f:
+			header = f.readline().rstrip('\n')
+	except (OSError, EOFError):
+		return None
+	if not header.startswith(HEADER_PREFIX):
+		return None
+	return header[len(HEADER_PREFIX):]
+
+
+def is_cache_valid(cache_path, input_paths):
+	"""
+	Function that checks whether a cache was built from exactly the given input.
+	:param cache_path: path of the cache file
+	:param input_paths: list of paths of the movies files
+	:return: True if the recorded hash matches the input, False otherwise
+	"""
+	cache_hash = read_cache_hash(cache_path)
+	return cache_hash is not None and cache_hash == file_hash(input_paths)
+
+
+def load_token_cache(cache_path):
+	"""
+	Function that loads the rows of a cache into memory.
+	:param cache_path: path of the cache file
+	:return: dictionary of {movie_id: (checksum, [genres], partial_title)}; empty if the cache cannot be read
+	"""
+	entries = {}
+	if read_cache_hash(cache_path) is None:
+		return entries
+
+	with gzip.open(cache_path, 'rt', encoding='utf-8') as f:
+		next(f)
+		for row in f:
+			movie_id, checksum, genres, partial_title = row.rstrip('\n').split('\t')
+			entries[movie_id] = (int(checksum), genres.split('|'), partial_title)
+
+	return entries
+
+
+def cached_movie(entries, line):
+	"""
+	Function that looks up a line of the movies file in a loaded cache.
+	:param entries: dictionary returned by load_token_cache
+	:param line: the original line of the movies file, without the trailing newline
+	:return: ([genres], partial_title), or None if the line is not cached or has changed since it was cached
+	"""
+	entry = entries.get(line[:line.find(',')].strip().lower())
+	if entry is None or entry[0] != line_checksum(line):
+		return None
+	return entry[1], entry[2]
+
+
+if __name__ == '__main__':
+	print(build_token_cache(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None))
@@ -0,0 +1,73 @@
+"""
+Vocabulary interning for the movie keyword jobs: every keyword gets an integer id, so the steps of
+MovieGenreKeywords can exchange short lists of numbers instead of JSON-encoded words.
+
+A vocabulary file has one word per line and the line number is the id of the word; the most frequent words get
+the smallest ids, so they are also the shortest to write. The vocab.txt of a keyword index (see keyword_index.py)
+has the same format and can be used directly.
+
+Usage: python vocabulary.py movies.csv.tokens.gz vocab.txt
+"""
+import gzip
+import sys
+
+
+def build_vocabulary(cache_path, vocab_path):
+	"""
+	Function that writes the vocabulary of the titles stored in a token cache (see token_cache.py); each word is
+	weighted by the number of genres of the movie, which is how often it goes through the shuffle.
+	:param cache_path: path of the token cache
+	:param vocab_path: path of the vocabulary file
+	:return: the list of words, in id order
+	"""
+	totals = {}
+	with gzip.open(cache_path, 'rt', encoding='utf-8') as f:
+		# the first line is the hash of the input
+		next(f)
+		for row in f:
+			_, _, genres, partial_title = row.rstrip('\n').split('\t')
+			weight = genres.count('|') + 1
+			for word in partial_title.split(' '):
+				if word != '':
+					totals[word] = totals.get(word, 0) + weight
+
+	vocab = sorted(totals, key=lambda word: (-totals[word], word))
+	with open(vocab_path, 'w', encoding='utf-8') as f:
+		f.write(''.join(word + '\n' for word in vocab))
+	return vocab
+
+
+def load_vocabulary(vocab_path):
+	"""
+	Function that reads a vocabulary file.
+	:param vocab_path: path of the vocabulary file
+	:return: list of words, in id order
+	"""
+	with open(vocab_path, encoding='utf-8') as f:
+		return f.read().split('\n')[:-1]
+
+
+class InternedProtocol(object):
+	"""
+	Protocol for (string, list of interned words) pairs. The key is written as raw UTF-8 and the value as the ids
+	separated by spaces, e.g. 'drama\\t4 17 250'. Words missing from the vocabulary (e.g. from movies added after it
+	was built) are written as themselves, prefixed with '=', so they never get mistaken for an id.
+
+	A struct-packed value could contain newline bytes, which the line-based shuffle of mrjob cannot carry without
+	escaping; since the frequent words have small ids, the decimal form is also the shorter one.
+	"""
+
+	def read(self, line):
+		raw_key, raw_value = line.split(b'\t', 1)
+		if not raw_value:
+			return raw_key.decode('utf_8'), []
+		return raw_key.decode('utf_8'), [int(item) if item[:1] != b'=' else item[1:].decode('utf_8')
+										 for item in raw_value.split(b' ')]
+
+	def write(self, key, value):
+		return key.encode('utf_8') + b'\t' + ' '.join(
+			str(item) if isinstance(item, int) else '=' + item for item in value).encode('utf_8')
+
+
+if __name__ == '__main__':
+	print(len(build_vocabulary(sys.argv[1], sys.argv[2])))